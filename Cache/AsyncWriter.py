@@ -0,0 +1,62 @@
+import threading, queue, atexit
+
+# how many results may be waiting to be written before save starts blocking
+DEFAULT_WRITE_QUEUE_SIZE = 4
+
+class AsyncWriter:
+
+    # Writes results to the cache on a background thread so that a process
+    # can move on to its next task while the last result is serialized and
+    # written out. The queue is bounded, so a process that produces results
+    # faster than they can be written will eventually wait on the writer
+    # instead of holding an unbounded number of results in memory.
+
+    # write is called with whatever was submitted, cache.write by default
+    def __init__(self, cache, queue_size=DEFAULT_WRITE_QUEUE_SIZE, write=None, name="blk-cache-writer"):
+
+        self.cache = cache
+        self.write = write if write is not None else cache.write
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # the first error raised while writing, reported by the next flush
+        self.error = None
+
+        self.thread = threading.Thread(target=self.work, name=name, daemon=True)
+        self.thread.start()
+
+        # make sure nothing is lost when the interpreter shuts down
+        atexit.register(self.flush)
+
+    def submit(self, hashcode, *args):
+        self.queue.put((hashcode, args))
+
+    # calls callback on the writer thread once everything submitted before it
+    # has been written
+    def after(self, callback):
+        self.queue.put((None, callback))
+
+    def work(self):
+
+        while True:
+            hashcode, args = self.queue.get()
+            try:
+                if hashcode is None:
+                    args()
+                else:
+                    self.write(hashcode, *args)
+            except Exception as e:
+                print(f"[Error] Failed to write result {hashcode} to the cache: {e}")
+                self.cache.discardPending(hashcode)
+                if self.error is None:
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    # blocks until every submitted result has been written
+    def flush(self):
+
+        self.queue.join()
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
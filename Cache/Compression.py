@@ -0,0 +1,113 @@
+import io, zlib, lzma, bz2
+
+from blk.constants import COMPRESSION_OPTIONS, NO_COMPRESSION, ZLIB, LZMA, BZ2
+
+# data is fed through the codecs in pieces of this size, so compressing or
+# decompressing a result never needs a second copy of the whole thing
+STREAM_CHUNK_SIZE = 1024**2
+
+def checkCompression(compression):
+    if compression not in COMPRESSION_OPTIONS:
+        print(f"[Error] Unknown compression: {compression}. Options are: {', '.join(COMPRESSION_OPTIONS)}")
+        raise ValueError(compression)
+
+def createCompressor(compression, level=None):
+
+    if compression == ZLIB:
+        return zlib.compressobj(level if level is not None else zlib.Z_DEFAULT_COMPRESSION)
+    elif compression == LZMA:
+        return lzma.LZMACompressor(preset=level)
+    elif compression == BZ2:
+        return bz2.BZ2Compressor(level if level is not None else 9)
+
+    checkCompression(compression)
+
+def createDecompressor(compression):
+
+    if compression == ZLIB:
+        return ZlibDecompressor()
+    elif compression == LZMA:
+        return lzma.LZMADecompressor()
+    elif compression == BZ2:
+        return bz2.BZ2Decompressor()
+
+    checkCompression(compression)
+
+
+class ZlibDecompressor:
+
+    # gives zlib's decompressor the same interface as the lzma and bz2 ones
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj()
+        self.needs_input = True
+        self.eof = False
+
+    def decompress(self, data, max_length=-1):
+
+        data = self.decompressor.unconsumed_tail + data
+        out = self.decompressor.decompress(data, max(max_length, 0))
+
+        self.needs_input = len(self.decompressor.unconsumed_tail) == 0
+        self.eof = self.decompressor.eof
+        return out
+
+
+class CompressedWriter:
+
+    # Compresses everything written to it on its way to f. Call finish once
+    # everything has been written.
+
+    def __init__(self, f, compression, level=None):
+        self.f = f
+        self.compressor = createCompressor(compression, level)
+
+    def write(self, data):
+
+        data = memoryview(data).cast('B')
+        for start in range(0, len(data), STREAM_CHUNK_SIZE):
+            self.f.write(self.compressor.compress(data[start:start+STREAM_CHUNK_SIZE]))
+
+        return len(data)
+
+    def finish(self):
+        self.f.write(self.compressor.flush())
+
+
+class DecompressedReader(io.RawIOBase):
+
+    # Reads and decompresses data from f. Wrap it in an io.BufferedReader to
+    # get the usual read methods.
+
+    def __init__(self, f, compression):
+        self.f = f
+        self.decompressor = createDecompressor(compression)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+
+        if len(b) == 0:
+            return 0
+
+        # never decompress more than a chunk at a time, even into big buffers
+        max_length = min(len(b), STREAM_CHUNK_SIZE)
+
+        while not self.decompressor.eof:
+
+            data = b''
+            if self.decompressor.needs_input:
+                data = self.f.read(STREAM_CHUNK_SIZE)
+                if not data:
+                    raise EOFError("Compressed cache entry ended unexpectedly")
+
+            out = self.decompressor.decompress(data, max_length)
+            if len(out) > 0:
+                b[:len(out)] = out
+                return len(out)
+
+        return 0
+
+def openDecompressed(f, compression):
+    return io.BufferedReader(DecompressedReader(f, compression), STREAM_CHUNK_SIZE)
@@ -0,0 +1,96 @@
+import os, hashlib
+from os.path import join, dirname, exists
+
+# Results that come out byte for byte the same under different hashcodes are
+# only stored once. Every entry is digested as it is written, and the first
+# entry with a given digest is hard linked into the blob directory. Later
+# entries with the same digest are swapped for another link to that blob
+# instead of keeping their own copy, so they all share the same storage.
+#
+# The manifest records the digest of every entry that shares its storage with
+# a blob, which is how the cache counts references to each blob and knows how
+# many bytes it really holds.
+BLOB_DIRECTORY = ".blobs"
+
+class HashingWriter:
+
+    # Digests everything written to it on its way to f
+
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.blake2b(digest_size=20)
+
+    def write(self, data):
+        self.hash.update(data)
+        return self.f.write(data)
+
+    def tell(self):
+        return self.f.tell()
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+# Methods added to the Cache class
+
+def blobPath(self, digest):
+    return join(self.directory, BLOB_DIRECTORY, digest[:2], digest)
+
+# moves a freshly written entry from tmp_fname to cache_fname, sharing the
+# storage of an identical entry if there is one
+# returns the digest if the entry ended up linked to its blob, None otherwise
+def storeEntry(self, tmp_fname, cache_fname, digest):
+
+    blob_fname = self.blobPath(digest)
+
+    blob_dir = dirname(blob_fname)
+    if blob_dir not in self.entry_dirs:
+        os.makedirs(blob_dir, exist_ok=True)
+        self.entry_dirs.add(blob_dir)
+
+    try:
+        if exists(blob_fname):
+            link_fname = tmp_fname + ".link"
+            os.link(blob_fname, link_fname)
+            os.remove(tmp_fname)
+            tmp_fname = link_fname
+        else:
+            os.link(tmp_fname, blob_fname)
+    except OSError as e:
+        # file systems without hard links, or another process storing the same
+        # content at the same moment, just leave the entry with its own copy
+        digest = None
+
+    os.replace(tmp_fname, cache_fname)
+    return digest
+
+# deletes a blob once no entry links to it anymore
+# the link count is checked rather than the references in the virtual cache,
+# since other processes may have linked to the blob since we last read the
+# manifest
+def releaseBlob(self, digest):
+
+    blob_fname = self.blobPath(digest)
+    try:
+        if os.stat(blob_fname).st_nlink <= 1:
+            os.remove(blob_fname)
+    except FileNotFoundError as e:
+        pass
+
+# deletes every blob no entry links to, e.g. after a run was killed part way
+# through removing an entry
+def sweepBlobs(self):
+
+    blob_root = join(self.directory, BLOB_DIRECTORY)
+    if not exists(blob_root):
+        return 0
+
+    swept = 0
+    for shard in os.listdir(blob_root):
+        for digest in os.listdir(join(blob_root, shard)):
+            blob_fname = join(blob_root, shard, digest)
+            if os.stat(blob_fname).st_nlink <= 1:
+                os.remove(blob_fname)
+                swept += 1
+
+    return swept
@@ -0,0 +1,144 @@
+import hashlib, os
+from os.path import exists, abspath, join
+from shutil import copyfile
+
+from blk.constants import AUTO, MANUAL
+from .Compression import STREAM_CHUNK_SIZE
+from .Layout import temporaryName
+
+# A task whose hashcode changed because something upstream of it changed
+# doesn't always have to be run again. If the results it's given turn out to
+# be exactly the same as last time, so will its own result, and the entry it
+# made last time can be used under its new hashcode. Then the same goes for
+# the tasks downstream of it, so an upstream change that doesn't change any
+# results stops after the first task it reaches.
+#
+# To tell, every entry records a trace: a digest of the task's base hashcode
+# (its operation and arguments, but not its dependencies) along with the
+# content digests of the results of its dependencies. A task with the same
+# trace as an existing entry is given that entry instead of being run.
+
+# returns None for files that don't exist
+def digestFile(fname):
+
+    if not exists(fname):
+        return None
+
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(fname, 'rb') as f:
+        while True:
+            data = f.read(STREAM_CHUNK_SIZE)
+            if not data: break
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+# Methods added to the Cache class
+
+# returns the trace of a task, or None if it can't have one, e.g. when it has
+# no dependencies or one of its dependencies' results hasn't been digested
+# a dependency saved on this process has to have been written before its
+# digest is known, so a result's trace is worked out as it is written
+def traceFor(self, task):
+
+    if not self.early_cutoff or task.dependencies is None:
+        return None
+
+    if getattr(task, "base_hashcode", None) is None:
+        return None
+
+    parts = [task.base_hashcode]
+    for dep in task.dependencies:
+
+        if dep.save_action == AUTO:
+            # results still being copied into the shared cache have already
+            # been digested, and are newer than whatever the manifest has
+            with self.lock:
+                digest = self.digests.get(dep.hashcode)
+                entry = self.virtual_cache.get(dep.hashcode) if digest is None \
+                    else {"content_digest" : digest}
+        elif dep.save_action == MANUAL:
+            entry = self.outputs.get(abspath(dep.output_file))
+            if entry is not None and entry["hashcode"] != dep.hashcode:
+                entry = None
+        else:
+            entry = None
+
+        if entry is None or entry.get("content_digest") is None:
+            return None
+
+        parts.append(f"{dep.name}={entry['content_digest']}")
+    # end for dep
+
+    return hashlib.blake2b("\n".join(parts).encode(), digest_size=16).hexdigest()
+
+# gives a task that is about to be run the result it made last time it had
+# the same trace, if there is one
+# returns whether the task still has to be run
+def reuse(self, task):
+
+    trace = self.traceFor(task)
+    if trace is None:
+        return False
+
+    if task.save_action == AUTO:
+
+        with self.lock:
+            source = self.traces.get(trace)
+            entry = self.virtual_cache.get(source) if source is not None else None
+
+        if entry is None or source == task.hashcode:
+            return False
+
+        return self.aliasEntry(task.hashcode, entry)
+
+    if task.save_action == MANUAL:
+
+        output_file = abspath(task.output_file)
+        output = self.outputs.get(output_file)
+        if output is None or output.get("trace") != trace or not exists(output_file):
+            return False
+
+        # it would take as long to make again as it did the first time
+        task.compute_time = output.get("compute_time")
+        self.saveOutput(task)
+        return True
+
+    return False
+
+# makes hashcode another name for the result in entry
+# returns False if the result couldn't be found
+def aliasEntry(self, hashcode, entry):
+
+    record = dict(entry)
+    record["hashcode"] = hashcode
+    record.pop("type", None)
+    record.pop("last_access", None)
+
+    # packed results can be pointed at where they already are, as long as the
+    # pack isn't repacked before the new record is in the manifest
+    if record.get("pack") is not None:
+        with self.lockPack(record["pack"]) as fd:
+            if fd is None:
+                return False
+            self.publish(hashcode, record)
+
+        self.evict(keep=hashcode)
+        return True
+
+    source_fname = self.entryPath(entry["hashcode"])
+    tmp_fname = join(self.makeEntryDirectory(hashcode), temporaryName(hashcode))
+    try:
+        os.link(source_fname, tmp_fname)
+    except FileNotFoundError as e:
+        return False
+    except OSError as e:
+        # file systems without hard links get a copy
+        copyfile(source_fname, tmp_fname)
+        record["digest"] = None
+
+    os.replace(tmp_fname, self.entryPath(hashcode))
+
+    self.publish(hashcode, record)
+    self.evict(keep=hashcode)
+    return True
@@ -0,0 +1,130 @@
+import time
+
+# once the cache goes over its size limit, evict down to this fraction of it
+# so that we aren't evicting again on every save
+EVICTION_LOW_WATER_MARK = 0.9
+
+# recompute cost assumed for entries with no recorded compute time, in seconds
+DEFAULT_RECOMPUTE_COST = 1.0
+
+# Entries are evicted cheapest first. An entry is worth keeping when it took
+# a long time to compute, takes up little space and has been used recently,
+# so the score is the recompute cost per byte, discounted by the number of
+# hours since the entry was last used.
+def evictionScore(self, entry, now=None):
+
+    if now is None:
+        now = time.time()
+
+    cost = entry.get("compute_time") or DEFAULT_RECOMPUTE_COST
+    size = max(entry.get("size") or 0, 1)
+
+    last_used = entry.get("last_access") or entry.get("created") or now
+    age_hours = max(now - last_used, 0) / 3600
+
+    return cost / size / (1 + age_hours)
+
+# evicts entries until the cache fits within max_bytes
+# pinned entries, entries protected by the running pipeline and the entry
+# given by keep are never evicted
+# removed entries go on taking up space in their packs until the packs are
+# repacked, so that space counts too, and packs get repacked once it puts
+# the cache over its limit
+def evict(self, keep=None):
+
+    if self.max_bytes is None:
+        return
+
+    dead = self.deadPackBytes()
+    if self.total_bytes + sum(dead.values()) <= self.max_bytes:
+        return
+
+    # the packs may only look full of removed entries because other processes
+    # have added to them since we last read the manifest
+    if len(dead) > 0:
+        self.refresh()
+        dead = self.deadPackBytes()
+        if self.total_bytes + sum(dead.values()) <= self.max_bytes:
+            return
+
+    now = time.time()
+    candidates = []
+    kept_digests = set()
+    with self.lock:
+        for hashcode, entry in self.virtual_cache.items():
+            if entry.get("pinned", False) or hashcode in self.protected or hashcode == keep:
+                kept_digests.add(entry.get("digest"))
+            else:
+                candidates.append(entry)
+
+    # evicting an entry that shares its blob with an entry we're keeping
+    # wouldn't free anything
+    candidates = [
+        entry for entry in candidates
+        if entry.get("digest") is None or entry["digest"] not in kept_digests
+    ]
+    candidates.sort(key=lambda entry: self.evictionScore(entry, now))
+
+    target = EVICTION_LOW_WATER_MARK * self.max_bytes
+    for entry in candidates:
+        if self.total_bytes <= target: break
+        print(f"Evicting {entry['hashcode']} ({entry.get('operation')}, {entry.get('size')} bytes) from the cache")
+        self.removeEntry(entry["hashcode"])
+
+    dead = self.deadPackBytes()
+    if self.total_bytes + sum(dead.values()) > self.max_bytes:
+        self.repack([pack for pack, dead_bytes in dead.items() if dead_bytes > 0])
+        dead = self.deadPackBytes()
+
+    used_bytes = self.total_bytes + sum(dead.values())
+    if used_bytes > self.max_bytes:
+        print(f"[Warning] Cache holds {used_bytes} bytes, over its limit of {self.max_bytes}, but nothing else can be evicted")
+
+def pin(self, task):
+    self.setPinned(task.hashcode, True)
+
+def unpin(self, task):
+    self.setPinned(task.hashcode, False)
+
+def setPinned(self, hashcode, pinned):
+
+    entry = self.virtual_cache.get(hashcode)
+    if entry is None or entry.get("pinned", False) == pinned:
+        return
+
+    entry["pinned"] = pinned
+    self.manifest.update(hashcode, pinned=pinned)
+
+# the results these tasks depend on are still needed, so don't evict them
+def protect(self, tasks):
+
+    self.protected = set()
+    for task in tasks:
+        if task.dependencies is None: continue
+        for dep in task.dependencies:
+            if dep.hashcode is not None:
+                self.protected.add(dep.hashcode)
+
+# removes every entry that isn't pinned and isn't in referenced, a set of
+# hashcodes that are still in use, then evicts down to the size limit
+def collectGarbage(self, referenced):
+
+    orphans = [
+        hashcode for hashcode, entry in self.virtual_cache.items()
+        if not entry.get("pinned", False) and hashcode not in referenced
+    ]
+
+    start_bytes = self.total_bytes
+    for hashcode in orphans:
+        print(f"Removing orphaned entry {hashcode} ({self.virtual_cache[hashcode].get('operation')})")
+        self.removeEntry(hashcode)
+
+    self.evict()
+    freed = start_bytes - self.total_bytes
+
+    self.sweepBlobs()
+    freed += self.repack()
+    self.manifest.compact(self.virtual_cache, self.outputs)
+
+    print(f"Removed {len(orphans)} orphaned entries, freeing {freed} bytes")
+    return orphans
@@ -0,0 +1,145 @@
+import os, threading
+from os.path import join, exists, isdir
+
+# Where entries live inside the cache directory.
+#
+# flat    -- every entry sits directly in the cache directory, named by its
+#            hashcode. This is how older versions of blk laid out the cache.
+# sharded -- entries are spread over two levels of subdirectories named after
+#            the first four characters of their hashcode, e.g. ab/cd/abcd...
+#            so that no single directory ever holds more than a small slice
+#            of the cache. Parallel file systems get very slow at listing,
+#            opening and stat-ing files in directories with huge numbers of
+#            entries.
+CACHE_LAYOUTS = ["flat", "sharded"]
+FLAT, SHARDED = CACHE_LAYOUTS
+DEFAULT_LAYOUT = SHARDED
+
+# records the layout of a cache directory
+LAYOUT_FILENAME = ".blk_layout"
+
+# name of the temporary file an entry is written to before it's moved into
+# place, different for every process and thread that may be writing it
+def temporaryName(hashcode):
+    return f".{hashcode}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def shardPath(directory, hashcode, layout):
+
+    if layout == SHARDED and len(hashcode) > 4:
+        return join(directory, hashcode[:2], hashcode[2:4], hashcode)
+
+    return join(directory, hashcode)
+
+# figures out the layout of an existing cache directory
+# a directory without a layout file that already holds entries was made by an
+# older version of blk, so it must be flat, otherwise it gets new_layout
+def readLayout(directory, new_layout=DEFAULT_LAYOUT):
+
+    layout_fname = join(directory, LAYOUT_FILENAME)
+    if exists(layout_fname):
+        with open(layout_fname) as f:
+            return f.read().strip()
+
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.name.startswith('.') and entry.is_file():
+                return FLAT
+
+    return new_layout
+
+def checkLayout(layout):
+
+    if layout not in CACHE_LAYOUTS:
+        print(f"[Error] Unknown cache layout: {layout}. Options are: {', '.join(CACHE_LAYOUTS)}")
+        raise ValueError(layout)
+
+# the layout file is written to a temporary file and moved into place, so it
+# never ends up half written
+def writeLayout(directory, layout):
+
+    checkLayout(layout)
+
+    layout_fname = join(directory, LAYOUT_FILENAME)
+    tmp_fname = join(directory, temporaryName(LAYOUT_FILENAME))
+    with open(tmp_fname, 'w') as f:
+        f.write(layout)
+    os.replace(tmp_fname, layout_fname)
+
+# yields the hashcode and file name of every entry in the cache directory
+def scanEntries(directory, layout):
+
+    if layout == FLAT:
+        dirs = [directory]
+    else:
+        dirs = [
+            join(directory, a, b)
+            for a in listShards(directory)
+            for b in listShards(join(directory, a))
+        ]
+
+    for d in dirs:
+        with os.scandir(d) as it:
+            for entry in it:
+                # skip hidden files, e.g. the manifest or results still being written
+                if entry.name.startswith('.'): continue
+                if entry.is_file():
+                    yield entry.name, entry.path
+
+def listShards(directory):
+    return [
+        name for name in os.listdir(directory)
+        if len(name) == 2 and isdir(join(directory, name))
+    ]
+
+
+# Methods added to the Cache class
+
+def entryPath(self, hashcode):
+    return shardPath(self.directory, hashcode, self.layout)
+
+# makes sure the directory an entry will be written to exists
+def makeEntryDirectory(self, hashcode):
+
+    entry_dir = os.path.dirname(self.entryPath(hashcode))
+    if entry_dir in self.entry_dirs:
+        return entry_dir
+
+    os.makedirs(entry_dir, exist_ok=True)
+    self.entry_dirs.add(entry_dir)
+    return entry_dir
+
+# moves every entry in the cache into a new layout
+# nothing else should be using the cache while this runs
+def migrate(self, layout):
+
+    # nothing is moved until the new layout is known to be a real one
+    checkLayout(layout)
+
+    if layout == self.layout:
+        print(f"{self.directory} already uses the {layout} layout")
+        return
+
+    old_layout = self.layout
+    moved = 0
+    for hashcode, fname in list(scanEntries(self.directory, old_layout)):
+        new_fname = shardPath(self.directory, hashcode, layout)
+        os.makedirs(os.path.dirname(new_fname), exist_ok=True)
+        os.replace(fname, new_fname)
+        moved += 1
+
+    # clean up any shard directories that have been emptied
+    if old_layout == SHARDED:
+        for a in listShards(self.directory):
+            for b in listShards(join(self.directory, a)):
+                shard = join(self.directory, a, b)
+                if len(os.listdir(shard)) == 0:
+                    os.rmdir(shard)
+            if len(os.listdir(join(self.directory, a))) == 0:
+                os.rmdir(join(self.directory, a))
+
+    # the cache only switches to the new layout once every entry is in place
+    writeLayout(self.directory, layout)
+    self.layout = layout
+    self.entry_dirs = set()
+
+    print(f"Moved {moved} entries in {self.directory} from the {old_layout} to the {layout} layout")
@@ -0,0 +1,208 @@
+import os
+from collections import OrderedDict
+from os.path import join, exists, getsize
+
+from .Pack import copyRange
+from .Layout import temporaryName
+
+# How results saved to a cache with a local tier reach the shared cache
+#
+# write-through -- save copies the result into the shared cache before
+#                  returning, so other nodes can use it straight away
+# write-back    -- save returns as soon as the result is in the local tier,
+#                  and it is copied into the shared cache on a background
+#                  thread. Other processes only hear about the result once
+#                  it has been copied, which flush waits for.
+LOCAL_TIER_MODES = ["write-through", "write-back"]
+WRITE_THROUGH, WRITE_BACK = LOCAL_TIER_MODES
+DEFAULT_LOCAL_TIER_MODE = WRITE_THROUGH
+
+# how much of the local directory each process may use by default
+DEFAULT_LOCAL_TIER_BYTES = 10*1024**3
+
+# the stamp of the copy of an entry with this record in the local tier, which
+# changes whenever the entry is written again
+def stamp(record):
+    return f"{record['created']!r}"
+
+def checkLocalTierMode(mode):
+    if mode not in LOCAL_TIER_MODES:
+        print(f"[Error] Unknown local cache mode: {mode}. Options are: {', '.join(LOCAL_TIER_MODES)}")
+        raise ValueError(mode)
+
+class LocalTier:
+
+    # Keeps copies of cache entries in a directory on fast, node local
+    # storage, e.g. /tmp or a local SSD, so that results used on the same
+    # node they were made on never have to be read back from the shared
+    # file system. Entries are kept in a flat directory and dropped least
+    # recently used first once there are more than max_bytes of them.
+    #
+    # A copy is named after the entry's hashcode and when the entry was
+    # written, see stamp, so once another node replaces an entry the copy
+    # of the old one is never used again.
+    #
+    # Every process on a node may share the same local directory, in which
+    # case they can all read each other's entries, but each one only keeps
+    # track of the space used by the entries it knows about.
+
+    def __init__(self, directory, max_bytes=DEFAULT_LOCAL_TIER_BYTES):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+
+        # hashcode -> size in bytes, least recently used first
+        self.entries = OrderedDict()
+
+        # hashcode -> stamp of the copy of it in the local tier
+        self.stamps = {}
+
+        # entries that haven't been copied into the shared cache yet, and so
+        # can't be dropped
+        self.dirty = set()
+
+        os.makedirs(directory, exist_ok=True)
+
+        # pick up whatever earlier runs left behind, oldest first, so the
+        # newest copy of an entry wins
+        found = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.startswith('.') or not entry.is_file(): continue
+
+                # other processes on this node may be cleaning up too
+                try:
+                    # copies made by older versions of blk have no stamp, so
+                    # there's no telling whether they're still current
+                    if '.' not in entry.name:
+                        os.remove(entry.path)
+                        continue
+
+                    hashcode, stamp = entry.name.split('.', 1)
+                    stat = entry.stat()
+                except FileNotFoundError as e:
+                    continue
+
+                found.append((stat.st_mtime, hashcode, stamp, stat.st_size))
+
+        for _, hashcode, stamp, size in sorted(found):
+            self.track(hashcode, stamp, size)
+
+        self.evict()
+
+    def path(self, hashcode, stamp):
+        return join(self.directory, f"{hashcode}.{stamp}")
+
+    def temporaryPath(self, hashcode):
+        return join(self.directory, temporaryName(hashcode))
+
+    # returns the file holding the copy of an entry written at stamp, or None
+    # if the local tier doesn't have it
+    # without a stamp, whatever copy this process last had of it is used
+    def get(self, hashcode, stamp=None):
+
+        if stamp is None:
+            stamp = self.stamps.get(hashcode)
+            if stamp is None:
+                return None
+
+        fname = self.path(hashcode, stamp)
+        if not exists(fname):
+            if self.stamps.get(hashcode) == stamp:
+                self.forget(hashcode)
+            return None
+
+        # another process on this node may have put it there
+        if self.stamps.get(hashcode) != stamp:
+            self.track(hashcode, stamp, getsize(fname))
+
+        self.entries.move_to_end(hashcode)
+        return fname
+
+    # moves a freshly written entry from tmp_fname into the local tier
+    # dirty entries stay until they are marked clean, even if they're bigger
+    # than the whole tier, so they're still there to be copied into the
+    # shared cache
+    def add(self, hashcode, stamp, tmp_fname, size, dirty=False):
+
+        fname = self.path(hashcode, stamp)
+        os.replace(tmp_fname, fname)
+
+        self.track(hashcode, stamp, size)
+        if dirty:
+            self.dirty.add(hashcode)
+
+        self.evict()
+        return fname
+
+    # copies size bytes starting at offset in src_fname to a temporary file,
+    # which add then moves into the local tier
+    # returns None if the entry is too big to keep
+    # nothing the tier keeps track of is touched, so the copy can be made
+    # without holding the cache's lock
+    def fetch(self, hashcode, src_fname, size, offset=0):
+
+        if self.max_bytes is not None and size > self.max_bytes:
+            return None
+
+        tmp_fname = self.temporaryPath(hashcode)
+        src = os.open(src_fname, os.O_RDONLY)
+        dst = os.open(tmp_fname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            copyRange(src, dst, size, offset, 0)
+        except Exception as e:
+            os.remove(tmp_fname)
+            raise
+        finally:
+            os.close(src)
+            os.close(dst)
+
+        return tmp_fname
+
+    # once an entry is in the shared cache its copy can be dropped like any
+    # other
+    def clean(self, hashcode):
+        self.dirty.discard(hashcode)
+        self.evict()
+
+    def discard(self, hashcode):
+
+        stamp = self.stamps.get(hashcode)
+        self.forget(hashcode)
+        if stamp is None:
+            return
+
+        try:
+            os.remove(self.path(hashcode, stamp))
+        except FileNotFoundError as e:
+            pass
+
+    # a copy with a new stamp replaces whatever copy of the entry was there
+    def track(self, hashcode, stamp, size):
+
+        if self.stamps.get(hashcode, stamp) != stamp:
+            self.discard(hashcode)
+
+        self.forget(hashcode)
+        self.entries[hashcode] = size
+        self.stamps[hashcode] = stamp
+        self.total_bytes += size
+
+    def forget(self, hashcode):
+
+        size = self.entries.pop(hashcode, None)
+        if size is not None:
+            self.total_bytes -= size
+        self.stamps.pop(hashcode, None)
+        self.dirty.discard(hashcode)
+
+    def evict(self):
+
+        if self.max_bytes is None:
+            return
+
+        for hashcode in list(self.entries.keys()):
+            if self.total_bytes <= self.max_bytes: break
+            if hashcode in self.dirty: continue
+            self.discard(hashcode)
@@ -0,0 +1,105 @@
+import json, os
+from os.path import join, exists
+
+MANIFEST_FILENAME = ".blk_manifest"
+
+# record types stored in the manifest
+# UPDATE records change some of the metadata of an entry that already exists
+# OUTPUT records note the hashcode of the task that last wrote an output file
+# of its own, i.e. a task with the manual save action
+ADD, REMOVE, UPDATE, OUTPUT = "add", "remove", "update", "output"
+
+class Manifest:
+
+    # The manifest is an append-only log, one JSON record per line, kept in
+    # the cache directory next to the results it describes. Every save adds
+    # a record holding the metadata of the new entry and every removal adds
+    # a record that cancels it, so replaying the log from the top gives the
+    # current contents of the cache without touching any of the entries.
+    #
+    # Each record is appended with a single write to a file opened with
+    # O_APPEND, so several processes can add to the same manifest at once.
+
+    def __init__(self, directory):
+
+        self.path = join(directory, MANIFEST_FILENAME)
+
+        # how far into the log we've read, so later reads only see new records
+        self.position = 0
+
+        # number of records in the log, live or not
+        self.num_records = 0
+
+    def exists(self):
+        return exists(self.path)
+
+    # returns any records that have been appended since the last read
+    def read(self):
+
+        records = []
+        if not self.exists():
+            return records
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.position)
+            for line in f:
+
+                # a record that is still being written by another process
+                if not line.endswith(b'\n'): break
+
+                self.position += len(line)
+                self.num_records += 1
+                records.append(json.loads(line))
+        # end with
+
+        return records
+
+    def append(self, *records):
+
+        data = b''.join(json.dumps(r).encode() + b'\n' for r in records)
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def add(self, record):
+        record["type"] = ADD
+        self.append(record)
+
+    def remove(self, hashcode):
+        self.append({"type" : REMOVE, "hashcode" : hashcode})
+
+    def update(self, hashcode, **fields):
+        self.append({"type" : UPDATE, "hashcode" : hashcode, **fields})
+
+    # updates several entries with a single write
+    # updates maps hashcode -> the fields to change
+    def updateAll(self, updates):
+        if len(updates) > 0:
+            self.append(*[{"type" : UPDATE, "hashcode" : hashcode, **fields} 
+                for hashcode, fields in updates.items()])
+
+    def output(self, record):
+        record["type"] = OUTPUT
+        self.append(record)
+
+    # rewrites the log so it only holds the records in entries, along with
+    # the records of the output files in outputs
+    # records appended by other processes while this runs are lost, so this
+    # should only be done when nothing else is writing to the cache
+    def compact(self, entries, outputs=None):
+
+        outputs = outputs if outputs is not None else {}
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for record in entries.values():
+                f.write(json.dumps(record).encode() + b'\n')
+            for record in outputs.values():
+                f.write(json.dumps(record).encode() + b'\n')
+            self.position = f.tell()
+        os.replace(tmp_path, self.path)
+
+        self.num_records = len(entries) + len(outputs)
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+import sys
+import numpy as np
+
+# how much memory each process may use to hold on to results by default
+DEFAULT_MEMORY_TIER_BYTES = 1024**3
+
+# estimates how much memory a result takes up
+def resultSize(result):
+
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+
+    if isinstance(result, dict):
+        return sys.getsizeof(result) + sum(resultSize(v) for v in result.values())
+
+    if isinstance(result, (list, tuple)):
+        return sys.getsizeof(result) + sum(resultSize(v) for v in result)
+
+    return sys.getsizeof(result)
+
+class MemoryTier:
+
+    # Keeps recently used results in memory so that a result needed by many
+    # tasks on the same process is only read from the disk once. Results are
+    # dropped least recently used first once the tier holds more than
+    # max_bytes.
+    #
+    # Every task that asks for a result gets the same object, so operations
+    # should not modify their inputs in place.
+
+    def __init__(self, max_bytes):
+
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+
+        # hashcode -> (result, size in bytes), least recently used first
+        self.results = OrderedDict()
+
+    def __contains__(self, hashcode):
+        return hashcode in self.results
+
+    def get(self, hashcode):
+
+        if hashcode not in self.results:
+            return None
+
+        self.results.move_to_end(hashcode)
+        return self.results[hashcode][0]
+
+    def put(self, hashcode, result):
+
+        self.discard(hashcode)
+
+        size = resultSize(result)
+
+        # results that would push everything else out aren't worth keeping
+        if size > self.max_bytes:
+            return
+
+        self.results[hashcode] = (result, size)
+        self.total_bytes += size
+
+        while self.total_bytes > self.max_bytes:
+            _, (_, old_size) = self.results.popitem(last=False)
+            self.total_bytes -= old_size
+
+    def discard(self, hashcode):
+
+        item = self.results.pop(hashcode, None)
+        if item is not None:
+            self.total_bytes -= item[1]
+
+    def clear(self):
+        self.results = OrderedDict()
+        self.total_bytes = 0
@@ -0,0 +1,252 @@
+import os, fcntl, threading, secrets
+from contextlib import contextmanager
+from os.path import join, exists, getsize
+
+from blk.constants import STORAGE_OPTIONS
+from .Serializers import ALIGNMENT
+from .Compression import STREAM_CHUNK_SIZE
+from .Manifest import ADD
+
+# Segments with storage = pack keep all of their results in one append-only
+# pack file instead of a file per result, which saves the file system from
+# creating, opening and stat-ing thousands of small files. The manifest
+# records which pack each entry is in and the offset it starts at.
+#
+# Removing an entry from a pack only removes it from the manifest. The space
+# it took up is reclaimed when the pack is repacked, by blk gc or once the
+# cache grows past its size limit, see Eviction.py. Repacking copies the live
+# entries of a pack into a new pack and moves them there in the manifest
+# before deleting the old one. Every pack file is named after its segment
+# plus a random suffix, and a name is never used again once its pack has
+# been deleted, so the offsets other processes know about never point into
+# the wrong file: a process that finds a pack gone reads the manifest again
+# to find out where its entries went, see Cache.openEntry.
+#
+# Appending to a pack holds a shared lock on it until the new entry is in
+# the manifest, and repacking holds an exclusive one, so no entry is added
+# to a pack while it is being repacked.
+PACK_DIRECTORY = ".packs"
+PACK_SUFFIX = ".pack"
+
+def checkStorage(storage):
+    if storage not in STORAGE_OPTIONS:
+        print(f"[Error] Unknown storage: {storage}. Options are: {', '.join(STORAGE_OPTIONS)}")
+        raise ValueError(storage)
+
+# pack names come from segment names, so keep them to characters that are
+# safe in a file name
+def packName(name):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+
+# copies length bytes from src at src_offset to dst at dst_offset
+def copyRange(src, dst, length, src_offset, dst_offset):
+
+    while length > 0:
+        try:
+            copied = os.copy_file_range(src, dst, min(length, STREAM_CHUNK_SIZE), src_offset, dst_offset)
+        except (AttributeError, OSError) as e:
+            data = os.pread(src, min(length, STREAM_CHUNK_SIZE), src_offset)
+            copied = os.pwrite(dst, data, dst_offset)
+
+        if copied == 0:
+            raise EOFError("Ran out of data while copying into a pack")
+
+        length -= copied
+        src_offset += copied
+        dst_offset += copied
+
+# file locks are held by a process, not a thread, so threads of the same
+# process take turns reserving space with this
+reserve_lock = threading.Lock()
+
+# pack files are named after their segment's pack, see packName, with a
+# suffix no segment's pack can have
+def newPackName(pack):
+    return f"{pack.split('.')[0]}.{secrets.token_hex(4)}"
+
+# reserves length bytes at the end of the pack open as fd and returns the
+# offset they start at
+# entries start on aligned offsets so that arrays in them can be mapped
+def reserve(fd, length):
+
+    with reserve_lock:
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            end = os.fstat(fd).st_size
+            offset = end + (-end % ALIGNMENT)
+            os.ftruncate(fd, offset + length)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+
+    return offset
+
+
+# Methods added to the Cache class
+
+def packPath(self, pack):
+    return join(self.directory, PACK_DIRECTORY, pack + PACK_SUFFIX)
+
+# makes sure the pack directory exists and returns it
+def makePackDirectory(self):
+
+    pack_dir = join(self.directory, PACK_DIRECTORY)
+    if pack_dir not in self.entry_dirs:
+        os.makedirs(pack_dir, exist_ok=True)
+        self.entry_dirs.add(pack_dir)
+
+    return pack_dir
+
+# returns the pack file that new entries of the segment's pack go into, and
+# whether it's a new one that has to be created
+# there's normally only one, although a repack, or processes starting the
+# first one at the same moment, can briefly leave more
+def currentPack(self, pack):
+
+    pack_root = self.makePackDirectory()
+    prefix = pack + "."
+    names = [
+        fname[:-len(PACK_SUFFIX)] for fname in os.listdir(pack_root)
+        if fname.startswith(prefix) and fname.endswith(PACK_SUFFIX)
+    ]
+
+    if len(names) == 0:
+        return newPackName(pack), True
+    return min(names), False
+
+# opens a pack file and locks it, shared for adding entries to it or
+# exclusive for repacking it, and yields the file descriptor, or None if the
+# pack doesn't exist and create isn't set
+@contextmanager
+def lockPack(self, pack, shared=True, create=False):
+
+    pack_fname = self.packPath(pack)
+    if create:
+        self.makePackDirectory()
+
+    while True:
+        try:
+            fd = os.open(pack_fname, os.O_RDWR | (os.O_CREAT if create else 0), 0o644)
+        except FileNotFoundError as e:
+            fd = None
+            break
+
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+        # the pack may have been repacked and deleted while we waited, in
+        # which case we go round again and find it gone
+        try:
+            if os.path.samestat(os.fstat(fd), os.stat(pack_fname)): break
+        except FileNotFoundError as e:
+            pass
+        closePack(fd)
+    # end while
+
+    try:
+        yield fd
+    finally:
+        if fd is not None:
+            closePack(fd)
+
+# closing any descriptor of a file drops every lock the process holds on it,
+# including ones another thread is holding in reserve
+def closePack(fd):
+    with reserve_lock:
+        os.close(fd)
+
+# copies the entry written to tmp_fname onto the end of the segment's pack
+# and adds it to the manifest with the record given, returning once it's in
+# every process can append to the same pack at once, since each one reserves
+# its own piece of the pack before writing to it
+def appendToPack(self, tmp_fname, record):
+
+    while True:
+        pack, create = self.currentPack(record["pack"].split('.')[0])
+        with self.lockPack(pack, create=create) as fd:
+
+            # repacked while we were looking for it
+            if fd is None: continue
+
+            offset = reserve(fd, record["size"])
+            with open(tmp_fname, 'rb') as src:
+                copyRange(src.fileno(), fd, record["size"], 0, offset)
+            os.fsync(fd)
+
+            record["pack"] = pack
+            record["offset"] = offset
+            self.publish(record["hashcode"], record)
+            return
+
+# opens the pack holding an entry, positioned at the start of the entry
+def openPacked(self, entry):
+
+    f = open(self.packPath(entry["pack"]), 'rb')
+    f.seek(entry["offset"])
+    return f
+
+# returns the number of bytes in each pack that no longer belong to an entry
+# the cache knows about
+def deadPackBytes(self):
+
+    pack_root = join(self.directory, PACK_DIRECTORY)
+    if not exists(pack_root):
+        return {}
+
+    dead = {}
+    for fname in os.listdir(pack_root):
+        if not fname.endswith(PACK_SUFFIX): continue
+        pack = fname[:-len(PACK_SUFFIX)]
+        try:
+            dead[pack] = max(getsize(join(pack_root, fname)) - self.pack_bytes.get(pack, 0), 0)
+        except FileNotFoundError as e:
+            pass
+
+    return dead
+
+# moves the live entries of every pack in packs, or of every pack if packs is
+# None, that holds removed entries into a new pack, and deletes the old one
+# returns the number of bytes freed
+def repack(self, packs=None):
+
+    if packs is None:
+        packs = self.deadPackBytes().keys()
+
+    freed = 0
+    for pack in packs:
+        with self.lockPack(pack, shared=False) as src:
+            if src is None: continue
+
+            # every entry added to the pack before we got the lock is in the
+            # manifest by now
+            self.refresh()
+            with self.lock:
+                entries = sorted(
+                    [entry for entry in self.virtual_cache.values() if entry.get("pack") == pack],
+                    key=lambda entry: entry["offset"])
+
+            old_size = os.fstat(src).st_size
+            live_bytes = sum(entry["size"] for entry in entries)
+            if len(entries) > 0 and old_size - live_bytes < len(entries)*ALIGNMENT:
+                continue
+
+            if len(entries) > 0:
+                new_pack = newPackName(pack)
+                records = []
+                with self.lockPack(new_pack, create=True) as dst:
+                    for entry in entries:
+                        offset = reserve(dst, entry["size"])
+                        copyRange(src, dst, entry["size"], entry["offset"], offset)
+                        records.append(dict(entry, pack=new_pack, offset=offset, type=ADD))
+                    os.fsync(dst)
+
+                    self.manifest.append(*records)
+                    with self.lock:
+                        for record in records:
+                            self.addEntry(record)
+                            self.added[record["hashcode"]] = record
+
+            os.remove(self.packPath(pack))
+            freed += old_size - live_bytes
+        # end with src
+    # end for pack
+
+    return freed
@@ -0,0 +1,557 @@
+import os, pickle, json, struct, itertools
+import numpy as np
+
+from .Compression import (
+    NO_COMPRESSION, 
+    CompressedWriter, 
+    openDecompressed, 
+    checkCompression,
+    createCompressor,
+    createDecompressor
+)
+
+# Every cache entry written by blk starts with this magic string, followed by
+# the length of a small JSON header and the header itself. The header records
+# which serializer wrote the payload so that the reader never has to guess.
+# Entries that do not start with the magic string were written by older
+# versions of blk using plain pickle protocol 0.
+MAGIC = b"\x93BLK"
+HEADER_LENGTH = struct.Struct("<I")
+
+# payloads start on this boundary so that array data can be memory mapped
+ALIGNMENT = 64
+
+# compressed chunks of a chunked entry are each preceded by their length, and
+# followed by an index of where each one starts and how long it is, see
+# ChunkedSerializer
+CHUNK_LENGTH = struct.Struct("<Q")
+CHUNK_INDEX_ENTRY = struct.Struct("<QQ")
+TRAILER = "trailer"
+
+# "auto" picks the numpy serializer for array results and pickle5 otherwise
+AUTO_SERIALIZER = "auto"
+DEFAULT_SERIALIZER = AUTO_SERIALIZER
+
+
+# reads from f until view is full, since readinto is allowed to return early
+def readExactly(f, view):
+    view = memoryview(view).cast('B')
+    nread = 0
+    while nread < len(view):
+        n = f.readinto(view[nread:])
+        if not n:
+            raise EOFError(f"Cache entry truncated after {nread} of {len(view)} bytes")
+        nread += n
+    return nread
+
+
+class Pickle5Serializer:
+
+    # Pickle protocol 5 with out-of-band buffers. Large contiguous buffers,
+    # e.g. the data of numpy arrays, are kept out of the pickle stream and
+    # written to the file as-is, then read straight back into freshly
+    # allocated memory without any intermediate copies.
+
+    name = "pickle5"
+
+    def dump(self, obj):
+
+        buffers = []
+        data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raw_buffers = [b.raw() for b in buffers]
+
+        header = {
+            "pickle_bytes" : len(data),
+            "buffers" : [b.nbytes for b in raw_buffers]
+        }
+        return header, [data, *raw_buffers]
+
+    def load(self, f, header):
+
+        data = f.read(header["pickle_bytes"])
+
+        buffers = []
+        for nbytes in header["buffers"]:
+            buf = bytearray(nbytes)
+            readExactly(f, buf)
+            buffers.append(buf)
+
+        return pickle.loads(data, buffers=buffers)
+
+
+class NumpySerializer:
+
+    # Raw array storage for results that are a numpy array or a dict of numpy
+    # arrays, which covers most of what projections and slices produce. Each
+    # array is written as-is, in the spirit of a .npy/.npz file, and loaded
+    # back as a copy-on-write memory map so only the pages that a downstream
+    # task actually touches are ever read from disk.
+
+    name = "numpy"
+
+    def accepts(self, obj):
+
+        if isinstance(obj, dict):
+            return len(obj) > 0 and all(
+                isinstance(k, str) and self.accepts(v) for k,v in obj.items())
+
+        return type(obj) in (np.ndarray, np.memmap) and not obj.dtype.hasobject
+
+    def dump(self, obj):
+
+        is_dict = isinstance(obj, dict)
+        arrays = obj.items() if is_dict else [(None, obj)]
+
+        header = {
+            "is_dict" : is_dict,
+            "arrays" : []
+        }
+        parts = []
+        offset = 0
+        for key, arr in arrays:
+
+            fortran_order = arr.flags.f_contiguous and not arr.flags.c_contiguous
+            if not (arr.flags.c_contiguous or fortran_order):
+                arr = np.ascontiguousarray(arr)
+
+            header["arrays"].append({
+                "key" : key,
+                "descr" : np.lib.format.dtype_to_descr(arr.dtype),
+                "shape" : arr.shape,
+                "fortran_order" : fortran_order,
+                "offset" : offset
+            })
+
+            data = arr.reshape(-1, order='A').view(np.uint8)
+            pad = -data.nbytes % ALIGNMENT
+            parts += [data, bytes(pad)]
+            offset += data.nbytes + pad
+        # end for key, arr
+
+        return header, parts
+
+    def load(self, f, header):
+
+        # compressed arrays can't be mapped, they have to be read in full
+        mappable = header.get("compression", NO_COMPRESSION) == NO_COMPRESSION
+
+        payload_start = f.tell() if mappable else 0
+        position = 0
+
+        result = {}
+        for entry in header["arrays"]:
+
+            dtype = np.lib.format.descr_to_dtype(entry["descr"])
+            shape = tuple(entry["shape"])
+            order = 'F' if entry["fortran_order"] else 'C'
+            nbytes = dtype.itemsize * int(np.prod(shape))
+
+            if not mappable:
+                # skip over the padding between arrays
+                f.read(entry["offset"] - position)
+                arr = np.empty(shape, dtype=dtype, order=order)
+                readExactly(f, arr.reshape(-1, order='A').view(np.uint8))
+                position = entry["offset"] + nbytes
+            # zero length arrays can't be mapped
+            elif nbytes == 0:
+                arr = np.empty(shape, dtype=dtype, order=order)
+            else:
+                arr = np.memmap(f, 
+                    dtype=dtype, 
+                    mode='c', 
+                    offset=payload_start + entry["offset"], 
+                    shape=shape, 
+                    order=order)
+
+            result[entry["key"]] = arr
+        # end for entry
+
+        return result if header["is_dict"] else result[None]
+
+
+class ChunkedSerializer:
+
+    # Splits a large array into fixed size chunks, each written (and
+    # compressed) on its own, with an index of where every chunk starts. A
+    # slice or sub-box of the array can then be read by reading only the
+    # chunks that overlap it, see loadRegion. Chunks at the upper edges of
+    # the array are cut short rather than padded.
+    #
+    # Uncompressed chunks have sizes known up front, so the index goes in
+    # the header. Compressed chunks are only compressed as they're written,
+    # one at a time, so that no more than one chunk is ever held in memory.
+    # Each one is preceded by its length, so the whole array can be read
+    # back in order, and the index goes in a trailer after the last chunk,
+    # followed by where the trailer starts.
+
+    name = "chunked"
+
+    def accepts(self, obj):
+        return type(obj) in (np.ndarray, np.memmap) and not obj.dtype.hasobject and obj.ndim > 0
+
+    # chunk_shape defaults to the whole array
+    def dump(self, obj, chunk_shape=None, compression=NO_COMPRESSION, compression_level=None):
+
+        if chunk_shape is None:
+            chunk_shape = obj.shape
+        chunk_shape = normalizeChunkShape(chunk_shape, obj.shape)
+
+        header = {
+            "descr" : np.lib.format.dtype_to_descr(obj.dtype),
+            "shape" : obj.shape,
+            "chunk_shape" : chunk_shape,
+            "chunk_compression" : compression
+        }
+
+        # chunks are cut out of the array as they're written
+        def chunkData(slices):
+            return np.ascontiguousarray(obj[slices]).reshape(-1).view(np.uint8)
+
+        if compression == NO_COMPRESSION:
+
+            header["chunks"] = []
+            offset = 0
+            for slices in chunkGrid(obj.shape, chunk_shape):
+                nbytes = int(np.prod([s.stop - s.start for s in slices])) * obj.dtype.itemsize
+                header["chunks"].append([offset, nbytes])
+                offset += nbytes + (-nbytes % ALIGNMENT)
+
+            def parts():
+                for slices, (_, nbytes) in zip(chunkGrid(obj.shape, chunk_shape), header["chunks"]):
+                    yield chunkData(slices)
+                    yield bytes(-nbytes % ALIGNMENT)
+
+            return header, parts()
+
+        header["chunk_index"] = TRAILER
+
+        def parts():
+
+            index = []
+            offset = 0
+            for slices in chunkGrid(obj.shape, chunk_shape):
+
+                compressor = createCompressor(compression, compression_level)
+                data = compressor.compress(chunkData(slices)) + compressor.flush()
+
+                yield CHUNK_LENGTH.pack(len(data))
+                offset += CHUNK_LENGTH.size
+                index.append((offset, len(data)))
+
+                yield data
+                offset += len(data)
+            # end for slices
+
+            for entry in index:
+                yield CHUNK_INDEX_ENTRY.pack(*entry)
+            yield CHUNK_LENGTH.pack(offset)
+
+        return header, parts()
+
+    def load(self, f, header):
+
+        dtype = np.lib.format.descr_to_dtype(header["descr"])
+        result = np.empty(header["shape"], dtype=dtype)
+
+        if header.get("chunk_index") == TRAILER:
+            for slices in chunkGrid(result.shape, header["chunk_shape"]):
+                nbytes, = CHUNK_LENGTH.unpack(f.read(CHUNK_LENGTH.size))
+                result[slices] = self.readChunk(f, header, dtype, slices, nbytes)
+            return result
+
+        position = 0
+        for (offset, nbytes), slices in zip(header["chunks"], chunkGrid(result.shape, header["chunk_shape"])):
+            # skip over the padding between chunks
+            f.read(offset - position)
+            result[slices] = self.readChunk(f, header, dtype, slices, nbytes)
+            position = offset + nbytes
+
+        return result
+
+    # reads the part of the array selected by region, a tuple of integers and
+    # slices like the ones used to index a numpy array, from an entry whose
+    # payload starts at the current position in f
+    # memory is an optional MemoryTier to keep decoded chunks in, under
+    # names starting with key
+    # end is where the entry ends in f, see readIndex
+    def loadRegion(self, f, header, region, memory=None, key=None, end=None):
+
+        dtype = np.lib.format.descr_to_dtype(header["descr"])
+        shape = tuple(header["shape"])
+        chunk_shape = header["chunk_shape"]
+        payload_start = f.tell()
+
+        # the indices selected along each axis
+        region = normalizeRegion(region, len(shape))
+        indices = [axisIndices(s, n, axis) for axis, (s, n) in enumerate(zip(region, shape))]
+
+        if any(len(idx) == 0 for idx in indices):
+            box = np.empty([len(idx) for idx in indices], dtype=dtype)
+            return box[tuple(0 if not isinstance(s, slice) else slice(None) for s in region)]
+
+        # read every chunk overlapping the box around the region
+        lo = [int(idx.min()) for idx in indices]
+        hi = [int(idx.max()) + 1 for idx in indices]
+        box = np.empty([h - l for l, h in zip(lo, hi)], dtype=dtype)
+
+        num_chunks = [-(-n // c) for n, c in zip(shape, chunk_shape)]
+        chunk_ranges = [range(l // c, (h - 1) // c + 1) for l, h, c in zip(lo, hi, chunk_shape)]
+
+        # the index is only read once a chunk has to be
+        index = None
+
+        for chunk in itertools.product(*chunk_ranges):
+
+            slices = tuple(
+                slice(i*c, min((i+1)*c, n)) for i, c, n in zip(chunk, chunk_shape, shape))
+            number = int(np.ravel_multi_index(chunk, num_chunks))
+
+            data = memory.get(f"{key}:{number}") if memory is not None else None
+            if data is None:
+                if index is None:
+                    index = self.readIndex(f, header, payload_start, end)
+                offset, nbytes = index[number]
+                f.seek(payload_start + offset)
+                data = self.readChunk(f, header, dtype, slices, nbytes)
+                if memory is not None:
+                    memory.put(f"{key}:{number}", data)
+
+            # copy the overlap between the chunk and the box
+            overlap = [
+                (max(s.start, l), min(s.stop, h)) for s, l, h in zip(slices, lo, hi)]
+            box[tuple(slice(a - l, b - l) for (a, b), l in zip(overlap, lo))] = \
+                data[tuple(slice(a - s.start, b - s.start) for (a, b), s in zip(overlap, slices))]
+        # end for chunk
+
+        # then pick the region out of the box
+        result = box[np.ix_(*[idx - l for idx, l in zip(indices, lo)])]
+        return result[tuple(slice(None) if isinstance(s, slice) else 0 for s in region)]
+
+    # returns the offset and length of every chunk of an entry whose payload
+    # starts at payload_start in f
+    # the trailer of an entry with one is found from where the entry ends,
+    # which is the end of the file unless it's given
+    def readIndex(self, f, header, payload_start, end=None):
+
+        if header.get("chunk_index") != TRAILER:
+            return header["chunks"]
+
+        if end is None:
+            end = os.fstat(f.fileno()).st_size
+
+        f.seek(end - CHUNK_LENGTH.size)
+        index_start, = CHUNK_LENGTH.unpack(f.read(CHUNK_LENGTH.size))
+
+        f.seek(payload_start + index_start)
+        data = f.read(end - CHUNK_LENGTH.size - payload_start - index_start)
+        return list(CHUNK_INDEX_ENTRY.iter_unpack(data))
+
+    def readChunk(self, f, header, dtype, slices, nbytes):
+
+        chunk = np.empty([s.stop - s.start for s in slices], dtype=dtype)
+
+        compression = header["chunk_compression"]
+        if compression == NO_COMPRESSION:
+            readExactly(f, chunk.reshape(-1).view(np.uint8))
+        else:
+            data = f.read(nbytes)
+            chunk.reshape(-1).view(np.uint8)[:] = np.frombuffer(
+                createDecompressor(compression).decompress(data), dtype=np.uint8)
+
+        return chunk
+
+# fills in the chunk size along any axes chunk_shape leaves out, and keeps
+# chunks within the array, a single integer gives cubic chunks
+def normalizeChunkShape(chunk_shape, shape):
+
+    if isinstance(chunk_shape, int):
+        chunk_shape = [chunk_shape]*len(shape)
+
+    chunk_shape = list(chunk_shape) + list(shape[len(chunk_shape):])
+    return [max(1, min(int(c), n)) for c, n in zip(chunk_shape, shape)]
+
+# turns anything that can index an array into one integer or slice per axis
+def normalizeRegion(region, ndim):
+
+    region = np.index_exp[region]
+
+    if any(s is Ellipsis for s in region):
+        i = region.index(Ellipsis)
+        region = region[:i] + (slice(None),)*(ndim - len(region) + 1) + region[i+1:]
+
+    if len(region) > ndim:
+        raise IndexError(f"too many indices for array: array is {ndim}-dimensional, but {len(region)} were indexed")
+
+    return tuple(region) + (slice(None),)*(ndim - len(region))
+
+# the indices selected along an axis of length n by s, an integer or a slice
+# integers out of range are an error, as they are for numpy arrays, rather
+# than wrapping around
+def axisIndices(s, n, axis):
+
+    if isinstance(s, slice):
+        return np.arange(n)[s]
+
+    if not -n <= s < n:
+        raise IndexError(f"index {s} is out of bounds for axis {axis} with size {n}")
+
+    return np.array([s % n])
+
+# yields the slices covering each chunk of an array, in C order
+def chunkGrid(shape, chunk_shape):
+
+    ranges = [range(0, n, c) for n, c in zip(shape, chunk_shape)]
+    for start in itertools.product(*ranges):
+        yield tuple(
+            slice(s, min(s + c, n)) for s, c, n in zip(start, chunk_shape, shape))
+
+
+class LegacyPickleSerializer:
+
+    # Reader for entries written by older versions of blk, which are bare
+    # protocol 0 pickles without a header. Writing with it is still possible
+    # for anyone that needs caches readable by old versions of blk.
+
+    name = "pickle0"
+
+    def dump(self, obj):
+        return {}, [pickle.dumps(obj, protocol=0)]
+
+    def load(self, f, header):
+        return pickle.load(f)
+
+
+SERIALIZERS = {
+    Pickle5Serializer.name : Pickle5Serializer(),
+    NumpySerializer.name : NumpySerializer(),
+    ChunkedSerializer.name : ChunkedSerializer(),
+    LegacyPickleSerializer.name : LegacyPickleSerializer(),
+}
+
+def getSerializer(name):
+
+    if name == AUTO_SERIALIZER:
+        return None
+
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        print(f"[Error] Unknown cache serializer: {name}")
+        print(f"Available serializers: {', '.join(SERIALIZERS.keys())}")
+        raise
+
+def registerSerializer(serializer):
+    SERIALIZERS[serializer.name] = serializer
+
+
+# figures out which serializer should be used to write obj
+def chooseSerializer(obj, serializer=DEFAULT_SERIALIZER):
+
+    if serializer != AUTO_SERIALIZER:
+        return getSerializer(serializer)
+
+    if SERIALIZERS[NumpySerializer.name].accepts(obj):
+        return SERIALIZERS[NumpySerializer.name]
+
+    return SERIALIZERS[Pickle5Serializer.name]
+
+
+# legacy entries have no header to say how they were compressed, so they
+# can't be
+def checkSerializerCompression(serializer, compression):
+    if serializer == LegacyPickleSerializer.name and compression != NO_COMPRESSION:
+        print(f"[Error] Results written with the {serializer} serializer can't be compressed, got compression = {compression}")
+        raise ValueError(compression)
+
+def writeEntry(f, obj, 
+    serializer=DEFAULT_SERIALIZER, 
+    compression=NO_COMPRESSION, 
+    compression_level=None,
+    chunk_shape=None):
+
+    checkCompression(compression)
+
+    # arrays that are written in chunks compress each chunk on its own, so
+    # the payload as a whole isn't compressed again
+    chunked = SERIALIZERS[ChunkedSerializer.name]
+    if chunk_shape is not None and chunked.accepts(obj):
+        header, parts = chunked.dump(obj, chunk_shape, compression, compression_level)
+        serializer = chunked
+        compression = NO_COMPRESSION
+    else:
+        serializer = chooseSerializer(obj, serializer)
+        checkSerializerCompression(serializer.name, compression)
+        header, parts = serializer.dump(obj)
+
+    # legacy entries are bare pickles, so they don't get a header
+    if serializer.name == LegacyPickleSerializer.name:
+        for part in parts:
+            f.write(part)
+        return {"serializer" : serializer.name}
+
+    header["serializer"] = serializer.name
+    header["compression"] = compression
+    header_bytes = json.dumps(header).encode()
+
+    # pad the header with whitespace so the payload starts on an aligned offset
+    header_end = f.tell() + len(MAGIC) + HEADER_LENGTH.size + len(header_bytes)
+    header_bytes += b' ' * (-header_end % ALIGNMENT)
+
+    f.write(MAGIC)
+    f.write(HEADER_LENGTH.pack(len(header_bytes)))
+    f.write(header_bytes)
+
+    # the header is never compressed, so the reader can find out how the
+    # payload was written before reading any of it
+    if compression != NO_COMPRESSION:
+        writer = CompressedWriter(f, compression, compression_level)
+        for part in parts:
+            writer.write(part)
+        writer.finish()
+    else:
+        for part in parts:
+            f.write(part)
+
+    return header
+
+
+# returns the header of the entry in f, leaving f positioned at the start of
+# the payload
+def readHeader(f):
+
+    start = f.tell()
+    magic = f.read(len(MAGIC))
+
+    if magic != MAGIC:
+        f.seek(start)
+        return {"serializer" : LegacyPickleSerializer.name}
+
+    header_length, = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+    return json.loads(f.read(header_length))
+
+
+def readEntry(f):
+    return readPayload(f, readHeader(f))
+
+def readPayload(f, header):
+
+    serializer = getSerializer(header["serializer"])
+
+    compression = header.get("compression", NO_COMPRESSION)
+    if compression != NO_COMPRESSION:
+        f = openDecompressed(f, compression)
+
+    return serializer.load(f, header)
+
+# reads the part of an array entry selected by region
+# only chunked entries can be read in part, anything else is loaded in full
+# and then indexed, although memory mapped arrays only read what is indexed
+# end is where the entry ends in f, needed when there's more after it
+def readRegion(f, region, memory=None, key=None, end=None):
+
+    header = readHeader(f)
+
+    if header["serializer"] == ChunkedSerializer.name:
+        return SERIALIZERS[ChunkedSerializer.name].loadRegion(f, header, region, memory, key, end)
+
+    return readPayload(f, header)[region]
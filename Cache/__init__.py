@@ -1,18 +1,138 @@
 
-from os import listdir, mkdir
-from os.path import isfile, join, exists
+from os import mkdir, remove
+from shutil import copyfile
+from os.path import join, exists, getsize, getmtime, abspath
+import time, threading
 
 from mpi4py import MPI
-
-import pickle
+from tabulate import tabulate
 
 from blk.constants import AUTO, MANUAL
+from blk.Tasks.CreateHashCode import digestArguments
+from .Serializers import readEntry, readRegion, writeEntry, getSerializer, DEFAULT_SERIALIZER
+from .Manifest import Manifest, ADD, REMOVE, UPDATE, OUTPUT
+from .MemoryTier import MemoryTier, DEFAULT_MEMORY_TIER_BYTES
+from .AsyncWriter import AsyncWriter, DEFAULT_WRITE_QUEUE_SIZE
+from .Compression import NO_COMPRESSION
+from .Layout import readLayout, writeLayout, scanEntries, temporaryName, LAYOUT_FILENAME, DEFAULT_LAYOUT
+from .Deduplication import HashingWriter
+from .EarlyCutoff import digestFile
+from .LocalTier import LocalTier, stamp, checkLocalTierMode, DEFAULT_LOCAL_TIER_BYTES, DEFAULT_LOCAL_TIER_MODE, WRITE_BACK
+
+# compact the manifest at startup once it holds this many times more records
+# than there are entries in the cache
+MANIFEST_COMPACTION_RATIO = 4
 
 class Cache:
 
     from .UI import UI
-
-    def __init__(self, directory=None):
+    from .Layout import entryPath, makeEntryDirectory, migrate
+    from .Deduplication import blobPath, storeEntry, releaseBlob, sweepBlobs
+    from .Pack import packPath, makePackDirectory, currentPack, lockPack, appendToPack, openPacked, deadPackBytes, repack
+    from .EarlyCutoff import traceFor, reuse, aliasEntry
+    from .Eviction import (
+        evict,
+        evictionScore,
+        pin,
+        unpin,
+        setPinned,
+        protect,
+        collectGarbage
+    )
+
+    def __init__(self, 
+        directory=None, 
+        serializer=DEFAULT_SERIALIZER, 
+        max_bytes=None,
+        memory_bytes=DEFAULT_MEMORY_TIER_BYTES,
+        async_writes=False,
+        write_queue_size=DEFAULT_WRITE_QUEUE_SIZE,
+        layout=DEFAULT_LAYOUT,
+        early_cutoff=True,
+        local_directory=None,
+        local_bytes=DEFAULT_LOCAL_TIER_BYTES,
+        local_mode=DEFAULT_LOCAL_TIER_MODE,
+        maintain=True):
+
+        # make sure we know how to write entries before touching the disk
+        getSerializer(serializer)
+        self.serializer = serializer
+
+        # keeps track of what exists in the real cache, along with the
+        # metadata the manifest holds for each entry
+        self.virtual_cache = {}
+        self.total_bytes = 0
+
+        # digest -> hashcodes of the entries sharing that blob, see
+        # Deduplication.py
+        self.blobs = {}
+
+        # pack -> bytes taken up by the entries in it, see Pack.py
+        self.pack_bytes = {}
+
+        # output file -> record of the task that wrote it, for tasks that
+        # write their own output files
+        self.outputs = {}
+
+        # trace -> hashcode of the entry made from it, see EarlyCutoff.py
+        self.traces = {}
+        self.early_cutoff = early_cutoff
+
+        # changes made by this process since the last call to takeChanges
+        self.added = {}
+        self.removed = set()
+        self.added_outputs = {}
+
+        # once the cache holds more than this many bytes, entries get evicted
+        self.max_bytes = max_bytes
+
+        # hashcodes of results that are still needed by the running pipeline
+        # and must not be evicted
+        self.protected = set()
+
+        # recently used results are kept in memory, set memory_bytes to 0 to 
+        # always go to the disk
+        self.memory = MemoryTier(memory_bytes) if memory_bytes else None
+
+        # guards the virtual cache, since results may be written from a 
+        # background thread
+        self.lock = threading.RLock()
+
+        # results saved by this process that are still waiting to be written
+        self.pending = {}
+
+        # hashcode -> when this process last read it, since the last flush
+        self.accessed = {}
+
+        # content digests of results that have been written to the local tier
+        # but not copied into the shared cache yet, see LocalTier.py
+        self.digests = {}
+        self.writer = AsyncWriter(self, write_queue_size) if async_writes else None
+
+        # copies of entries on node local storage, in front of the shared 
+        # cache directory, see LocalTier.py
+        self.local = None
+        self.uploader = None
+        if local_directory is not None:
+            checkLocalTierMode(local_mode)
+            self.local = LocalTier(local_directory, local_bytes)
+            if local_mode == WRITE_BACK:
+                self.uploader = AsyncWriter(self, write_queue_size, 
+                    write=self.commit, 
+                    name="blk-cache-uploader")
+
+        self.manifest = None
+
+        # how entries are arranged in the cache directory, see Layout.py
+        # new cache directories get this layout, existing ones keep theirs
+        self.layout = layout
+        self.entry_dirs = set()
+
+        # whether this process sets up and tidies the cache directory when it
+        # opens it, see setDirectory
+        # processes that open a cache that's already in use by others, e.g.
+        # the workers of a process parallel pipeline, leave it alone
+        self.maintain = maintain
 
         if directory == None:
             self.directory = '.'
@@ -21,9 +141,22 @@ class Cache:
         self.setDirectory(directory)
 
     def __str__(self):
-        my_str = "Cache contains:\n"
-        for c in self.virtual_cache:
-            my_str += f"{c}\n"
+
+        headers = ["Hashcode", "Operation", "Size (bytes)", "Compute time (s)", "Created", "Pinned"]
+        table = []
+        for hashcode, entry in self.virtual_cache.items():
+            created = entry.get("created")
+            table.append([
+                hashcode,
+                entry.get("operation"),
+                entry.get("size"),
+                entry.get("compute_time"),
+                time.ctime(created) if created is not None else None,
+                entry.get("pinned", False)
+            ])
+
+        my_str = f"Cache contains:\n{tabulate(table, headers=headers)}\n"
+        my_str += f"Total size: {self.total_bytes} bytes\n"
         return my_str
 
 
@@ -34,34 +167,217 @@ class Cache:
         comm = MPI.COMM_WORLD
         comm_rank = comm.Get_rank()
 
-        if not exists(self.directory) and comm_rank == 0:
-            print(f"{self.directory} not found\nCreating new directory...")
-            mkdir(self.directory)
+        self.virtual_cache = {}
+        self.total_bytes = 0
+        self.blobs = {}
+        self.pack_bytes = {}
+        self.outputs = {}
+        self.traces = {}
+        self.added = {}
+        self.removed = set()
+        self.added_outputs = {}
+        self.entry_dirs = set()
 
-        # Hold here until we're sure the cache exists
-        comm.Barrier()
+        self.manifest = Manifest(self.directory)
+
+        if comm_rank == 0 and self.maintain:
+
+            if not exists(self.directory):
+                print(f"{self.directory} not found\nCreating new directory...")
+                mkdir(self.directory)
+
+            if not exists(join(self.directory, LAYOUT_FILENAME)):
+                writeLayout(self.directory, readLayout(self.directory, self.layout))
+            self.layout = readLayout(self.directory)
 
-        # keeps track of what exists in the real cache
-        self.virtual_cache = set()
+            # caches made by older versions of blk have no manifest, so
+            # build one from whatever is on the disk
+            if not self.manifest.exists():
+                self.update()
+            else:
+                self.refresh()
 
-        self.update()
+            if self.manifest.num_records > MANIFEST_COMPACTION_RATIO*(len(self.virtual_cache)+len(self.outputs)+1):
+                self.manifest.compact(self.virtual_cache, self.outputs)
+
+        # Hold here until we're sure the cache and its manifest exist
+        comm.Barrier()
+
+        if comm_rank != 0 or not self.maintain:
+            self.layout = readLayout(self.directory)
+            self.refresh()
 
         comm_rank == 0 and print(f"Cache initialized as : {self.directory}")
 
-    # reads the real cache (the disk) and updates the virtual cache based on 
-    # what it finds
+    # reads the real cache (the disk) and updates the virtual cache and the
+    # manifest based on what it finds
+    # this touches every file in the cache, so it should only be used when
+    # the cache may have been changed by something outside of blk
     def update(self):
-        
-        ls = listdir(self.directory)
-        for fname in ls:
-            cache_fname = join(self.directory, fname)
-            if isfile(cache_fname):
-                self.virtual_cache.add(fname)
 
+        self.refresh()
+
+        on_disk = {}
+        for hashcode, cache_fname in scanEntries(self.directory, self.layout):
+            on_disk[hashcode] = cache_fname
+
+        # entries that were written without going through the manifest don't
+        # have any metadata beyond what the file system can tell us
+        for hashcode in on_disk.keys() - self.virtual_cache.keys():
+            cache_fname = on_disk[hashcode]
+            record = self.createRecord(
+                hashcode,
+                size=getsize(cache_fname),
+                created=getmtime(cache_fname)
+            )
+            self.manifest.add(record)
+            self.addEntry(record)
+
+        for hashcode in self.virtual_cache.keys() - on_disk.keys():
+            # packed entries don't have files of their own
+            pack = self.virtual_cache[hashcode].get("pack")
+            if pack is not None and exists(self.packPath(pack)): continue
+            self.manifest.remove(hashcode)
+            self.dropEntry(hashcode)
+
+    # reads any changes other processes have made to the manifest
+    def refresh(self):
+
+        with self.lock:
+            self.applyRecords(self.manifest.read())
+
+    def applyRecords(self, records):
+
+        for record in records:
+
+            if record["type"] == ADD:
+                self.addEntry(record)
+            elif record["type"] == REMOVE:
+                self.dropEntry(record["hashcode"])
+            elif record["type"] == UPDATE:
+                self.updateEntry(record)
+            elif record["type"] == OUTPUT:
+                self.outputs[record["output_file"]] = record
+
+    # hands over what this process added to or removed from the cache since
+    # the last call, for other processes to apply with applyChanges
+    def takeChanges(self):
+
+        with self.lock:
+            local_changes = (self.added, self.removed, self.added_outputs)
+            self.added = {}
+            self.removed = set()
+            self.added_outputs = {}
+
+        return local_changes
+
+    def applyChanges(self, changes):
+
+        added, removed, added_outputs = changes
+        with self.lock:
+            for record in added.values():
+                self.addEntry(record)
+            for hashcode in removed:
+                self.dropEntry(hashcode)
+            self.outputs.update(added_outputs)
+
+    def createRecord(self, hashcode,
+        operation=None,
+        arguments_digest=None,
+        size=None,
+        serializer=None,
+        created=None,
+        compute_time=None,
+        pinned=False,
+        compression=NO_COMPRESSION,
+        compression_level=None,
+        digest=None,
+        pack=None,
+        offset=None,
+        chunk_shape=None,
+        content_digest=None,
+        trace=None):
+
+        return {
+            "hashcode" : hashcode,
+            "operation" : operation,
+            "arguments_digest" : arguments_digest,
+            "size" : size,
+            "serializer" : serializer,
+            "created" : created,
+            "compute_time" : compute_time,
+            "pinned" : pinned,
+            "compression" : compression,
+            "compression_level" : compression_level,
+            "digest" : digest,
+            "pack" : pack,
+            "offset" : offset,
+            "chunk_shape" : chunk_shape,
+            "content_digest" : content_digest,
+            "trace" : trace
+        }
+
+    # these keep the virtual cache and its total size in step
+    # entries sharing a blob only count towards the total size once
+    def addEntry(self, record):
+        self.dropEntry(record["hashcode"])
+        self.virtual_cache[record["hashcode"]] = record
+
+        if record.get("trace") is not None:
+            self.traces[record["trace"]] = record["hashcode"]
+
+        if record.get("pack") is not None:
+            self.pack_bytes[record["pack"]] = self.pack_bytes.get(record["pack"], 0) + (record.get("size") or 0)
+
+        digest = record.get("digest")
+        if digest is not None:
+            refs = self.blobs.setdefault(digest, set())
+            refs.add(record["hashcode"])
+            if len(refs) > 1: return
+
+        self.total_bytes += record.get("size") or 0
+
+    def dropEntry(self, hashcode):
+        record = self.virtual_cache.pop(hashcode, None)
+        if record is not None:
+            if record.get("trace") is not None and self.traces.get(record["trace"]) == hashcode:
+                del self.traces[record["trace"]]
+
+            if record.get("pack") is not None:
+                self.pack_bytes[record["pack"]] -= record.get("size") or 0
+
+            digest = record.get("digest")
+            refs = self.blobs.get(digest)
+            if refs is not None:
+                refs.discard(hashcode)
+                if len(refs) == 0:
+                    del self.blobs[digest]
+                    self.total_bytes -= record.get("size") or 0
+            else:
+                self.total_bytes -= record.get("size") or 0
+
+        # whatever we were holding in memory is out of date now
+        if self.memory is not None:
+            self.memory.discard(hashcode)
+
+    def updateEntry(self, record):
+        entry = self.virtual_cache.get(record["hashcode"])
+        if entry is None: return
+        for k,v in record.items():
+            if k == "type": continue
+            entry[k] = v
+
+    # returns the manifest metadata for a task's result, or None if the cache
+    # doesn't have one
+    def getEntry(self, task):
+        return self.virtual_cache.get(task.hashcode)
 
     def getResultFilename(self, task):
         if task.save_action == AUTO:
-            return join(self.directory, task.hashcode)
+            entry = self.virtual_cache.get(task.hashcode)
+            if entry is not None and entry.get("pack") is not None:
+                return self.packPath(entry["pack"])
+            return self.entryPath(task.hashcode)
         elif task.save_action == MANUAL:
             return task.output_file
         else :
@@ -70,44 +386,369 @@ class Cache:
     def hasResultFor(self, task):
 
         if task.save_action == AUTO:
-            return task.hashcode in self.virtual_cache
+            return task.hashcode in self.virtual_cache or task.hashcode in self.pending
         elif task.save_action == MANUAL:
-            return exists(task.output_file)
+            # an output file only counts if it was written by a task with the
+            # same hashcode, i.e. from the same inputs
+            output = self.outputs.get(abspath(task.output_file))
+            return exists(task.output_file) \
+                and output is not None and output["hashcode"] == task.hashcode
         else :
             return False
 
     def load(self, task):
 
-        cache_fname = join(self.directory, task.hashcode)
+        entry = self.virtual_cache.get(task.hashcode)
+
+        with self.lock:
+            if task.hashcode in self.pending:
+                return self.pending[task.hashcode]
+
+            if self.memory is not None and task.hashcode in self.memory:
+                self.touch(task.hashcode, entry)
+                return self.memory.get(task.hashcode)
+
+        entry = self.findEntry(task, entry)
 
         try:
-            with open(cache_fname, 'rb') as f:
-                result = pickle.load(f)
+            with self.openEntry(task.hashcode, entry) as f:
+                result = readEntry(f)
         except FileNotFoundError as e:
             print(f"[Error] No cache result found for {task}")
-            raise 
-        else:
-            return result
-        
+            raise
+
+        self.touch(task.hashcode, entry)
+
+        if self.memory is not None:
+            with self.lock:
+                self.memory.put(task.hashcode, result)
+
+        return result
+
+    # reads part of an array result, e.g. a few slices of a cube, without
+    # loading the rest of it if the result was stored in chunks
+    # region is anything that can index a numpy array, e.g. np.s_[10:20, :, 5]
+    # the chunks that get read are kept in the memory tier
+    def loadRegion(self, task, region):
+
+        entry = self.virtual_cache.get(task.hashcode)
+
+        with self.lock:
+            if task.hashcode in self.pending:
+                return self.pending[task.hashcode][region]
+
+            if self.memory is not None and task.hashcode in self.memory:
+                return self.memory.get(task.hashcode)[region]
+
+        entry = self.findEntry(task, entry)
+
+        # chunks are named after when the entry was written, so chunks of an
+        # entry that has since been replaced are never used
+        key = f"{task.hashcode}:{entry.get('created') if entry is not None else None}"
+
+        try:
+            with self.lock, self.openEntry(task.hashcode, entry) as f:
+                # packed entries are followed by the rest of their pack
+                end = f.tell() + entry["size"] if entry is not None and entry.get("size") is not None else None
+                result = readRegion(f, region, self.memory, key, end)
+        except FileNotFoundError as e:
+            print(f"[Error] No cache result found for {task}")
+            raise
+
+        self.touch(task.hashcode, entry)
+        return result
+
+    # packed results may have been added by another process since we last
+    # looked at the manifest
+    def findEntry(self, task, entry):
+
+        if entry is None and getattr(task, "pack", None) is not None:
+            self.refresh()
+            entry = self.virtual_cache.get(task.hashcode)
+
+        return entry
+
+    # remembers when a result was last used, for eviction
+    # reading a result shouldn't mean writing to the manifest every time, so
+    # other processes only hear about it at the next flush
+    def touch(self, hashcode, entry):
+
+        if entry is not None:
+            with self.lock:
+                entry["last_access"] = time.time()
+                self.accessed[hashcode] = entry["last_access"]
+
+    def writeAccessTimes(self):
+
+        with self.lock:
+            accessed, self.accessed = self.accessed, {}
+
+        self.manifest.updateAll({hashcode : {"last_access" : last_access} 
+            for hashcode, last_access in accessed.items()})
+
 
     def save(self, task):
 
-        if task.save_action == MANUAL: return
-        cache_fname = join(self.directory, task.hashcode)
-        
-        # TODO: Do some research on pickle protocols for performance issues
-        with open(cache_fname, 'wb') as f:
-            pickle.dump(task.result, f, protocol=0)
+        if task.save_action == MANUAL: 
+            self.saveOutput(task)
+            return
 
-        self.update()
+        record = self.createRecord(
+            task.hashcode,
+            operation=task.operation.__name__,
+            arguments_digest=digestArguments(task.arguments),
+            compute_time=getattr(task, "compute_time", None),
+            pinned=getattr(task, "pinned", False),
+            compression=getattr(task, "compression", NO_COMPRESSION),
+            compression_level=getattr(task, "compression_level", None),
+            pack=getattr(task, "pack", None),
+            chunk_shape=getattr(task, "chunk_shape", None)
+        )
+
+        if self.writer is None:
+            self.write(task.hashcode, task.result, record, task)
+            return
 
+        # the result counts as cached on this process straight away, but 
+        # other processes only hear about it once it has been written
+        with self.lock:
+            self.pending[task.hashcode] = task.result
+            if self.memory is not None:
+                self.memory.put(task.hashcode, task.result)
+
+        self.writer.submit(task.hashcode, task.result, record, task)
+
+    # notes which task wrote an output file of its own
+    def saveOutput(self, task):
+
+        # the trace needs the digests of the results this task was given,
+        # which may still be waiting to be written
+        if self.writer is not None and task.dependencies is not None:
+            with self.lock:
+                waiting = any(dep.hashcode in self.pending for dep in task.dependencies)
+            if waiting:
+                self.writer.flush()
+
+        output_file = abspath(task.output_file)
+        record = {
+            "hashcode" : task.hashcode,
+            "output_file" : output_file,
+            "operation" : task.operation.__name__,
+            "arguments_digest" : digestArguments(task.arguments),
+            "compute_time" : getattr(task, "compute_time", None),
+            "content_digest" : digestFile(output_file) if self.early_cutoff else None,
+            "trace" : self.traceFor(task)
+        }
+        self.manifest.output(record)
+
+        with self.lock:
+            self.outputs[output_file] = record
+            self.added_outputs[output_file] = record
+
+    # opens the file an entry can be read from, positioned at its start
+    # entries are read from the local tier whenever possible, and copied
+    # there from the shared cache the first time they're read
+    def openEntry(self, hashcode, entry):
 
-    def remove(self, task):
-        
-        cache_fname = join(self.directory, task.hashcode)
-        try: 
-            remove(cache_fname)
+        try:
+            return self.openEntryFile(hashcode, entry)
         except FileNotFoundError as e:
-            pass
+            # packs are deleted once they've been repacked, see Pack.py, so a
+            # packed entry may have moved since we last read the manifest
+            if entry is None or entry.get("pack") is None:
+                raise
+            self.refresh()
+            return self.openEntryFile(hashcode, self.virtual_cache.get(hashcode))
+
+    def openEntryFile(self, hashcode, entry):
+
+        if self.local is not None:
+            # only a copy of the entry as the manifest has it is used
+            entry_stamp = stamp(entry) if entry is not None else None
+            with self.lock:
+                local_fname = self.local.get(hashcode, entry_stamp)
+
+            # the copy is made without holding the lock, so other threads
+            # aren't held up while a large entry is read from the shared cache
+            if local_fname is None and entry is not None:
+                if entry.get("pack") is not None:
+                    tmp_fname = self.local.fetch(hashcode,
+                        self.packPath(entry["pack"]), entry["size"], entry["offset"])
+                else:
+                    tmp_fname = self.local.fetch(hashcode,
+                        self.entryPath(hashcode), entry["size"])
+                if tmp_fname is not None:
+                    with self.lock:
+                        local_fname = self.local.add(hashcode, entry_stamp, tmp_fname, entry["size"])
+
+            if local_fname is not None:
+                return open(local_fname, 'rb')
+
+        if entry is not None and entry.get("pack") is not None:
+            return self.openPacked(entry)
+
+        return open(self.entryPath(hashcode), 'rb')
+
+    # writes a result to the disk and adds it to the manifest
+    # the trace of the task that made it is worked out here, see
+    # EarlyCutoff.py, since results are written in the order they were saved
+    # and so the results it depends on have been digested by now
+    def write(self, hashcode, result, record, task=None):
+
+        if task is not None:
+            record["trace"] = self.traceFor(task)
+
+        # write to a temporary file first and swap it into place, so that a
+        # previous result that is still memory mapped somewhere never changes
+        # underneath its reader, and a result is never seen half written
+        # with a local tier the result is written there first, and copied
+        # into the shared cache from there
+        if self.local is not None:
+            tmp_fname = self.local.temporaryPath(hashcode)
+        elif record["pack"] is not None:
+            tmp_fname = join(self.makePackDirectory(), temporaryName(hashcode))
+        else:
+            tmp_fname = join(self.makeEntryDirectory(hashcode), temporaryName(hashcode))
+
+        with open(tmp_fname, 'wb') as f:
+            f = HashingWriter(f)
+            header = writeEntry(f, result, 
+                serializer=self.serializer, 
+                compression=record["compression"],
+                compression_level=record["compression_level"],
+                chunk_shape=record["chunk_shape"])
+            record["size"] = f.tell()
+
+        record["serializer"] = header["serializer"]
+        record["created"] = time.time()
+
+        if self.local is None:
+            self.commit(hashcode, tmp_fname, f.hexdigest(), record)
+        else:
+            # the local copy is kept until it's in the shared cache, see
+            # LocalTier.add
+            with self.lock:
+                local_fname = self.local.add(hashcode, stamp(record), tmp_fname, record["size"], 
+                    dirty=True)
+
+            if self.uploader is None:
+                try:
+                    self.commit(hashcode, local_fname, f.hexdigest(), record, copy=True)
+                finally:
+                    with self.lock:
+                        self.local.clean(hashcode)
+            else:
+                # the result counts as cached on this process until it has
+                # been copied into the shared cache
+                with self.lock:
+                    self.pending[hashcode] = result
+                    self.digests[hashcode] = f.hexdigest()
+                self.uploader.submit(hashcode, local_fname, f.hexdigest(), record, True)
+
+        # tasks on this process that depend on this one can skip the disk
+        if self.memory is not None:
+            with self.lock:
+                self.memory.put(hashcode, result)
+
+    # puts an entry written to fname into the shared cache and adds it to the
+    # manifest, fname is copied rather than moved if copy is set
+    def commit(self, hashcode, fname, digest, record, copy=False):
+
+        record["content_digest"] = digest
+
+        if record["pack"] is not None:
+            self.appendToPack(fname, record)
+            copy or remove(fname)
+        else:
+            if copy:
+                tmp_fname = join(self.makeEntryDirectory(hashcode), temporaryName(hashcode))
+                copyfile(fname, tmp_fname)
+                fname = tmp_fname
+
+            # identical results share their storage
+            record["digest"] = self.storeEntry(fname, self.entryPath(hashcode), digest)
+            self.publish(hashcode, record)
+
+        # make room for the new result, but never by evicting the new result
+        self.evict(keep=hashcode)
+
+    # adds a record for an entry that is in place to the manifest and the
+    # virtual cache
+    # evict should be called afterwards, once any lock on the entry's pack
+    # has been let go of
+    def publish(self, hashcode, record):
+
+        self.manifest.add(record)
+
+        with self.lock:
+            self.addEntry(record)
+            self.added[hashcode] = record
+            self.removed.discard(hashcode)
+            self.pending.pop(hashcode, None)
+            self.digests.pop(hashcode, None)
+
+            if self.local is not None:
+                self.local.clean(hashcode)
+
+    def discardPending(self, hashcode):
+        with self.lock:
+            self.pending.pop(hashcode, None)
+            self.digests.pop(hashcode, None)
+            if self.memory is not None:
+                self.memory.discard(hashcode)
+            if self.local is not None:
+                self.local.clean(hashcode)
+
+    # calls callback once every result saved so far has been written to the
+    # disk, which is either straight away or later on a background thread
+    def afterWrites(self, callback):
+
+        if self.writer is not None and self.uploader is not None:
+            self.writer.after(lambda: self.uploader.after(callback))
+        elif self.writer is not None:
+            self.writer.after(callback)
+        elif self.uploader is not None:
+            self.uploader.after(callback)
+        else:
+            callback()
+
+    # blocks until every result saved so far has been written to the disk,
+    # along with when results were last used
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+        if self.uploader is not None:
+            self.uploader.flush()
+        if self.manifest is not None:
+            self.writeAccessTimes()
+
+
+    def remove(self, task):
+        self.removeEntry(task.hashcode)
+
+    def removeEntry(self, hashcode):
+
+        # packed entries stay in their pack until it gets repacked
+        entry = self.virtual_cache.get(hashcode)
+        if entry is None or entry.get("pack") is None:
+            try:
+                remove(self.entryPath(hashcode))
+            except FileNotFoundError as e:
+                pass
+
+        self.manifest.remove(hashcode)
+
+        with self.lock:
+            entry = self.virtual_cache.get(hashcode)
+            digest = entry.get("digest") if entry is not None else None
+
+            if self.local is not None:
+                self.local.discard(hashcode)
+
+            self.dropEntry(hashcode)
+            self.removed.add(hashcode)
+            self.added.pop(hashcode, None)
 
-        self.update()
\ No newline at end of file
+            # the last entry using a blob takes the blob with it
+            if digest is not None and digest not in self.blobs:
+                self.releaseBlob(digest)
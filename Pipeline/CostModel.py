@@ -0,0 +1,54 @@
+from blk.Tasks.CreateHashCode import digestArguments
+from blk.Cache.Eviction import DEFAULT_RECOMPUTE_COST
+
+class CostModel:
+
+    # Estimates how long each task will take from how long tasks took in
+    # earlier runs, as recorded in the cache manifest. A task that has been
+    # run before with the same arguments is expected to take as long as it
+    # did then, otherwise it's expected to take as long as its operation
+    # does on average. Tasks whose operation has never been run are given
+    # the average over every operation.
+
+    def __init__(self, cache):
+
+        # (operation, arguments digest) -> seconds
+        self.by_signature = {}
+
+        # operation -> [total seconds, number of runs]
+        self.by_operation = {}
+
+        total = 0
+        count = 0
+        for record in list(cache.virtual_cache.values()) + list(cache.outputs.values()):
+
+            compute_time = record.get("compute_time")
+            operation = record.get("operation")
+            if compute_time is None or operation is None: continue
+
+            self.by_signature[(operation, record.get("arguments_digest"))] = compute_time
+
+            stats = self.by_operation.setdefault(operation, [0, 0])
+            stats[0] += compute_time
+            stats[1] += 1
+
+            total += compute_time
+            count += 1
+        # end for record
+
+        self.default = total / count if count > 0 else DEFAULT_RECOMPUTE_COST
+
+    # returns the expected run time of a task in seconds
+    def estimate(self, task):
+
+        operation = task.operation.__name__
+
+        stats = self.by_operation.get(operation)
+        if stats is None:
+            return self.default
+
+        signature = (operation, digestArguments(task.arguments))
+        if signature in self.by_signature:
+            return self.by_signature[signature]
+
+        return stats[0] / stats[1]
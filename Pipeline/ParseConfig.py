@@ -10,10 +10,21 @@ from blk.constants import (
     ONE_TO_ONE,  
     NONE,
     AUTO,
-    TASK_ACTION_OPTIONS
+    TASK_ACTION_OPTIONS,
+    FILES,
+    PACK
 )
 
 from blk import Task, Terminal, Cache
+from blk.Cache.Serializers import DEFAULT_SERIALIZER, checkSerializerCompression
+from blk.Cache.MemoryTier import DEFAULT_MEMORY_TIER_BYTES
+from blk.Cache.AsyncWriter import DEFAULT_WRITE_QUEUE_SIZE
+from blk.Cache.Layout import DEFAULT_LAYOUT
+from blk.Cache.Compression import NO_COMPRESSION, checkCompression
+from blk.Cache.Pack import checkStorage, packName
+from blk.Cache.LocalTier import DEFAULT_LOCAL_TIER_BYTES, DEFAULT_LOCAL_TIER_MODE
+from blk.utils import parse_bytes
+from blk.Tasks.Fingerprint import OUTPUT_ARGUMENTS
 from mpi4py import MPI
 
 
@@ -28,7 +39,15 @@ SPECIAL_ARGS = [
     "format",
     "format_start_index",
     "save_action",
-    "always_run"
+    "always_run",
+    "pin",
+    "compression",
+    "compression_level",
+    "storage",
+    "chunk_shape",
+    "threads_per_rank",
+    "ranks_per_task",
+    "output_arguments"
 ]
 
 def parseConfig(self, config):
@@ -46,7 +65,94 @@ def parseConfig(self, config):
         self.dryrun_mode = config.getboolean("blk","dryrun_mode")
 
 
-    self.cache = Cache(self.cache_dir)
+    # fold the size and modification time of any files named in a task's
+    # arguments into its hashcode, so results made from a file that has since
+    # changed are recomputed
+    if "fingerprint_inputs" in config["blk"].keys():
+        self.fingerprint_inputs = config.getboolean("blk", "fingerprint_inputs")
+
+    # also hash this many bytes sampled from each file, e.g. 64K
+    if "fingerprint_sample_bytes" in config["blk"].keys():
+        self.fingerprint_sample_bytes = parse_bytes(config["blk"]["fingerprint_sample_bytes"])
+
+    # how many worker processes to run tasks on with parallel = process
+    if "num_workers" in config["blk"].keys():
+        self.num_workers = config.getint("blk", "num_workers")
+        if self.num_workers < 1:
+            print(f"[Error] num_workers must be at least 1, got {self.num_workers}")
+            raise ValueError(self.num_workers)
+
+    # run chains of one-to-one tasks, e.g. a projection and its plot, one
+    # after the other on the same process so results are passed in memory
+    if "fuse_tasks" in config["blk"].keys():
+        self.fuse_tasks = config.getboolean("blk", "fuse_tasks")
+
+    # how task results get written to the cache, see blk/Cache/Serializers.py
+    cache_serializer = config["blk"]["cache_serializer"] \
+        if "cache_serializer" in config["blk"].keys() \
+        else DEFAULT_SERIALIZER
+
+    # the cache evicts results once it grows past this size, e.g. 500G
+    cache_max_bytes = parse_bytes(config["blk"]["cache_max_bytes"]) \
+        if "cache_max_bytes" in config["blk"].keys() \
+        else None
+
+    # how much memory each process may use to keep results it has recently
+    # loaded or saved, so they are read from the disk at most once
+    memory_cache_bytes = parse_bytes(config["blk"]["memory_cache_bytes"]) \
+        if "memory_cache_bytes" in config["blk"].keys() \
+        else DEFAULT_MEMORY_TIER_BYTES
+
+    # write results to the cache on a background thread, so the next task 
+    # can start while the last result is still being written
+    async_writes = config.getboolean("blk", "async_writes") \
+        if "async_writes" in config["blk"].keys() \
+        else False
+
+    write_queue_size = config.getint("blk", "write_queue_size") \
+        if "write_queue_size" in config["blk"].keys() \
+        else DEFAULT_WRITE_QUEUE_SIZE
+
+    # how entries are arranged in a new cache directory, flat or sharded
+    # existing cache directories keep their layout until they're migrated
+    cache_layout = config["blk"]["cache_layout"] \
+        if "cache_layout" in config["blk"].keys() \
+        else DEFAULT_LAYOUT
+
+    # a directory on node local storage, e.g. /tmp or a local SSD, to keep
+    # copies of results in so they're read from the shared cache_dir at most
+    # once per node
+    local_cache_dir = abspath(config["blk"]["local_cache_dir"]) \
+        if "local_cache_dir" in config["blk"].keys() \
+        else None
+
+    local_cache_bytes = parse_bytes(config["blk"]["local_cache_bytes"]) \
+        if "local_cache_bytes" in config["blk"].keys() \
+        else DEFAULT_LOCAL_TIER_BYTES
+
+    # write-through or write-back, see blk/Cache/LocalTier.py
+    local_cache_mode = config["blk"]["local_cache_mode"] \
+        if "local_cache_mode" in config["blk"].keys() \
+        else DEFAULT_LOCAL_TIER_MODE
+
+    # reuse the results of tasks whose dependencies gave the same results as
+    # the last time they were run, see blk/Cache/EarlyCutoff.py
+    early_cutoff = config.getboolean("blk", "early_cutoff") \
+        if "early_cutoff" in config["blk"].keys() \
+        else True
+
+    self.cache = Cache(self.cache_dir, 
+        serializer=cache_serializer, 
+        max_bytes=cache_max_bytes,
+        memory_bytes=memory_cache_bytes,
+        async_writes=async_writes,
+        write_queue_size=write_queue_size,
+        layout=cache_layout,
+        early_cutoff=early_cutoff,
+        local_directory=local_cache_dir,
+        local_bytes=local_cache_bytes,
+        local_mode=local_cache_mode,
+        maintain=self.maintain_cache)
 
     i = 1
     while f"segment {i}" in config.sections() and i < MAX_SEGMENTS: 
@@ -110,6 +216,66 @@ def parseConfig(self, config):
         if "always_run" in config[current_segment].keys():
             always_run = self.guessType(config[current_segment]["always_run"])
 
+        # pinned results are never evicted from the cache
+        pinned = False
+        if "pin" in config[current_segment].keys():
+            pinned = self.guessType(config[current_segment]["pin"])
+
+        # how this segment's results are compressed in the cache
+        compression = config[current_segment]["compression"] \
+            if "compression" in config[current_segment].keys() \
+            else NO_COMPRESSION
+        checkCompression(compression)
+        checkSerializerCompression(cache_serializer, compression)
+
+        compression_level = config.getint(current_segment, "compression_level") \
+            if "compression_level" in config[current_segment].keys() \
+            else None
+
+        # with storage = pack, all of this segment's results go into a single
+        # pack file named after the segment
+        storage = config[current_segment]["storage"] \
+            if "storage" in config[current_segment].keys() \
+            else FILES
+        checkStorage(storage)
+
+        pack = None
+        if storage == PACK:
+            pack = packName(config[current_segment]["name"] \
+                if "name" in config[current_segment].keys() \
+                else operation.__name__)
+
+        # store array results in chunks of this shape, e.g. [64, 64, 64], so
+        # downstream tasks can read a few slices without the whole array
+        chunk_shape = self.guessType(config[current_segment]["chunk_shape"]) \
+            if "chunk_shape" in config[current_segment].keys() \
+            else None
+
+        # with parallel = task, this many of the segment's tasks may run at
+        # once on each rank, e.g. for plots that mostly wait on the disk
+        threads_per_rank = config.getint(current_segment, "threads_per_rank") \
+            if "threads_per_rank" in config[current_segment].keys() \
+            else 1
+        if threads_per_rank < 1:
+            print(f"[Error] threads_per_rank must be at least 1, got {threads_per_rank} in {current_segment}")
+            raise ValueError(threads_per_rank)
+
+        # with parallel = task, run each of the segment's tasks on this many
+        # ranks at once, with yt using all of them for its parallel operations
+        ranks_per_task = config.getint(current_segment, "ranks_per_task") \
+            if "ranks_per_task" in config[current_segment].keys() \
+            else 1
+        if ranks_per_task < 1:
+            print(f"[Error] ranks_per_task must be at least 1, got {ranks_per_task} in {current_segment}")
+            raise ValueError(ranks_per_task)
+
+        # arguments naming files the operation writes, which unlike its input
+        # files aren't part of its hashcode, see blk/Tasks/Fingerprint.py
+        output_arguments = OUTPUT_ARGUMENTS
+        if "output_arguments" in config[current_segment].keys():
+            output_arguments = OUTPUT_ARGUMENTS + \
+                [a.strip() for a in config[current_segment]["output_arguments"].split(',')]
+
         dependencies_list = self.getDependencies(dependency_strategy, num_tasks)
 
         for j in range(num_tasks):
@@ -154,9 +320,21 @@ def parseConfig(self, config):
                 dependencies=dependencies_list[j],
                 save_action=save_action,
                 output_file=output_file,
-                always_run=always_run
+                always_run=always_run,
+                pinned=pinned,
+                compression=compression,
+                compression_level=compression_level,
+                pack=pack,
+                chunk_shape=chunk_shape,
+                threads_per_rank=threads_per_rank,
+                ranks_per_task=ranks_per_task,
+                output_arguments=output_arguments
             )
             self.all_tasks[i].append(new_task)
+
+            # results that were cached before the segment got pinned
+            if pinned and comm_rank == 0:
+                self.cache.pin(new_task)
         # end for j
         self.debug_mode and print(f"Segment {i+1} created with {num_tasks} tasks")
     # end for i
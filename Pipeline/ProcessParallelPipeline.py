@@ -0,0 +1,9 @@
+from blk.Pipeline import Pipeline
+
+
+class ProcessParallelPipeline(Pipeline):
+
+    from .ProcessParallelRun import run
+
+    def __init__(self, config_file):
+        super().__init__(config_file)
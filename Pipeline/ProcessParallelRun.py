@@ -0,0 +1,122 @@
+import time
+from os import getpid
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from blk.utils import format_time
+from blk.Pipeline import Pipeline
+from blk.Tasks.Fingerprint import clearFingerprints
+from .TaskGraph import TaskGraph, runUnit, reportFailures
+from .CostModel import CostModel
+
+# the pipeline each worker process builds for itself, see startWorker
+worker_graph = None
+
+# Runs the pipeline on a pool of worker processes on this machine, no MPI
+# launcher needed. Each worker builds the same pipeline from the config file,
+# so tasks are handed out by their ids, and results are handed back through
+# the cache: a worker saves its result and returns the records it added, and
+# the next worker reads them back from the manifest before it starts. A task
+# is submitted as soon as the last of its dependencies has finished.
+def run(self):
+
+    start = time.time()
+    clearFingerprints()
+
+    self.dryrun_mode and print("Performing dry run...")
+
+    # tasks are submitted in the same order as they're handed out with
+    # parallel = task, see TaskParallelRun.coordinate
+    graph = TaskGraph(self)
+    workload = graph.getWorkload()
+    graph.plan(workload, CostModel(self.cache).estimate, fuse=self.fuse_tasks)
+
+    # keep the results the remaining tasks need from being evicted
+    self.cache.protect([graph.tasks[i] for i in workload])
+
+    # the root task is run here at the end, as it is by the coordinator
+    root_ready = graph.take(graph.root)
+
+    running = {}
+    failed = []
+
+    # workers are started with spawn rather than fork, so they don't inherit
+    # the MPI state, threads or open files of this process
+    with ProcessPoolExecutor(
+        max_workers=self.num_workers,
+        mp_context=get_context("spawn"),
+        initializer=startWorker,
+        initargs=(self.config_file, workload)) as pool:
+
+        # only hand out as many tasks as there are workers, so each one
+        # reads the manifest as late as possible
+        def submitReady():
+            while graph.hasReady() and len(running) < self.num_workers:
+                index = graph.pop()
+                running[pool.submit(runInWorker, graph.unit(index))] = index
+
+        submitReady()
+        while len(running) > 0:
+
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+
+                index = running.pop(future)
+                succeeded, changes = future.result()
+                self.cache.applyChanges(changes)
+
+                if not succeeded:
+                    failed.append(index)
+                    continue
+
+                for i in graph.complete(index):
+                    if i == graph.root:
+                        root_ready = graph.take(i)
+                    else:
+                        print(f"Ready to execute: {str(graph.tasks[i])}")
+            # end for future
+
+            submitReady()
+        # end while
+    # end with
+
+    reportFailures(graph, failed)
+
+    if root_ready:
+        print(f"Running: {str(self.root_task)}")
+        self.root_task.run()
+
+    self.cache.flush()
+
+    self.runtime = format_time(time.time() - start)
+    print(f"Total runtime: {self.runtime}")
+
+    if len(failed) > 0:
+        raise RuntimeError(f"{len(failed)} tasks failed")
+
+# each worker is rank 0 of its own MPI world, so it would otherwise set up
+# and tidy the cache as if it were the only process using it, while the
+# other workers are writing to it
+# a worker evicts to make room for its own results, so it has to keep the
+# results the rest of the workload needs, just as this process does
+def startWorker(config_file, workload):
+    global worker_graph
+    pipeline = Pipeline(config_file, maintain_cache=False)
+    worker_graph = TaskGraph(pipeline)
+    pipeline.cache.protect([worker_graph.tasks[i] for i in workload])
+
+# runs a task in a worker process, along with any tasks fused onto it
+# returns whether they all succeeded and what they added to the cache
+def runInWorker(unit):
+
+    tasks = [worker_graph.tasks[i] for i in unit]
+    cache = tasks[0].cache
+
+    # pick up the results of its dependencies, saved by other workers
+    cache.refresh()
+
+    succeeded = runUnit(tasks, f"Worker {getpid()}")
+
+    # results still being written in the background have to land before
+    # the pipeline hears about them
+    cache.flush()
+    return succeeded, cache.takeChanges()
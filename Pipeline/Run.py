@@ -1,44 +1,40 @@
 import time
 from blk.utils import format_time
-from blk.constants import ITERATION_LIMIT
+from blk.Tasks.Fingerprint import clearFingerprints
+from .TaskGraph import TaskGraph
 
 def run(self):
 
     start = time.time()
+    clearFingerprints()
 
     self.dryrun_mode and print("Performing dry run...")
     self.writePipelineInfo()
 
-    execution_stack = self.root_task.getWorkload()
+    graph = TaskGraph(self)
+    workload = graph.getWorkload()
+    graph.plan(workload)
 
-    iterations = 0
-    while len(execution_stack) > 0 and iterations < ITERATION_LIMIT:
-        iterations += 1
+    # keep the results the remaining tasks need from being evicted
+    self.cache.protect([graph.tasks[i] for i in workload])
 
-        task_list = []
-        new_execution_stack = []
+    # Run each task as soon as everything it depends on has been run and
+    # saved to the cache
+    while graph.hasReady():
 
-        for task in execution_stack:
-            if task.isReady():
-                print(f"[{iterations}] Ready to execute: {str(task)}")
-                task_list.append(task)
-            else :
-                print(f"[{iterations}] Delaying execution of: {str(task)}")
-                new_execution_stack.append(task)
-        # end for task
+        index = graph.pop()
+        task = graph.tasks[index]
 
-
-        # Run the next batch of tasks and save them to the cache
         self.runtime = format_time(time.time() - start)
-        for task in task_list:
-            print(f"[{iterations}] Running: {str(task)}")
-            task.run()
-        # end for task
+        print(f"Running: {str(task)}")
+        task.run()
 
-        # update the execution stack with the remaining work
-        execution_stack = new_execution_stack
+        for i in graph.complete(index):
+            print(f"Ready to execute: {str(graph.tasks[i])}")
     # end while
 
+    self.cache.flush()
+
     self.runtime = format_time(time.time() - start)
     print(f"Total runtime: {self.runtime}")
         
\ No newline at end of file
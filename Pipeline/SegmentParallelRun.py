@@ -1,7 +1,8 @@
 import time
 from mpi4py import MPI
 from blk.utils import format_time
-from blk.constants import ITERATION_LIMIT
+from blk.Tasks.Fingerprint import clearFingerprints
+from .TaskGraph import TaskGraph
 
 def run(self):
 
@@ -11,39 +12,35 @@ def run(self):
     is_root = comm_rank == 0
 
     start = time.time()
+    clearFingerprints()
 
     self.dryrun_mode and is_root and print("Performing dry run...")
 
-    execution_stack = self.root_task.getWorkload()
+    # every process has to agree on what to run, so the root decides
+    graph = TaskGraph(self)
+    workload = graph.getWorkload() if is_root else None
+    workload = COMM.bcast(workload, root=0)
+    graph.plan(workload)
 
-    iterations = 0
-    while len(execution_stack) > 0 and iterations < ITERATION_LIMIT:
-        iterations += 1
+    # keep the results the remaining tasks need from being evicted
+    self.cache.protect([graph.tasks[i] for i in workload])
 
-        task_list = []
-        new_execution_stack = []
+    # every process works through the tasks in the same order
+    while graph.hasReady():
 
-        for task in execution_stack:
-            if task.isReady():
-                is_root and print(f"[{iterations}] Ready to execute: {str(task)}")
-                task_list.append(task)
-            else :
-                is_root and print(f"[{iterations}] Delaying execution of: {str(task)}")
-                new_execution_stack.append(task)
-        # end for task
+        index = graph.pop()
+        task = graph.tasks[index]
 
+        COMM.Barrier() # make sure every process is running on the same task
+        is_root and print(f"Running: {str(task)}")
+        task.run()
 
-        # Run the next batch of tasks and save them to the cache
-        for task in task_list:
-            COMM.Barrier() # make sure every process is running on the same task
-            is_root and print(f"[{iterations}] Running: {str(task)}")
-            task.run()
-        # end for task
-
-        # update the execution stack with the remaining work
-        execution_stack = new_execution_stack
+        for i in graph.complete(index):
+            is_root and print(f"Ready to execute: {str(graph.tasks[i])}")
     # end while
 
+    self.cache.flush()
+
     self.runtime = format_time(time.time() - start)
     print(f"Total runtime: {self.runtime}")
         
\ No newline at end of file
@@ -0,0 +1,215 @@
+import heapq, traceback
+from contextlib import nullcontext
+from blk.constants import AUTO
+from .TaskGroups import ytCommunicator
+
+class TaskGraph:
+
+    # The tasks of a pipeline as a graph, for working out what order the
+    # tasks that have to be run can be run in. Every task is given an id, its
+    # position in the pipeline, which is the same on every process since they
+    # all build the same pipeline. Each task in the workload counts how many
+    # of its dependencies are still to be run, and once that reaches 0 it
+    # joins the ready queue. Finishing a task only touches the tasks that
+    # depend on it, so planning and scheduling a run takes time in proportion
+    # to the number of tasks and dependencies (times a log for the queue).
+    #
+    # Ready tasks come out of the queue longest critical path first: the
+    # task with the most expected work between it and the end of the
+    # pipeline, counting itself, goes next. Among independent tasks that
+    # means the longest ones go first, so the short ones fill in the gaps at
+    # the end rather than a long one being left to run on its own.
+
+    def __init__(self, pipeline):
+
+        self.tasks = [task for segment in pipeline.all_tasks for task in segment]
+        self.tasks.append(pipeline.root_task)
+        self.ids = {task : i for i, task in enumerate(self.tasks)}
+        self.root = self.ids[pipeline.root_task]
+
+        # task id -> number of dependencies that haven't finished yet
+        self.waiting_on = {}
+
+        # task id -> ids of the tasks in the workload that depend on it
+        self.dependents = {}
+
+        # task id -> expected seconds of work from the start of the task to
+        # the end of the pipeline
+        self.priority = {}
+
+        # task id -> the task fused onto the end of it, see fuse
+        self.fused = {}
+        self.successors = set()
+
+        # (-priority, task id) of every task that's ready
+        self.ready = []
+
+    # returns the ids of the tasks that have to be run for the root task
+    def getWorkload(self):
+        return [self.ids[task] for task in self.tasks[self.root].getWorkload()]
+
+    # sets up the graph to run the tasks in workload, a list of ids
+    # cost gives the expected run time of a task, see CostModel.py, without
+    # it every task is expected to take as long as any other
+    # with fuse set, chains of tasks are scheduled as one, see fuse
+    def plan(self, workload, cost=None, fuse=False):
+
+        self.waiting_on = {i : 0 for i in workload}
+        self.dependents = {i : [] for i in workload}
+
+        for i in workload:
+            dependencies = self.tasks[i].dependencies
+            if dependencies is None: continue
+
+            # dependencies that aren't in the workload already have results
+            for dep in dependencies:
+                j = self.ids.get(dep)
+                if j in self.dependents:
+                    self.waiting_on[i] += 1
+                    self.dependents[j].append(i)
+
+        # put the workload in an order where every task comes after its
+        # dependencies, then work out the critical paths from the end
+        remaining = dict(self.waiting_on)
+        order = [i for i in workload if remaining[i] == 0]
+        k = 0
+        while k < len(order):
+            for j in self.dependents[order[k]]:
+                remaining[j] -= 1
+                if remaining[j] == 0:
+                    order.append(j)
+            k += 1
+
+        self.priority = {}
+        for i in reversed(order):
+            own_cost = cost(self.tasks[i]) if cost is not None else 1
+            self.priority[i] = own_cost + max((self.priority[j] for j in self.dependents[i]), default=0)
+
+        self.fused = {}
+        self.successors = set()
+        if fuse:
+            self.fuse(workload)
+
+        self.ready = []
+        for i in workload:
+            if self.waiting_on[i] == 0:
+                self.push(i)
+
+    # Fuses chains of tasks where each task is the only one in the workload
+    # waiting on the one before it, and is waiting on nothing else, e.g. a
+    # projection followed by a plot of it with a one-to-one dependency. A
+    # chain is handed out as a single unit, made up of the ids given by unit,
+    # and run on one process, so each task gets the result of the one before
+    # it straight from memory. Results are still saved to the cache as usual.
+    # Only the first task of a chain goes through the ready queue.
+    def fuse(self, workload):
+
+        for i in workload:
+            if len(self.dependents[i]) != 1: continue
+            j = self.dependents[i][0]
+
+            # the root task is always run on its own
+            if j == self.root or self.waiting_on[j] != 1: continue
+
+            # a chain runs on one thread of one rank, so its tasks have to
+            # agree on how many may share a rank
+            if self.tasks[i].threads_per_rank != self.tasks[j].threads_per_rank: continue
+
+            # only the first rank of a group saves its result, so the others
+            # would have nothing to pass down the chain
+            if self.tasks[i].ranks_per_task > 1 or self.tasks[j].ranks_per_task > 1: continue
+
+            self.fused[i] = j
+            self.successors.add(j)
+        # end for i
+
+    def push(self, i):
+        heapq.heappush(self.ready, (-self.priority[i], i))
+
+    def hasReady(self):
+        return len(self.ready) > 0
+
+    # returns the id of the next task that's ready to be run
+    def pop(self):
+        return heapq.heappop(self.ready)[1]
+
+    # takes a task that's ready out of the ready queue, for tasks that are
+    # run separately from the rest
+    def take(self, i):
+        if i not in self.priority:
+            return False
+        entry = (-self.priority[i], i)
+        if entry in self.ready:
+            self.ready.remove(entry)
+            heapq.heapify(self.ready)
+            return True
+        return False
+
+    # returns the ids of the tasks to run when task i is handed out, in the
+    # order they have to be run in
+    def unit(self, i):
+
+        unit = [i]
+        while unit[-1] in self.fused:
+            unit.append(self.fused[unit[-1]])
+        return unit
+
+    # marks a task, along with any tasks fused onto it, as finished, and
+    # returns the ids of the tasks that became ready because of it, which are
+    # added to the ready queue
+    def complete(self, i):
+
+        released = []
+        for k in self.unit(i):
+            for j in self.dependents[k]:
+                self.waiting_on[j] -= 1
+                if self.waiting_on[j] == 0 and j not in self.successors:
+                    released.append(j)
+                    self.push(j)
+
+        return released
+
+# runs the tasks of a unit, see TaskGraph.unit, one after another and returns
+# whether they all succeeded
+# label names whatever is running them in what's printed
+# tasks run by a group of ranks are given the group's communicator, comm,
+# which yt uses too, see TaskGroups.py
+def runUnit(tasks, label, comm=None):
+
+    # only the first rank of a group saves the results
+    leads = comm is None or comm.Get_rank() == 0
+
+    for k, task in enumerate(tasks):
+
+        leads and print(f"[{label}] Running: {str(task)}")
+
+        # a failed task is reported rather than left to take the other
+        # processes down with it
+        task.comm = comm
+        try:
+            with ytCommunicator(comm) if comm is not None else nullcontext():
+                task.run()
+        except Exception as e:
+            print(f"[Error] [{label}] {str(task)} failed:")
+            traceback.print_exc()
+            return False
+        finally:
+            task.comm = None
+
+        # the task before this one was only needed by this one, and its
+        # result is in the cache if anything else ever wants it
+        if k > 0 and tasks[k-1].save_action == AUTO:
+            tasks[k-1].result = None
+    # end for task
+
+    return True
+
+# prints which tasks failed, given the ids of the units that failed, see
+# TaskGraph.unit
+# a failure anywhere in a fused chain stops the rest of it, so every task in
+# the unit is named
+def reportFailures(graph, failed):
+
+    for index in failed:
+        names = ", ".join(str(graph.tasks[i]) for i in graph.unit(index))
+        print(f"[Error] {names} failed, the tasks that depend on them were not run")
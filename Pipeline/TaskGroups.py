@@ -0,0 +1,81 @@
+from mpi4py import MPI
+from contextlib import contextmanager
+
+# Tasks from segments with ranks_per_task set are run by a group of worker
+# ranks at once, so that yt can spread a single large projection or derived
+# quantity over all of them. The workers are split into groups of each size
+# the workload asks for when the run starts: with 8 workers and a segment
+# with ranks_per_task = 4, ranks 1-4 and 5-8 each get a communicator of their
+# own. A group only takes a task when every rank in it is free, and in
+# between its ranks run smaller tasks on their own.
+
+# how many worker ranks a task runs on, there can't be more than there are
+# workers
+def groupSize(task, num_workers):
+    return max(min(task.ranks_per_task, num_workers), 1)
+
+# returns the worker ranks in each group of size k
+def groupMembers(k, num_workers):
+    return [list(range(1 + g*k, 1 + (g+1)*k)) for g in range(num_workers // k)]
+
+# splits comm into the groups needed by the tasks in workload
+# returns group size -> this rank's communicator for groups of that size,
+# or MPI.COMM_NULL if this rank isn't in one
+# this is a collective operation, every rank in comm has to call it
+def splitGroups(comm, tasks, workload):
+
+    comm_rank = comm.Get_rank()
+    num_workers = comm.Get_size() - 1
+
+    sizes = sorted({groupSize(tasks[i], num_workers) for i in workload} - {1})
+
+    group_comms = {}
+    for k in sizes:
+        group = (comm_rank - 1) // k
+        color = group if comm_rank > 0 and group < num_workers // k else MPI.UNDEFINED
+        group_comms[k] = comm.Split(color, comm_rank)
+
+    return group_comms
+
+def freeGroups(group_comms):
+    for group_comm in group_comms.values():
+        yt_communicators.pop(id(group_comm), None)
+        if group_comm != MPI.COMM_NULL:
+            group_comm.Free()
+
+# id of a group communicator -> the communicator yt made from it
+yt_communicators = {}
+
+# makes yt do whatever it does in parallel across the ranks in comm, rather
+# than every rank in the pipeline, while a task runs
+# the first task a group runs turns on yt's parallelism for it, which gives
+# yt a copy of comm that the group's later tasks use as well
+# without yt, or with a yt that can't run in parallel or keeps its
+# communicators somewhere else, tasks are run as they are, and can still use
+# comm themselves
+@contextmanager
+def ytCommunicator(comm):
+
+    try:
+        import yt
+        from yt.utilities.parallel_tools.parallel_analysis_interface import communication_system
+    except ImportError as e:
+        yield
+        return
+
+    if id(comm) not in yt_communicators:
+        if not yt.enable_parallelism(suppress_logging=True, communicator=comm):
+            yield
+            return
+        try:
+            yt_communicators[id(comm)] = communication_system.communicators[-1]
+        except (AttributeError, IndexError, TypeError) as e:
+            yield
+            return
+    else:
+        communication_system.push(yt_communicators[id(comm)])
+
+    try:
+        yield
+    finally:
+        communication_system.pop()
@@ -1,65 +1,318 @@
-
 from mpi4py import MPI
-import time
+import time, queue
+from concurrent.futures import ThreadPoolExecutor
 from blk.utils import format_time
-from blk.constants import ITERATION_LIMIT
+from blk.Tasks.Fingerprint import clearFingerprints
+from .TaskGraph import TaskGraph, runUnit, reportFailures
+from .CostModel import CostModel
+from .TaskGroups import groupSize, groupMembers, splitGroups, freeGroups
+
+# message tags, see run
+REPORT_TAG = 1
+TASK_TAG = 2
+STOP_TAG = 3
+
+# how long a worker with tasks running on threads waits for one of them to
+# finish before checking for new work, in seconds
+POLL_INTERVAL = 0.01
 
+# Rank 0 coordinates and every other rank works. The coordinator hands out
+# ready tasks to workers with room for them. A worker reports each task once
+# it has run, so it can be given more work while the result is still being
+# written, and again once the result has landed, along with whatever it added
+# to the cache. The coordinator releases the tasks waiting on that one
+# straight away and hands out the next ready task, so no rank waits for the
+# others to finish a round before starting on something else. With a single
+# rank it runs everything itself.
+#
+# A rank normally runs one task at a time, but segments with threads_per_rank
+# set let that many of their tasks share a rank, each on its own thread, and
+# segments with ranks_per_task set run each of their tasks on a group of that
+# many ranks at once, see TaskGroups.py.
 def run(self):
 
     COMM = MPI.COMM_WORLD
     comm_size = COMM.Get_size()
     comm_rank = COMM.Get_rank()
     is_root = comm_rank == 0
-    
+
     start = time.time()
+    clearFingerprints()
 
     self.dryrun_mode and is_root and print("Performing dry run...")
 
-    execution_stack = None
-    task_list = None
-    execution_stack_size = 0
-    
-    execution_stack = self.root_task.getWorkload()
-    execution_stack_size = len(execution_stack)
-    
-    iterations = 0
-    while execution_stack_size > 0 and iterations < ITERATION_LIMIT:
-        
-        iterations += 1
-
-        task_list = []
-        new_execution_stack = []
-        proc = 0
-
-        self.cache.update()
-
-        for task in execution_stack:
-            if task.isReady() :
-                if self.dryrun_mode:
-                    task.dryrun_passthrough = True
-                if proc == comm_rank:
-                    print(f"[{iterations}][Rank {comm_rank}] Ready to execute: {str(task)}")
-
-                    # assign tasks with round robin
-                    task_list.append(task)
-                proc = proc+1 if proc+1 < comm_size else 0
-            else :
-                is_root and print(f"[{iterations}][Rank {comm_rank}] Delaying execution of: {str(task)}")
-                new_execution_stack.append(task)
-        # end for task
-
-        COMM.Barrier()
-        # Run the next batch of tasks and save them to the cache
-        for task in task_list:
-            print(f"[{iterations}][Rank {comm_rank}] Running: {str(task)}")
-            task.run()
-        # end for task
-        COMM.Barrier()
-
-        execution_stack = new_execution_stack
-        execution_stack_size = len(execution_stack)
+    # every rank builds the same pipeline, so tasks can be passed around by
+    # their ids, see TaskGraph.py
+    graph = TaskGraph(self)
 
-    # end while
+    # the coordinator decides what has to be run
+    workload = graph.getWorkload() if is_root else None
+    workload = COMM.bcast(workload, root=0)
+
+    # keep the results the remaining tasks need from being evicted
+    self.cache.protect([graph.tasks[i] for i in workload])
+
+    failed = []
+    if comm_size == 1:
+        runLocally(self, graph, workload)
+    else:
+        group_comms = splitGroups(COMM, graph.tasks, workload)
+        if is_root:
+            failed = coordinate(self, COMM, graph, workload)
+        else:
+            work(self, COMM, graph, workload, group_comms)
+        freeGroups(group_comms)
+
+    self.cache.flush()
 
     self.runtime = format_time(time.time() - start)
-    is_root and print(f"Total runtime: {self.runtime}")
\ No newline at end of file
+    is_root and print(f"Total runtime: {self.runtime}")
+
+    # the workers have all been stopped by now, so the run can be failed
+    # without leaving any of them waiting
+    if len(failed) > 0:
+        raise RuntimeError(f"{len(failed)} tasks failed")
+
+def runLocally(self, graph, workload):
+
+    graph.plan(workload)
+    while graph.hasReady():
+        index = graph.pop()
+        print(f"[Rank 0] Running: {str(graph.tasks[index])}")
+        graph.tasks[index].run()
+        graph.complete(index)
+
+def coordinate(self, COMM, graph, workload):
+
+    comm_size = COMM.Get_size()
+
+    # the longest tasks, and the ones with the most work waiting on them, are
+    # handed out first, and chains of tasks are handed out whole, see
+    # TaskGraph.py
+    graph.plan(workload, CostModel(self.cache).estimate, fuse=self.fuse_tasks)
+
+    # the root task finishes the pipeline off, so it's run here once
+    # everything else is done
+    root_ready = graph.take(graph.root)
+
+    # everything the workers have added to the cache, in the order they
+    # reported it, and how much of it each worker has been sent
+    changes = []
+    sent = [0] * comm_size
+
+    # the tasks running on each worker, the workers with nothing running and
+    # the workers running tasks that have room for more
+    # idle workers are taken from the end, so that tasks run on their own
+    # leave the groups at the start free for as long as possible
+    running = {worker : set() for worker in range(1, comm_size)}
+    idle = list(range(1, comm_size))
+    shared = set()
+
+    # the workers in each group of each size, see TaskGroups.py
+    num_workers = comm_size - 1
+    groups = {}
+    for i in workload:
+        k = groupSize(graph.tasks[i], num_workers)
+        if k > 1 and k not in groups:
+            groups[k] = groupMembers(k, num_workers)
+
+    # task id -> number of workers still running it, and whether they all
+    # succeeded so far
+    members_left = {}
+    succeeded_so_far = {}
+
+    busy = 0
+    failed = []
+    status = MPI.Status()
+
+    # whether a task can run on the same rank as others
+    def shares(task):
+        return task.threads_per_rank > 1 and groupSize(task, num_workers) == 1
+
+    # how many tasks a worker may run at once, given what it's running
+    def capacity(worker):
+        return min(graph.tasks[i].threads_per_rank if shares(graph.tasks[i]) else 1
+            for i in running[worker])
+
+    def updateShared(worker):
+        if 0 < len(running[worker]) < capacity(worker):
+            shared.add(worker)
+        else:
+            shared.discard(worker)
+
+    # returns the workers to run a task on, or None if there aren't enough
+    # free
+    # threaded tasks go to workers already running tasks like them before
+    # taking up an idle worker, and a group of workers has to be idle as a
+    # whole to take a task
+    def findWorkers(task):
+
+        k = groupSize(task, num_workers)
+        if k > 1:
+            for members in groups[k]:
+                if all(len(running[worker]) == 0 for worker in members):
+                    for worker in members:
+                        idle.remove(worker)
+                    return members
+            return None
+
+        if shares(task):
+            for worker in shared:
+                if len(running[worker]) < task.threads_per_rank:
+                    return [worker]
+        if len(idle) > 0:
+            return [idle.pop()]
+        return None
+
+    while True:
+
+        # workers are sent the results their task depends on along with it
+        # a task there's no room for yet, e.g. one that needs a whole group
+        # of idle workers, is set aside so the tasks behind it can still go
+        blocked = []
+        while graph.hasReady() and (len(idle) > 0 or len(shared) > 0):
+
+            index = graph.pop()
+            workers = findWorkers(graph.tasks[index])
+            if workers is None:
+                blocked.append(index)
+                continue
+
+            unit = graph.unit(index)
+            for worker in workers:
+                COMM.send((unit, changes[sent[worker]:]), dest=worker, tag=TASK_TAG)
+                sent[worker] = len(changes)
+
+                running[worker].add(index)
+                updateShared(worker)
+                busy += 1
+
+            members_left[index] = len(workers)
+            succeeded_so_far[index] = True
+        # end while
+
+        for index in blocked:
+            graph.push(index)
+
+        # nothing left running, so nothing else can become ready either
+        if busy == 0: break
+
+        computed, written, worker_changes = COMM.recv(source=MPI.ANY_SOURCE, tag=REPORT_TAG, status=status)
+        worker = status.Get_source()
+
+        self.cache.applyChanges(worker_changes)
+        changes.append(worker_changes)
+
+        # the worker has room for more as soon as a task has run
+        for index in computed:
+            running[worker].discard(index)
+
+        # but the tasks waiting on it have to wait for its result to land
+        for index, succeeded in written:
+
+            busy -= 1
+
+            # a task run by a group is done once every rank in it is
+            members_left[index] -= 1
+            succeeded_so_far[index] = succeeded_so_far[index] and succeeded
+            if members_left[index] > 0: continue
+
+            if not succeeded_so_far.pop(index):
+                failed.append(index)
+                continue
+
+            for i in graph.complete(index):
+                if i == graph.root:
+                    root_ready = graph.take(i)
+                else:
+                    print(f"[Rank 0] Ready to execute: {str(graph.tasks[i])}")
+        # end for index
+
+        if len(computed) > 0 and len(running[worker]) == 0:
+            idle.append(worker)
+        updateShared(worker)
+    # end while
+
+    for worker in range(1, comm_size):
+        COMM.send((None, []), dest=worker, tag=STOP_TAG)
+
+    reportFailures(graph, failed)
+
+    if root_ready:
+        print(f"[Rank 0] Running: {str(self.root_task)}")
+        self.root_task.run()
+
+    return failed
+
+def work(self, COMM, graph, workload, group_comms):
+
+    comm_rank = COMM.Get_rank()
+    num_workers = COMM.Get_size() - 1
+    status = MPI.Status()
+
+    # (task id, whether it succeeded, whether its result has landed) for
+    # every task that has run or been written but hasn't been reported yet,
+    # see runUnit
+    finished = queue.Queue()
+    running = 0
+
+    # tasks that share the rank run on these threads, the rest are run here
+    threads = max([graph.tasks[i].threads_per_rank for i in workload], default=1)
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="blk-task") \
+        if threads > 1 else None
+
+    while True:
+
+        if running > 0 and not COMM.Iprobe(source=0, tag=MPI.ANY_TAG):
+
+            # nothing new from the coordinator, so wait a moment for a task
+            # to finish
+            try:
+                events = [finished.get(timeout=POLL_INTERVAL)]
+            except queue.Empty as e:
+                continue
+            while not finished.empty():
+                events.append(finished.get_nowait())
+
+            computed = [index for index, succeeded, written in events if not written]
+            done = [(index, succeeded) for index, succeeded, written in events if written]
+            running -= len(done)
+
+            COMM.send((computed, done, self.cache.takeChanges()), dest=0, tag=REPORT_TAG)
+            continue
+
+        unit, changes = COMM.recv(source=0, tag=MPI.ANY_TAG, status=status)
+        if status.Get_tag() == STOP_TAG: break
+
+        for change in changes:
+            self.cache.applyChanges(change)
+
+        tasks = [graph.tasks[i] for i in unit]
+        k = groupSize(tasks[0], num_workers)
+        running += 1
+        if k > 1:
+            runOnWorker(tasks, unit[0], comm_rank, finished, group_comms[k])
+        elif tasks[0].threads_per_rank > 1:
+            pool.submit(runOnWorker, tasks, unit[0], comm_rank, finished)
+        else:
+            runOnWorker(tasks, unit[0], comm_rank, finished)
+    # end while
+
+    if pool is not None:
+        pool.shutdown()
+
+# runs a task on a worker, along with any tasks fused onto it, and queues up
+# whether they all succeeded under the first task's id
+# a result that couldn't be written counts as a failure
+def runOnWorker(tasks, index, comm_rank, finished, comm=None):
+
+    succeeded = runUnit(tasks, f"Rank {comm_rank}", comm)
+
+    # the rank is free as soon as the tasks have run, but they only count as
+    # done once their results have been written, which may happen in the
+    # background while the rank gets on with something else
+    # only the first rank of a group has results to check
+    leads = comm is None or comm.Get_rank() == 0
+    finished.put((index, succeeded, False))
+    tasks[0].cache.afterWrites(lambda: finished.put(
+        (index, succeeded and (not leads or all(task.resultExists() for task in tasks)), True)))
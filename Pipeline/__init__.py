@@ -1,4 +1,7 @@
 from configparser import ConfigParser, ExtendedInterpolation
+from os import cpu_count
+
+from blk.Tasks.Fingerprint import DEFAULT_FINGERPRINT_SAMPLE_BYTES, clearFingerprints
 
 class Pipeline:
 
@@ -7,7 +10,9 @@ class Pipeline:
     from .WritePipelineInfo import writePipelineInfo
     from .GetDependencies import getDependencies
 
-    def __init__(self, config_file):
+    # with maintain_cache off, the cache is opened without being set up or
+    # tidied, see Cache.setDirectory
+    def __init__(self, config_file, maintain_cache=True):
 
         config = ConfigParser(
         allow_no_value=True, 
@@ -26,11 +31,24 @@ class Pipeline:
         self.debug_mode = False
         self.dryrun_mode = False
 
+        # see blk/Tasks/Fingerprint.py
+        self.fingerprint_inputs = True
+        self.fingerprint_sample_bytes = DEFAULT_FINGERPRINT_SAMPLE_BYTES
+
+        # see blk/Pipeline/ProcessParallelRun.py
+        self.num_workers = cpu_count()
+
+        # see TaskGraph.fuse in blk/Pipeline/TaskGraph.py
+        self.fuse_tasks = True
+
         self.cache = None
+        self.maintain_cache = maintain_cache
         self.num_segments = 0
         self.root_task = None
         self.run_time = None
 
+        # input files may have changed since the last pipeline was built
+        clearFingerprints()
         self.parseConfig(config)
 
 
@@ -0,0 +1,111 @@
+import inspect, types
+import numpy as np
+
+# values referenced by an operation that count as data, and so go into its
+# hashcode by value
+CONSTANT_TYPES = (
+    type(None), bool, int, float, complex, str, bytes,
+    tuple, list, dict, set, frozenset, np.ndarray, np.generic
+)
+
+# whether obj was defined in blk or in the module the operation came from
+def inScope(obj, modules):
+
+    if isinstance(obj, types.ModuleType):
+        module = obj.__name__
+    else:
+        module = getattr(obj, "__module__", None)
+
+    if module is None:
+        return False
+
+    return module in modules or module == "blk" or module.startswith("blk.")
+
+# every global name used by a code object, including the ones used by any
+# functions, lambdas or comprehensions defined inside it
+def referencedNames(code):
+
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= referencedNames(const)
+    return names
+
+# Finds everything an operation depends on that could change its results
+# without its own source changing: the functions it calls, the functions
+# those call and so on, along with the classes and constants they use. Only
+# things defined in blk or in the operation's own module are followed, so
+# changes to numpy or yt don't throw the whole cache away.
+#
+# Returns a dict of qualified name -> (function, class or constant). The
+# operation itself is included.
+def collectCodeDependencies(operation):
+
+    modules = {getattr(operation, "__module__", None)}
+
+    found = {}
+    stack = [operation]
+    while len(stack) > 0:
+
+        func = stack.pop()
+        name = qualifiedName(func)
+        if name in found: continue
+        found[name] = func
+
+        code = getattr(func, "__code__", None)
+        func_globals = getattr(func, "__globals__", None)
+        if code is None or func_globals is None: continue
+
+        names = referencedNames(code)
+        for global_name in names:
+
+            if global_name not in func_globals: continue
+            value = func_globals[global_name]
+
+            # module.attribute, e.g. constants.ENZO_FIELDS
+            if isinstance(value, types.ModuleType):
+                if not inScope(value, modules): continue
+                for attr in names:
+                    if hasattr(value, attr):
+                        visit(getattr(value, attr), f"{value.__name__}.{attr}", modules, found, stack)
+                continue
+
+            visit(value, f"{func.__module__}.{global_name}", modules, found, stack)
+        # end for global_name
+    # end while
+
+    return found
+
+def visit(value, name, modules, found, stack):
+
+    if isinstance(value, types.FunctionType):
+        if inScope(value, modules):
+            stack.append(value)
+    elif inspect.isclass(value):
+        if inScope(value, modules):
+            found.setdefault(qualifiedName(value), value)
+    elif isinstance(value, CONSTANT_TYPES):
+        found.setdefault(name, value)
+
+        # including the functions and classes held by it, e.g. a registry
+        # like OPS = {"op" : op}
+        for item in containedValues(value):
+            if isinstance(item, types.FunctionType) or inspect.isclass(item):
+                visit(item, qualifiedName(item), modules, found, stack)
+
+# everything held by a constant, however deeply
+def containedValues(value):
+
+    if isinstance(value, (tuple, list, set, frozenset)):
+        items = value
+    elif isinstance(value, dict):
+        items = list(value.keys()) + list(value.values())
+    else:
+        return
+
+    for item in items:
+        yield item
+        yield from containedValues(item)
+
+def qualifiedName(obj):
+    return f"{getattr(obj, '__module__', None)}.{getattr(obj, '__qualname__', repr(obj))}"
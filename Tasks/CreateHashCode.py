@@ -1,30 +1,197 @@
 import inspect, hashlib
+import numpy as np
 
+from blk.constants import MANUAL
+from .Fingerprint import fingerprintArguments, DEFAULT_FINGERPRINT_SAMPLE_BYTES
+from .CodeDependencies import collectCodeDependencies, qualifiedName, CONSTANT_TYPES
+
+# size of the digests used as hashcodes, in bytes
+HASHCODE_DIGEST_SIZE = 16
+
+# digest of the source code of each function, and of each operation along
+# with everything it depends on, so that each is only worked out once per run
+# no matter how many tasks use it
+source_digests = {}
+code_digests = {}
+
+# A task's hashcode covers its operation's source, the arguments it's called
+# with and the hashcodes of its dependencies, which in turn cover theirs. A
+# change anywhere upstream of a task therefore changes its hashcode, and only
+# the tasks downstream of a change have to be run again.
 def createHashCode(self):
 
-    # get the source code of the operation
-    source = inspect.getsource(self.operation)
-
-    def remove_all_whitespace(str):
-        ws_chars = [' ', '\t', '\n']
-        for char in ws_chars:
-            str = str.replace(char, '')
-        return str
-
-    def append_args(target, args):
-        for a in args.values():
-            target += str(a)
-        return target
-
-    # scrap the whitespace to prevent unnecessary 
-    # re-queries
-    source_no_ws = remove_all_whitespace(source)
-
-    # concatenate it with the arguments
-    target = append_args(source_no_ws, self.arguments)
-    
-    # convert string to a hash
-    hash = hashlib.md5(target.encode()).hexdigest()
+    hasher = hashlib.blake2b(digest_size=HASHCODE_DIGEST_SIZE)
+
+    # the operation's source, then the arguments it's called with
+    hasher.update(digestSource(self.operation))
+    encodeValue(self.arguments, hasher.update)
+
+    # along with the contents of any files they name, see Fingerprint.py
+    if getattr(self.pipeline, "fingerprint_inputs", True):
+        fingerprintArguments(self.arguments, hasher.update,
+            getattr(self.pipeline, "fingerprint_sample_bytes", DEFAULT_FINGERPRINT_SAMPLE_BYTES),
+            self.output_arguments)
+
+    # the hashcode without the dependencies, see blk/Cache/EarlyCutoff.py
+    self.base_hashcode = hasher.copy().hexdigest()
+
+    # then whatever it's given by its dependencies
+    # operations with several dependencies get their results by name
+    if self.dependencies is not None:
+        if len(self.dependencies) > 1:
+            encodeValue([(d.name, d.hashcode) for d in self.dependencies], hasher.update)
+        else:
+            encodeValue([d.hashcode for d in self.dependencies], hasher.update)
+
+    # convert to a hash
+    hash = hasher.hexdigest()
     self.hashcode = hash
-    self.output_file = hash
-    return hash
\ No newline at end of file
+    if self.save_action != MANUAL:
+        self.output_file = hash
+    return hash
+
+
+# digest of a task's arguments alone, used to tell apart results of the same
+# operation in the cache manifest
+def digestArguments(arguments):
+
+    hasher = hashlib.blake2b(digest_size=HASHCODE_DIGEST_SIZE)
+    encodeValue(arguments, hasher.update)
+    return hasher.hexdigest()
+
+
+# digest of an operation's source, along with the source of the helper
+# functions and classes and the values of the constants it uses from blk and
+# its own module, see CodeDependencies.py
+def digestSource(operation):
+
+    if operation in code_digests:
+        return code_digests[operation]
+
+    hasher = hashlib.blake2b(digest_size=HASHCODE_DIGEST_SIZE)
+    for name, value in sorted(collectCodeDependencies(operation).items(), key=lambda kv: kv[0]):
+        encodeBytes(b"n", name.encode(), hasher.update)
+        # functions held by constants, e.g. a registry like OPS = {"op" : op},
+        # are followed by collectCodeDependencies, so they're written by
+        # name here, which also keeps an operation in its own registry from
+        # being digested over and over
+        if isinstance(value, CONSTANT_TYPES):
+            encodeValue(value, hasher.update, digestName)
+        else:
+            hasher.update(digestOwnSource(value))
+
+    digest = hasher.digest()
+    code_digests[operation] = digest
+    return digest
+
+def digestName(operation):
+    return qualifiedName(operation).encode()
+
+def digestOwnSource(operation):
+
+    if operation in source_digests:
+        return source_digests[operation]
+
+    try:
+        source = inspect.getsource(operation)
+    except (OSError, TypeError) as e:
+        # built in functions and the like have no source to read, but their
+        # names are good enough
+        source = f"{getattr(operation, '__module__', None)}.{getattr(operation, '__qualname__', repr(operation))}"
+
+    # scrap the whitespace to prevent unnecessary re-queries
+    for char in [' ', '\t', '\n']:
+        source = source.replace(char, '')
+
+    digest = hashlib.blake2b(source.encode(), digest_size=HASHCODE_DIGEST_SIZE).digest()
+    source_digests[operation] = digest
+    return digest
+
+
+# Writes a canonical encoding of value, so that two values get the same
+# encoding only when they are the same type and hold the same data. Every
+# value is tagged with its type, a different tag for each type, and
+# containers with their lengths, so that e.g. [1, 2] and "[1, 2]" or
+# ["ab", "c"] and ["a", "bc"] never collide. Floats are written exactly, dicts
+# and sets are written in a fixed order, and arrays are written by content
+# rather than by their (truncated) repr.
+# Callables are written as digest(callable), their source digest by default.
+def encodeValue(value, write, digest=digestSource):
+
+    if value is None:
+        write(b"N")
+
+    # bools are ints too, so check for them first
+    elif isinstance(value, (bool, np.bool_)):
+        write(b"T" if value else b"F")
+
+    elif isinstance(value, (int, np.integer)):
+        write(b"i%d;" % int(value))
+
+    elif isinstance(value, (float, np.floating)):
+        write(b"f" + float(value).hex().encode() + b";")
+
+    elif isinstance(value, (complex, np.complexfloating)):
+        write(b"c" + float(value.real).hex().encode() + b"," + float(value.imag).hex().encode() + b";")
+
+    elif isinstance(value, str):
+        encodeBytes(b"s", value.encode(), write)
+
+    elif isinstance(value, (bytes, bytearray)):
+        encodeBytes(b"b", bytes(value), write)
+
+    elif isinstance(value, np.ndarray):
+        encodeArray(value, write, digest)
+
+    elif isinstance(value, (list, tuple)):
+        write(b"%s%d;" % (b"l" if isinstance(value, list) else b"t", len(value)))
+        for v in value:
+            encodeValue(v, write, digest)
+
+    elif isinstance(value, dict):
+        write(b"d%d;" % len(value))
+        for k, v in sorted(((encodeToBytes(k, digest), v) for k, v in value.items()), key=lambda kv: kv[0]):
+            write(k)
+            encodeValue(v, write, digest)
+
+    elif isinstance(value, (set, frozenset)):
+        write(b"S%d;" % len(value))
+        for v in sorted(encodeToBytes(v, digest) for v in value):
+            write(v)
+
+    # e.g. functions from the operations module given as arguments
+    elif callable(value):
+        write(b"C" + digest(value))
+
+    else:
+        # the default repr holds the object's address, which changes from run
+        # to run, so only the type is used for those
+        value_repr = repr(value)
+        if " at 0x" in value_repr:
+            value_repr = ""
+        encodeBytes(b"o", f"{type(value).__module__}.{type(value).__qualname__}:{value_repr}".encode(), write)
+
+def encodeBytes(tag, data, write):
+    write(b"%s%d:" % (tag, len(data)))
+    write(data)
+
+def encodeArray(arr, write, digest=digestSource):
+
+    # arrays with units, e.g. from yt, aren't equal to the same numbers in
+    # other units
+    units = getattr(arr, "units", None)
+    if units is not None:
+        encodeBytes(b"u", str(units).encode(), write)
+
+    if arr.dtype.hasobject:
+        write(b"A" + str(arr.shape).encode())
+        encodeValue(arr.tolist(), write, digest)
+        return
+
+    write(b"a" + str(np.lib.format.dtype_to_descr(arr.dtype)).encode() + str(arr.shape).encode() + b";")
+    write(np.ascontiguousarray(arr).reshape(-1).view(np.uint8))
+
+def encodeToBytes(value, digest=digestSource):
+    parts = []
+    encodeValue(value, parts.append, digest)
+    return b"".join(parts)
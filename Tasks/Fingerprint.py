@@ -0,0 +1,101 @@
+import os, hashlib
+from os.path import abspath, basename, dirname
+from stat import S_ISREG
+
+# arguments that name files a task writes rather than reads, for the
+# operations that come with blk, segments can add to these with
+# output_arguments
+OUTPUT_ARGUMENTS = ["output_file", "plot_filename"]
+
+# how much of each input file goes into its fingerprint by default, 0 means
+# only its size and modification time are used
+DEFAULT_FINGERPRINT_SAMPLE_BYTES = 0
+
+# (path, sample bytes) -> fingerprint, each file is only looked at once per
+# run, see clearFingerprints
+fingerprints = {}
+
+# files may change between runs, e.g. in a notebook session that builds and
+# runs several pipelines, so the pipeline starts each build and run afresh
+def clearFingerprints():
+    fingerprints.clear()
+
+# Writes the fingerprint of every file named by a string in arguments, so
+# that a task's hashcode changes when one of its input files does, e.g. when
+# a simulation output is regenerated. Strings that don't name an existing
+# file are left out, and so are directories, since a task may well write
+# into a directory it's given. So are the files named by output_arguments,
+# which the task writes, and which would otherwise change its hashcode every
+# time it's run.
+def fingerprintArguments(arguments, write, sample_bytes=DEFAULT_FINGERPRINT_SAMPLE_BYTES,
+        output_arguments=OUTPUT_ARGUMENTS):
+
+    for key in sorted(arguments.keys()):
+        if key in output_arguments: continue
+        for path in findPaths(arguments[key]):
+            fingerprint = fingerprintPath(path, sample_bytes)
+            if fingerprint is not None:
+                write(key.encode() + b"=" + fingerprint)
+
+def findPaths(value):
+
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from findPaths(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from findPaths(v)
+
+# The fingerprint of a file is its size and modification time, plus those of
+# its siblings that share its name as a prefix. Enzo datasets are a parameter
+# file, e.g. RD0042/RD0042, next to RD0042.hierarchy, RD0042.cpu0000 and so on,
+# so a dataset given by its parameter file covers all of its data.
+# With sample_bytes, a digest of that many bytes from the start, middle and
+# end of the file is added as well, for file systems where the modification
+# time can't be trusted.
+def fingerprintPath(path, sample_bytes=DEFAULT_FINGERPRINT_SAMPLE_BYTES):
+
+    # most strings aren't paths, so don't bother turning them into one
+    if len(path) == 0 or '\0' in path:
+        return None
+
+    memo_key = (path, sample_bytes)
+    if memo_key in fingerprints:
+        return fingerprints[memo_key]
+
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError) as e:
+        fingerprints[memo_key] = None
+        return None
+
+    if not S_ISREG(stat.st_mode):
+        fingerprints[memo_key] = None
+        return None
+
+    path = abspath(path)
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+
+    prefix = basename(path) + "."
+    siblings = []
+    with os.scandir(dirname(path)) as it:
+        for entry in it:
+            if entry.name.startswith(prefix) and entry.is_file():
+                sibling_stat = entry.stat()
+                siblings.append(f"{entry.name}:{sibling_stat.st_size}:{sibling_stat.st_mtime_ns};")
+
+    for sibling in sorted(siblings):
+        hasher.update(sibling.encode())
+
+    if sample_bytes > 0:
+        with open(path, 'rb') as f:
+            for offset in sorted({0, max(stat.st_size//2 - sample_bytes//2, 0), max(stat.st_size - sample_bytes, 0)}):
+                f.seek(offset)
+                hasher.update(f.read(sample_bytes))
+
+    fingerprint = hasher.digest()
+    fingerprints[memo_key] = fingerprint
+    return fingerprint
@@ -1,26 +1,21 @@
-
-from blk.constants import ITERATION_LIMIT
+from collections import deque
 
 def getWorkload(self):
 
-    traversal_queue = []
-    execution_stack = []
-
     # We always assume we are running the root node in the tree
-    execution_stack.append(self)
+    execution_stack = [self]
+    visited = {self}
 
     # initialize the traversal queue to find any dependencies that
     # need to be run
-    traversal_queue.append(self)
+    traversal_queue = deque([self])
 
     # Do a breadth-first traversal to add all incomplete
     # stages to the execution stack
-    iterations = 0
-    while len(traversal_queue) > 0 and iterations < ITERATION_LIMIT:
-        iterations += 1
+    # every task is looked at once, no matter how many tasks depend on it
+    while len(traversal_queue) > 0:
 
-        current_stage = traversal_queue[0]
-        traversal_queue.remove(current_stage)
+        current_stage = traversal_queue.popleft()
 
         # if this task has any dependencies, add them to the traversal queue
         # unless they have results in the cache
@@ -29,14 +24,15 @@ def getWorkload(self):
         for task in current_stage.dependencies:
 
             # If the task has been added by a previous task, skip it
-            if task in execution_stack:
+            if task in visited:
                 continue
+            visited.add(task)
 
             if task.mustBeRun():
                 traversal_queue.append(task)
                 execution_stack.append(task)
-                
-        
-    # end while 
 
-    return execution_stack
\ No newline at end of file
+
+    # end while
+
+    return execution_stack
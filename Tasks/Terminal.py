@@ -4,6 +4,9 @@ from blk.constants import MANUAL
 
 
 def finalize(args, pipeline=None):
+
+    # make sure every result has reached the disk before the pipeline ends
+    pipeline.cache.flush()
     pipeline.writePipelineInfo()
 
 class Terminal(Task):
@@ -1,7 +1,8 @@
 
-from blk.constants import AUTO, MANUAL
-from os.path import exists
+from blk.constants import AUTO, MANUAL, NO_COMPRESSION
+from .Fingerprint import OUTPUT_ARGUMENTS
 from sys import exit
+import time
 
 def do_nothing():
     pass
@@ -28,7 +29,15 @@ class Task:
         dependencies=None, 
         save_action=AUTO,
         output_file=None,
-        always_run=False ):
+        always_run=False,
+        pinned=False,
+        compression=NO_COMPRESSION,
+        compression_level=None,
+        pack=None,
+        chunk_shape=None,
+        threads_per_rank=1,
+        ranks_per_task=1,
+        output_arguments=OUTPUT_ARGUMENTS ):
 
         if name == None:
             if index != None:
@@ -66,30 +75,60 @@ class Task:
         # otherwise, initialize with an empty dict
         elif arguments == None:
             self.arguments = {}
+        else:
+            self.arguments = arguments
 
         self.operation = operation
         self.index = index
         self.save_action = save_action
         
         self.always_run = always_run
+        self.pinned = pinned
+        self.compression = compression
+        self.compression_level = compression_level
+
+        # the pack file this task's result is stored in, if any, see
+        # blk/Cache/Pack.py
+        self.pack = pack
+
+        # array results are stored in chunks of this shape, so parts of them
+        # can be read on their own with Cache.loadRegion
+        self.chunk_shape = chunk_shape
+
+        # how many tasks like this one may run at once on the same rank in a
+        # task parallel pipeline, each on its own thread
+        self.threads_per_rank = threads_per_rank
+
+        # how many ranks run this task together in a task parallel pipeline,
+        # and the communicator joining them while they do
+        self.ranks_per_task = ranks_per_task
+        self.comm = None
         self.result = None
 
+        # arguments naming files the operation writes, which are left out of
+        # the task's hashcode, see Fingerprint.py
+        self.output_arguments = output_arguments
+
+        # how long the operation took the last time this task was run
+        self.compute_time = None
+
         self.dryrun_passthrough = False
 
         # Handle setting the hashcode and the output_file 
         self.hashcode = None
+        self.base_hashcode = None
         self.output_file = None
 
-        if save_action == AUTO and len(self.arguments.keys()) > 0: 
-            self.createHashCode()
-
-
         if self.save_action == MANUAL:
             if 'output_file' in self.arguments:
                 self.output_file = arguments["output_file"]
             else:
                 self.output_file = "blk_default.out"
 
+        # manual tasks get a hashcode too, so the cache can tell whether
+        # their output file was made from the current inputs
+        self.createHashCode()
+
         self.widget_list = {}
 
     def __str__(self):
@@ -140,7 +179,16 @@ Output File: {self.output_file}"""
         if self.save_action == MANUAL and "output_file" in kwargs:
             self.output_file = kwargs["output_file"]
 
-        self.save_action == AUTO and self.createHashCode()
+        self.createHashCode()
+
+        # the hashcodes of the tasks downstream of this one depend on its
+        # hashcode, segments are in dependency order so they can be redone
+        # one after another
+        if self.pipeline != None:
+            for segment in self.pipeline.all_tasks:
+                for task in segment:
+                    if task.dependencies is not None and task is not self:
+                        task.createHashCode()
 
     # Figure out if this task needs to be run or not
     # A task needs to be run if
@@ -168,10 +216,8 @@ Output File: {self.output_file}"""
         if self.pipeline != None and self.pipeline.dryrun_mode:
             return self.dryrun_passthrough
 
-        if self.save_action == AUTO:
+        if self.save_action in (AUTO, MANUAL):
             return self.cache.hasResultFor(self)
-        elif self.save_action == MANUAL:
-            return exists(self.output_file)
         else :
             print(f"[Error] task.save_action = {self.save_action}. Check your config file")
             exit()
@@ -205,6 +251,22 @@ Output File: {self.output_file}"""
             self.dryrun_passthrough = True
             return 
 
+        # when several ranks run this task together, the first one saves the
+        # result and decides for the rest whether there is one to reuse
+        leads = self.comm is None or self.comm.Get_rank() == 0
+
+        # if everything this task is given is the same as the last time it
+        # was run, so is its result
+        if not self.always_run:
+            reused = self.cache.reuse(self) if leads else False
+            if self.comm is not None:
+                reused = self.comm.bcast(reused, root=0)
+            if reused:
+                leads and print(f"Reusing the result of an earlier run for {str(self)}")
+                return
+
+        start = time.time()
+
         if self.dependencies == None or len(self.dependencies) == 0:
 
             self.result = self.operation(**self.arguments)
@@ -222,6 +284,9 @@ Output File: {self.output_file}"""
 
             self.result = self.operation(results, **self.arguments)
 
-        self.cache.save(self)
+        self.compute_time = time.time() - start
+
+        if leads:
+            self.cache.save(self)
         
             
\ No newline at end of file
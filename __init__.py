@@ -14,6 +14,7 @@ from blk.Tasks.Terminal import Terminal
 from blk.Pipeline import Pipeline
 from blk.Pipeline.TaskParallelPipeline import TaskParallelPipeline
 from blk.Pipeline.SegmentParallelPipeline import SegmentParallelPipeline
+from blk.Pipeline.ProcessParallelPipeline import ProcessParallelPipeline
 
 
 from blk.HaloFinding.SphereMeanDensity import SphereMeanDensity
@@ -1,12 +1,24 @@
-import pickle, inspect, os, hashlib
+import pickle, inspect, os, hashlib, json
+from blk.Cache.Serializers import readEntry, writeEntry, DEFAULT_SERIALIZER
+from blk.Cache.Layout import shardPath, readLayout, FLAT
 
 CACHE_DIR = "."
+SERIALIZER = DEFAULT_SERIALIZER
+LAYOUT = FLAT
+
+# how long each stage took to run, one JSON line per run
+RUNTIMES_FILENAME = ".blk_runtimes"
+
+# where the result for qhash lives in the cache directory
+def cache_path(qhash):
+    global CACHE_DIR, LAYOUT
+    return shardPath(CACHE_DIR, qhash, LAYOUT)
 
 
 
 def exists(stage):
     global CACHE_DIR
-    cache_fname = os.path.join(CACHE_DIR, stage.cache_id)
+    cache_fname = cache_path(stage.cache_id)
 
     cache_hit = os.path.exists(cache_fname)
     # if cache_hit:
@@ -17,13 +29,13 @@ def exists(stage):
 
 def load(qhash):
     global CACHE_DIR
-    cache_fname = os.path.join(CACHE_DIR, qhash)
+    cache_fname = cache_path(qhash)
 
     # if we have a previous result, serve that up
     try:
         with open(cache_fname, 'rb') as f:
             #print(f"Found cache result for {qhash}")
-            result = pickle.load(f)
+            result = readEntry(f)
     except FileNotFoundError as e:
         #print(f"No cache result found for {cache_fname}")
         raise 
@@ -32,17 +44,18 @@ def load(qhash):
 
 
 def save(result, qhash):
-    global CACHE_DIR
-    cache_fname = os.path.join(CACHE_DIR, qhash)
+    global CACHE_DIR, SERIALIZER
+    cache_fname = cache_path(qhash)
+    os.makedirs(os.path.dirname(cache_fname), exist_ok=True)
     #print(f"Saving result to file {cache_fname}")
     
     with open(cache_fname, 'wb') as f:
-        pickle.dump(result, f, protocol=0)
+        writeEntry(f, result, SERIALIZER)
 
 
 def remove(qhash):
     global CACHE_DIR
-    cache_fname = os.path.join(CACHE_DIR, qhash)
+    cache_fname = cache_path(qhash)
     try: 
         os.remove(cache_fname)
     except FileNotFoundError as e:
@@ -51,6 +64,50 @@ def remove(qhash):
 
 
 def set_dir(dirname):
-    global CACHE_DIR
+    global CACHE_DIR, LAYOUT
     CACHE_DIR = dirname
+    LAYOUT = readLayout(dirname, FLAT) if os.path.isdir(dirname) else FLAT
+
+def set_serializer(name):
+    global SERIALIZER
+    SERIALIZER = name
+
+
+# remembers how long a stage took to run, so later runs can tell how long it
+# will take, see load_runtimes
+# each run is appended as a single line, so every process can write at once
+def save_runtime(stage, seconds):
+    global CACHE_DIR
+    line = json.dumps({
+        "operation" : stage.operation.__name__,
+        "cache_id" : stage.cache_id,
+        "compute_time" : seconds
+    }) + "\n"
+
+    fd = os.open(os.path.join(CACHE_DIR, RUNTIMES_FILENAME), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
+
+# returns the latest run time of each stage by cache id and the average run
+# time of each operation by name
+def load_runtimes():
+    global CACHE_DIR
+    by_cache_id = {}
+    by_operation = {}
+
+    try:
+        with open(os.path.join(CACHE_DIR, RUNTIMES_FILENAME), 'r') as f:
+            for line in f:
+                if not line.endswith("\n"): break
+                record = json.loads(line)
+                by_cache_id[record["cache_id"]] = record["compute_time"]
+                by_operation.setdefault(record["operation"], []).append(record["compute_time"])
+    except FileNotFoundError as e:
+        pass
+
+    for operation, times in by_operation.items():
+        by_operation[operation] = sum(times) / len(times)
 
+    return by_cache_id, by_operation
@@ -16,6 +16,14 @@ DEPENDENCY_STRATEGIES = [
 
 ONE_TO_ONE, ALL_TO_ALL, ONE_TO_ALL, MANUAL, NONE = DEPENDENCY_STRATEGIES
 
+# enumerate possible codecs for compressing cached results
+COMPRESSION_OPTIONS = ["none", "zlib", "lzma", "bz2"]
+NO_COMPRESSION, ZLIB, LZMA, BZ2 = COMPRESSION_OPTIONS
+
+# enumerate the ways a segment's results can be stored in the cache
+STORAGE_OPTIONS = ["files", "pack"]
+FILES, PACK = STORAGE_OPTIONS
+
 MAX_SEGMENTS = 10000
 ITERATION_LIMIT = 10000
 
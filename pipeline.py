@@ -1,4 +1,4 @@
-import time, os, sys, argparse
+import time, os, sys, argparse, heapq
 from mpi4py import MPI
 from blk import cache, utils
 from blk.enums import *
@@ -51,7 +51,9 @@ def run(task, parallelism):
             args = [data_dict, *task.arguments]
             
 
+    start = time.time()
     data = task.operation(*args)
+    compute_time = time.time() - start
 
     # Figure out if we're saving to file automatically
     # Stage-parallel tasks only save on the root process
@@ -63,6 +65,10 @@ def run(task, parallelism):
         if DEBUG: print(f"Saved results of {task} to file: {task.cache_id}")
         cache.save(data, task.cache_id)
 
+    # remember how long it took, so later runs can balance their work better
+    if not y or z:
+        cache.save_runtime(task, compute_time)
+
     if DEBUG: print(f"Finished {task}")
     return COMPLETE # finished with no errors
     
@@ -79,6 +85,9 @@ dependencies and is the last stage to be executed.
 # will eventually complete no matter what
 ITERATION_LIMIT = 1e6
 
+# run time assumed for stages that have never been run, in seconds
+DEFAULT_RUNTIME = 1.0
+
 COMM = MPI.COMM_WORLD
 COMM_SIZE = COMM.Get_size()
 RANK = COMM.Get_rank()
@@ -108,6 +117,7 @@ def execute(root_stage, parallelism=NONE, debug_mode=False, dry_run=False):
     if RANK == 0:
         execution_stack, virtual_cache = determine_workload(root_stage)
         execution_stack_size = len(execution_stack)
+        runtimes = cache.load_runtimes()
     else: 
         execution_stack_size = 0
         virtual_cache = set()
@@ -121,7 +131,8 @@ def execute(root_stage, parallelism=NONE, debug_mode=False, dry_run=False):
         if RANK == 0:
             task_list = collect_task_list(execution_stack, virtual_cache, 
                 parallelism=parallelism, 
-                num_procs=COMM_SIZE)
+                num_procs=COMM_SIZE,
+                runtimes=runtimes)
 
             if DEBUG:
                 if parallelism == TASK:   
@@ -243,7 +254,7 @@ def determine_workload(root):
 
             
 
-def collect_task_list(execution_stack, virtual_cache, parallelism=NONE, num_procs=1):
+def collect_task_list(execution_stack, virtual_cache, parallelism=NONE, num_procs=1, runtimes=None):
 
     if parallelism == NONE or parallelism == STAGE:
         task_list = []
@@ -262,15 +273,34 @@ def collect_task_list(execution_stack, virtual_cache, parallelism=NONE, num_proc
             if dependencies_are_met(stage, virtual_cache):
                 all_tasks.append(stage)
 
-        iterations = 0
-        while len(all_tasks) > 0 and iterations < ITERATION_LIMIT:
-            task_list[iterations % num_procs].append(all_tasks.pop())
-            iterations += 1
+        # longest processing time first: hand the longest stages out first,
+        # each to the process with the least work so far
+        all_tasks.sort(key=lambda stage: estimate_runtime(stage, runtimes), reverse=True)
+
+        loads = [(0, rank) for rank in range(num_procs)]
+        for stage in all_tasks:
+            load, rank = heapq.heappop(loads)
+            task_list[rank].append(stage)
+            heapq.heappush(loads, (load + estimate_runtime(stage, runtimes), rank))
 
         return task_list
     return None
 
 
+# how long a stage is expected to take, going by how long it took last time
+# or else how long its operation takes on average
+def estimate_runtime(stage, runtimes):
+
+    if runtimes is None:
+        return DEFAULT_RUNTIME
+
+    by_cache_id, by_operation = runtimes
+    if stage.cache_id in by_cache_id:
+        return by_cache_id[stage.cache_id]
+
+    return by_operation.get(stage.operation.__name__, DEFAULT_RUNTIME)
+
+
 def dependencies_are_met(stage, virtual_cache):
     all_met = all([cache_id in virtual_cache for cache_id in stage.dependencies.keys()])
 
@@ -2,6 +2,7 @@
 import yt
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.figure import Figure
 from matplotlib.colors import LogNorm
 from mpl_toolkits.axes_grid1 import AxesGrid, make_axes_locatable
 import numpy as np
@@ -186,7 +187,9 @@ def plot_halo(data,
     ds = yt.load(dataset)
     comoving_box_size = ds.domain_width[0].to(axes_units)
 
-    fig, ax = plt.subplots(figsize=(10,10))
+    # made without pyplot, see blk/projections/ProjectionPlot.py
+    fig = Figure(figsize=(10,10))
+    ax = fig.subplots()
     fig.subplots_adjust(
         left = 0.125,
         right = 0.9,
@@ -246,8 +249,7 @@ bar ({6:2e},{7:2e},{8:2e})""".format(*com, *dm, *bar)
 
     print(f"Saving to file: {plot_filename}")
     
-    plt.savefig(plot_filename)
-    plt.close()
+    fig.savefig(plot_filename)
 
 def get_particles_in_halo(dataset, 
     halo_position,
@@ -1,4 +1,5 @@
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.colors import LogNorm
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import yt, os, re
@@ -78,7 +79,11 @@ def projectionPlot(   data,
 
     #fig, (ax1, ax2) = plt.subplots(1, 2)
 
-    fig, ax = plt.subplots(figsize=(10,10))
+    # the figure is made without pyplot, whose current figure and axes are
+    # shared by every thread, so tasks run with threads_per_rank don't draw
+    # on each other's plots
+    fig = Figure(figsize=(10,10))
+    ax = fig.subplots()
     fig.subplots_adjust(
         left = 0.125,
         right = 0.9,
@@ -111,7 +116,6 @@ def projectionPlot(   data,
 
     print(f"Saving to file: {output_file}")
 
-    plt.title(f"z = {ds.current_redshift}")
+    ax.set_title(f"z = {ds.current_redshift}")
     
-    plt.savefig(output_file)
-    plt.close()
\ No newline at end of file
+    fig.savefig(output_file)
\ No newline at end of file
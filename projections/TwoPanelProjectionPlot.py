@@ -1,4 +1,5 @@
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.colors import LogNorm
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import yt
@@ -55,7 +56,9 @@ def twoPanelProjectionPlot(
     axes_units="Mpccm/h",
     output_file=None, **kwargs):
 
-    fig, (ax1, ax2) = plt.subplots(1,2, figsize=(20,10))
+    # made without pyplot, see ProjectionPlot.py
+    fig = Figure(figsize=(20,10))
+    ax1, ax2 = fig.subplots(1,2)
 
     if zlims == None:
         zlims = [
@@ -124,7 +127,6 @@ def twoPanelProjectionPlot(
 
     print(f"Saving to file: {output_file}")
 
-    plt.title(f"z = {ds.current_redshift}")
+    fig.suptitle(f"z = {ds.current_redshift}")
     
-    plt.savefig(output_file)
-    plt.close()
\ No newline at end of file
+    fig.savefig(output_file)
\ No newline at end of file
@@ -96,7 +96,7 @@ def gather(package_name, stages,compress):
 
     for stage in stages:
         
-        file_name = os.path.join(cache.CACHE_DIR, stage.cache_id)
+        file_name = cache.cache_path(stage.cache_id)
         package_loc = os.path.join(package_name, stage.tag)
         cmd = f"cp {file_name} {package_loc}"
 
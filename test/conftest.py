@@ -0,0 +1,53 @@
+import os, sys, tempfile, importlib.util
+
+import numpy as np
+import pytest
+
+# blk is imported as a package named after the directory it's in, so unless
+# it's installed, tests run from a checkout under any other name go through a
+# link named blk
+if importlib.util.find_spec("blk") is None:
+    ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    link_dir = tempfile.mkdtemp(prefix="blk-tests-")
+    os.symlink(ROOT, os.path.join(link_dir, "blk"))
+    sys.path.insert(0, link_dir)
+
+import blk
+from blk.constants import AUTO
+
+# where blk is imported from, for pipelines run in other processes
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(blk.__file__)))
+
+
+class FakeTask:
+
+    # Just enough of a Task for the cache to save and load results for it
+
+    save_action = AUTO
+    always_run = False
+    pinned = False
+    compression = "none"
+    compression_level = None
+    pack = None
+    chunk_shape = None
+    compute_time = None
+
+    def __init__(self, name, result=None, dependencies=None, **kwargs):
+        self.name = name
+        self.hashcode = (name * 32)[:32]
+        self.base_hashcode = f"base-{name}"
+        self.result = result
+        self.dependencies = dependencies
+        self.arguments = {}
+        self.operation = np.sum
+        self.__dict__.update(kwargs)
+
+
+@pytest.fixture
+def package_parent():
+    return PACKAGE_PARENT
+
+# a directory for a cache to be made in, which doesn't exist yet
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "cache")
@@ -0,0 +1,68 @@
+import numpy as np
+
+from blk.Tasks import CreateHashCode
+from blk.Tasks.CreateHashCode import digestSource
+from blk.Tasks.CodeDependencies import collectCodeDependencies, qualifiedName
+
+SCALE = 2.0
+
+class Point:
+    pass
+
+def helper(x):
+    return x * SCALE
+
+def nested(x):
+    return helper(x) + 1
+
+def operation(x):
+    return np.sum([nested(x), Point()])
+
+def digestAfresh(func):
+    CreateHashCode.code_digests.clear()
+    return digestSource(func)
+
+def test_helpers_classes_and_constants_are_found():
+
+    found = collectCodeDependencies(operation)
+    for value in (operation, nested, helper, Point):
+        assert found[qualifiedName(value)] is value
+    assert found[f"{__name__}.SCALE"] == SCALE
+
+    # but nothing from outside blk and the operation's module
+    assert not any(name.startswith("numpy") for name in found)
+
+def test_constants_change_the_digest(monkeypatch):
+
+    before = digestAfresh(operation)
+    monkeypatch.setattr(__import__(__name__), "SCALE", 3.0)
+    assert digestAfresh(operation) != before
+
+# operations that can find themselves through a module level registry
+def registered(name):
+    return OPS[name]
+
+OPS = {"registered" : registered}
+
+def ping(n):
+    return PONGS["pong"](n - 1) if n > 0 else n
+
+def pong(n):
+    return PINGS["ping"](n - 1) if n > 0 else n
+
+PINGS = {"ping" : ping}
+PONGS = {"pong" : pong}
+
+def test_registries_do_not_recurse_forever():
+
+    digest = digestAfresh(registered)
+    assert digestAfresh(registered) == digest
+
+    # functions in a registry are part of the digest of whatever uses it
+    assert collectCodeDependencies(ping)[qualifiedName(pong)] is pong
+
+    # and functions that find each other that way get the same digests,
+    # whichever is digested first
+    ping_first = (digestAfresh(ping), digestSource(pong))
+    pong_digest = digestAfresh(pong)
+    assert (digestSource(ping), pong_digest) == ping_first
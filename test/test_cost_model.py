@@ -0,0 +1,49 @@
+import numpy as np
+
+from blk.Cache import Cache
+from blk.Cache.Eviction import DEFAULT_RECOMPUTE_COST
+from blk.Pipeline.CostModel import CostModel
+
+from conftest import FakeTask
+
+def project(**kwargs):
+    pass
+
+def plot(**kwargs):
+    pass
+
+def timed(name, operation, compute_time, **arguments):
+    return FakeTask(name, np.zeros(10), operation=operation,
+        arguments=arguments, compute_time=compute_time)
+
+def test_estimates_come_from_earlier_runs(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    cache.save(timed("a", project, 10., field="density"))
+    cache.save(timed("b", project, 20., field="temperature"))
+    cache.save(timed("c", plot, 3., field="density"))
+
+    model = CostModel(Cache(cache_dir, memory_bytes=0))
+
+    # the same task takes as long as it did last time
+    assert model.estimate(timed("a2", project, None, field="density")) == 10.
+
+    # a new one takes as long as its operation does on average
+    assert model.estimate(timed("d", project, None, field="metallicity")) == 15.
+
+    # and one whose operation has never run, as long as any task does
+    assert model.estimate(timed("e", np.sum, None)) == 11.
+
+def test_empty_cache_uses_the_default(cache_dir):
+
+    model = CostModel(Cache(cache_dir, memory_bytes=0))
+    assert model.estimate(timed("a", project, None)) == DEFAULT_RECOMPUTE_COST
+
+def test_untimed_results_are_ignored(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    cache.save(timed("a", project, 4.))
+    cache.save(timed("b", project, None))
+
+    model = CostModel(cache)
+    assert model.estimate(timed("c", project, None, field="x")) == 4.
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+from blk.Cache import Cache
+
+from conftest import FakeTask
+
+def test_identical_results_share_storage(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    a = FakeTask("a", np.arange(100.))
+    b = FakeTask("b", np.arange(100.))
+    c = FakeTask("c", np.arange(50.))
+    for task in (a, b, c):
+        cache.save(task)
+
+    entry_a = cache.virtual_cache[a.hashcode]
+    entry_b = cache.virtual_cache[b.hashcode]
+    assert entry_a["digest"] == entry_b["digest"] is not None
+    assert os.path.samefile(cache.entryPath(a.hashcode), cache.entryPath(b.hashcode))
+    assert os.path.samefile(cache.entryPath(a.hashcode), cache.blobPath(entry_a["digest"]))
+
+    # the shared blob only counts once
+    assert cache.total_bytes == entry_a["size"] + cache.virtual_cache[c.hashcode]["size"]
+    assert Cache(cache_dir, memory_bytes=0).total_bytes == cache.total_bytes
+
+def test_blobs_go_with_their_last_entry(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    a = FakeTask("a", np.arange(100.))
+    b = FakeTask("b", np.arange(100.))
+    cache.save(a)
+    cache.save(b)
+    blob = cache.blobPath(cache.virtual_cache[a.hashcode]["digest"])
+
+    cache.removeEntry(a.hashcode)
+    assert os.path.exists(blob)
+    assert np.array_equal(cache.load(FakeTask("b")), b.result)
+
+    cache.removeEntry(b.hashcode)
+    assert not os.path.exists(blob)
+    assert cache.total_bytes == 0
+
+def test_replaced_results_keep_others_intact(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    cache.save(FakeTask("a", np.arange(100.)))
+    cache.save(FakeTask("b", np.arange(100.)))
+
+    # a new result under a's hashcode doesn't change b's, which shares a file
+    # with the old one
+    cache.save(FakeTask("a", np.ones(100)))
+    assert np.array_equal(cache.load(FakeTask("a")), np.ones(100))
+    assert np.array_equal(cache.load(FakeTask("b")), np.arange(100.))
+
+def test_sweep_removes_unused_blobs(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    task = FakeTask("a", np.arange(100.))
+    cache.save(task)
+    blob = cache.blobPath(cache.virtual_cache[task.hashcode]["digest"])
+
+    # as if a run was killed between removing the entry and its blob
+    os.remove(cache.entryPath(task.hashcode))
+    assert cache.sweepBlobs() == 1
+    assert not os.path.exists(blob)
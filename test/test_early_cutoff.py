@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+import pytest
+
+from blk.Cache import Cache
+
+from conftest import FakeTask
+
+# the background writers get to each result well after it's been saved
+def slowWrites(cache):
+
+    write = cache.write
+    def slowWrite(*args, **kwargs):
+        time.sleep(0.1)
+        return write(*args, **kwargs)
+
+    cache.write = slowWrite
+    if cache.writer is not None:
+        cache.writer.write = slowWrite
+
+def saveChain(cache, a_result, b_result, suffix=""):
+    a = FakeTask("a" + suffix, a_result)
+    b = FakeTask("b" + suffix, b_result, [a], base_hashcode="base-b")
+    cache.save(a)
+    cache.save(b)
+    cache.flush()
+    return a, b
+
+WRITE_MODES = [
+    dict(),
+    dict(async_writes=True),
+    dict(local_mode="write-through"),
+    dict(local_mode="write-back"),
+    dict(async_writes=True, local_mode="write-back"),
+]
+
+@pytest.mark.parametrize("kwargs", WRITE_MODES)
+def test_results_are_traced(tmp_path, kwargs):
+
+    if "local_mode" in kwargs:
+        kwargs = dict(kwargs, local_directory=str(tmp_path / "local"))
+    cache = Cache(str(tmp_path / "cache"), memory_bytes=0, **kwargs)
+    slowWrites(cache)
+
+    a, b = saveChain(cache, np.arange(3.), np.arange(2.))
+    assert cache.virtual_cache[a.hashcode]["trace"] is None
+    assert cache.virtual_cache[b.hashcode]["trace"] == cache.traceFor(b) is not None
+
+def test_unchanged_inputs_reuse_the_old_result(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    _, b = saveChain(cache, np.arange(3.), np.arange(2.))
+
+    # a's hashcode changed but its result didn't, so b's trace is the same
+    a2 = FakeTask("a", np.arange(3.), hashcode="2" * 32)
+    cache.save(a2)
+    b2 = FakeTask("b2", None, [a2], base_hashcode="base-b")
+    assert cache.reuse(b2)
+    assert np.array_equal(cache.load(b2), np.arange(2.))
+    assert cache.virtual_cache[b2.hashcode]["trace"] == cache.virtual_cache[b.hashcode]["trace"]
+
+    # whereas a different result upstream means running b again
+    a3 = FakeTask("a", np.arange(4.), hashcode="3" * 32)
+    cache.save(a3)
+    assert not cache.reuse(FakeTask("b3", None, [a3], base_hashcode="base-b"))
@@ -0,0 +1,123 @@
+import os, sys, subprocess
+
+import numpy as np
+
+from blk import Pipeline
+from blk.Cache import Cache
+
+from conftest import FakeTask
+
+BLK_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "blk")
+
+def countRecords(cache):
+    with open(cache.manifest.path) as f:
+        return len(f.readlines())
+
+# identical results would share their storage, see Deduplication.py
+counter = iter(range(1, 1000000))
+def distinct():
+    return np.full(100, float(next(counter)))
+
+def entrySize(cache_dir):
+    cache = Cache(cache_dir + "-sizing", memory_bytes=0)
+    task = FakeTask("s", distinct())
+    cache.save(task)
+    return cache.virtual_cache[task.hashcode]["size"]
+
+def test_cheapest_results_are_evicted_first(cache_dir):
+
+    size = entrySize(cache_dir)
+    cache = Cache(cache_dir, memory_bytes=0, max_bytes=int(3.5 * size))
+
+    slow = FakeTask("slow", distinct(), compute_time=100.)
+    fast = FakeTask("fast", distinct(), compute_time=0.01)
+    medium = FakeTask("medium", distinct(), compute_time=1.)
+    for task in (slow, fast, medium):
+        cache.save(task)
+    assert cache.total_bytes == 3 * size
+
+    # the newest result is never the one evicted to make room for itself
+    newest = FakeTask("newest", distinct(), compute_time=0.)
+    cache.save(newest)
+    assert cache.virtual_cache.keys() == {slow.hashcode, medium.hashcode, newest.hashcode}
+    assert cache.total_bytes <= cache.max_bytes
+    assert not os.path.exists(cache.entryPath(fast.hashcode))
+
+    # and other processes agree
+    assert Cache(cache_dir, memory_bytes=0).virtual_cache.keys() == cache.virtual_cache.keys()
+
+def test_pinned_and_protected_results_are_kept(cache_dir):
+
+    size = entrySize(cache_dir)
+    cache = Cache(cache_dir, memory_bytes=0, max_bytes=int(2.5 * size))
+
+    pinned = FakeTask("pinned", distinct(), compute_time=0., pinned=True)
+    needed = FakeTask("needed", distinct(), compute_time=0.)
+    cache.save(pinned)
+    cache.save(needed)
+    cache.protect([FakeTask("user", dependencies=[needed])])
+
+    cache.save(FakeTask("new", distinct(), compute_time=100.))
+    assert {pinned.hashcode, needed.hashcode} <= cache.virtual_cache.keys()
+    assert cache.total_bytes > cache.max_bytes
+
+    # pins are kept in the manifest
+    cache.unpin(pinned)
+    assert not Cache(cache_dir, memory_bytes=0).virtual_cache[pinned.hashcode]["pinned"]
+    cache.pin(pinned)
+    assert Cache(cache_dir, memory_bytes=0).virtual_cache[pinned.hashcode]["pinned"]
+
+def test_access_times_are_written_at_flush(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    task = FakeTask("a", np.arange(4.))
+    cache.save(task)
+    before = countRecords(cache)
+
+    for _ in range(5):
+        cache.load(FakeTask("a"))
+    assert countRecords(cache) == before
+
+    cache.flush()
+    assert countRecords(cache) == before + 1
+
+    last_access = cache.virtual_cache[task.hashcode]["last_access"]
+    assert Cache(cache_dir, memory_bytes=0).virtual_cache[task.hashcode]["last_access"] == last_access
+
+    # nothing new to write
+    cache.flush()
+    assert countRecords(cache) == before + 1
+
+CONFIG = """
+[blk]
+cache_dir = {cache_dir}
+operations_module = blk.tests
+
+[segment 1]
+operation = segment1
+num_tasks = 2
+format = task_number
+task_number = {{:d}}
+segment = 1
+"""
+
+def test_gc_removes_unreferenced_results(tmp_path, cache_dir, package_parent):
+
+    config_file = tmp_path / "test.pipe"
+    config_file.write_text(CONFIG.format(cache_dir=cache_dir))
+    Pipeline(str(config_file)).run()
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    results = set(cache.virtual_cache.keys())
+    orphan = FakeTask("orphan", np.zeros(10))
+    kept = FakeTask("kept", np.ones(10), pinned=True)
+    cache.save(orphan)
+    cache.save(kept)
+
+    env = dict(os.environ, PYTHONPATH=package_parent)
+    subprocess.run([sys.executable, BLK_SCRIPT, "gc", str(config_file)],
+        cwd=tmp_path, env=env, check=True, timeout=300)
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    assert cache.virtual_cache.keys() == results | {kept.hashcode}
+    assert not os.path.exists(cache.entryPath(orphan.hashcode))
@@ -0,0 +1,151 @@
+import os
+
+import numpy as np
+
+from blk.Tasks import Task
+from blk.Tasks.CreateHashCode import encodeToBytes, digestSource, digestArguments
+from blk.Tasks.Fingerprint import fingerprintPath, fingerprintArguments, clearFingerprints
+
+def test_encodings_are_distinct():
+
+    values = [False, True, None, 0, 0.0, "", b"", [], (), {}, len, np.zeros(0), np.zeros(1)]
+    encodings = [encodeToBytes(v) for v in values]
+    assert len(set(encodings)) == len(values)
+
+    # every encoding starts with a tag saying what kind of value it is
+    assert encodeToBytes(False)[:1] != encodeToBytes(len)[:1]
+
+def test_containers_do_not_collide():
+
+    assert encodeToBytes(["ab", "c"]) != encodeToBytes(["a", "bc"])
+    assert encodeToBytes([1, 2]) != encodeToBytes("[1, 2]")
+    assert encodeToBytes([[1], 2]) != encodeToBytes([1, [2]])
+
+def test_encodings_are_canonical():
+
+    # no matter what order a dict or set was built in
+    assert encodeToBytes({"a" : 1, "b" : 2}) == encodeToBytes({"b" : 2, "a" : 1})
+    assert encodeToBytes({3, 1, 2}) == encodeToBytes({1, 2, 3})
+
+    # floats are written exactly
+    assert encodeToBytes(0.1 + 0.2) != encodeToBytes(0.3)
+
+    # and arrays by their contents, however long they are
+    arr = np.zeros(10000)
+    changed = arr.copy()
+    changed[5000] = 1
+    assert encodeToBytes(arr) != encodeToBytes(changed)
+    assert encodeToBytes(arr) != encodeToBytes(arr.astype(np.float32))
+    assert encodeToBytes(arr) == encodeToBytes(np.zeros(10000))
+
+def test_default_reprs_are_left_out():
+
+    class Thing:
+        pass
+
+    assert digestArguments({"x" : Thing()}) == digestArguments({"x" : Thing()})
+
+def operation():
+    return 1
+
+def test_source_digests_are_memoized():
+    assert digestSource(operation) is digestSource(operation)
+
+# only needs to be something other than None
+CACHE = object()
+
+def add(x=0):
+    return x + 1
+
+def buildChain(a_arguments):
+    a = Task("a", cache=CACHE, operation=add, arguments=a_arguments)
+    b = Task("b", cache=CACHE, operation=add, arguments={}, dependencies=[a])
+    c = Task("c", cache=CACHE, operation=add, arguments={}, dependencies=[b])
+    d = Task("d", cache=CACHE, operation=add, arguments={"x" : 5})
+    e = Task("e", cache=CACHE, operation=add, arguments={}, dependencies=[c, d])
+    return a, b, c, d, e
+
+def test_changes_reach_every_task_downstream():
+
+    old = buildChain({"x" : 1})
+    new = buildChain({"x" : 2})
+    changed = [o.hashcode != n.hashcode for o, n in zip(old, new)]
+    assert changed == [True, True, True, False, True]
+
+    # which is down to their dependencies, not their own arguments
+    assert [o.base_hashcode == n.base_hashcode for o, n in zip(old[1:], new[1:])] == [True] * 4
+
+def test_same_inputs_give_the_same_hashcodes():
+    assert [t.hashcode for t in buildChain({"x" : 1})] == [t.hashcode for t in buildChain({"x" : 1})]
+
+def test_dependencies_are_told_apart_by_name():
+
+    # operations with several dependencies get their results by name, so
+    # swapping which task is called what gives them different inputs
+    a = Task("a", cache=CACHE, operation=add, arguments={})
+    b = Task("b", cache=CACHE, operation=add, arguments={"x" : 1})
+    a_as_b = Task("b", cache=CACHE, operation=add, arguments={})
+    b_as_a = Task("a", cache=CACHE, operation=add, arguments={"x" : 1})
+
+    both = Task("both", cache=CACHE, operation=add, arguments={}, dependencies=[a, b])
+    swapped = Task("both", cache=CACHE, operation=add, arguments={}, dependencies=[b_as_a, a_as_b])
+    assert both.hashcode != swapped.hashcode
+
+def test_directories_are_not_fingerprinted(tmp_path):
+
+    clearFingerprints()
+    assert fingerprintPath(str(tmp_path)) is None
+
+    written = []
+    fingerprintArguments({"output_dir" : str(tmp_path)}, written.append)
+    assert written == []
+
+def test_changed_files_are_noticed_after_clearing(tmp_path):
+
+    clearFingerprints()
+    path = tmp_path / "input.dat"
+    path.write_bytes(b"a")
+    before = fingerprintPath(str(path))
+    assert before is not None
+
+    path.write_bytes(b"bb")
+    os.utime(path, ns=(0, 0))
+    assert fingerprintPath(str(path)) == before
+
+    clearFingerprints()
+    assert fingerprintPath(str(path)) != before
+
+    # a file that turns up later is noticed too
+    missing = str(tmp_path / "later.dat")
+    assert fingerprintPath(missing) is None
+    (tmp_path / "later.dat").write_bytes(b"c")
+    clearFingerprints()
+    assert fingerprintPath(missing) is not None
+
+def plot(dataset="", plot_filename="", frame=""):
+    pass
+
+def test_output_files_are_not_fingerprinted(tmp_path):
+
+    dataset = tmp_path / "dataset"
+    dataset.write_bytes(b"a")
+    arguments = {
+        "dataset" : str(dataset),
+        "plot_filename" : str(tmp_path / "plot.png"),
+        "frame" : str(tmp_path / "frame.png"),
+    }
+
+    def hashcode():
+        clearFingerprints()
+        return Task("plot", cache=CACHE, operation=plot, arguments=arguments,
+            output_arguments=["plot_filename", "frame"]).hashcode
+
+    # running the task writes its outputs, which mustn't change its hashcode
+    before = hashcode()
+    (tmp_path / "plot.png").write_bytes(b"image")
+    (tmp_path / "frame.png").write_bytes(b"image")
+    assert hashcode() == before
+
+    # whereas a changed input does
+    dataset.write_bytes(b"bb")
+    assert hashcode() != before
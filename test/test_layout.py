@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+
+from blk.Cache import Cache
+from blk.Cache.Layout import readLayout, scanEntries, LAYOUT_FILENAME, FLAT, SHARDED
+
+from conftest import FakeTask
+
+TASKS = [FakeTask(name, np.arange(i + 1.)) for i, name in enumerate("abcde")]
+
+def fillCache(cache_dir, layout):
+    cache = Cache(cache_dir, memory_bytes=0, layout=layout)
+    for task in TASKS:
+        cache.save(task)
+    return cache
+
+def checkContents(cache):
+    assert {h for h, _ in scanEntries(cache.directory, cache.layout)} == {t.hashcode for t in TASKS}
+    for task in TASKS:
+        assert os.path.exists(cache.entryPath(task.hashcode))
+        assert np.array_equal(cache.load(FakeTask(task.name)), task.result)
+
+@pytest.mark.parametrize("old, new", [(FLAT, SHARDED), (SHARDED, FLAT)])
+def test_migrate_keeps_every_entry(cache_dir, old, new):
+
+    cache = fillCache(cache_dir, old)
+    cache.migrate(new)
+
+    assert cache.layout == new
+    assert readLayout(cache_dir) == new
+    checkContents(cache)
+
+    # with no shard directories left behind
+    if new == FLAT:
+        assert [d for d in os.listdir(cache_dir)
+            if not d.startswith('.') and os.path.isdir(os.path.join(cache_dir, d))] == []
+
+    # and a cache opened afterwards sees the new layout
+    checkContents(Cache(cache_dir, memory_bytes=0))
+
+@pytest.mark.parametrize("old", [FLAT, SHARDED])
+def test_migrate_to_unknown_layout_moves_nothing(cache_dir, old):
+
+    cache = fillCache(cache_dir, old)
+    with open(os.path.join(cache_dir, LAYOUT_FILENAME)) as f:
+        layout_file = f.read()
+
+    with pytest.raises(ValueError):
+        cache.migrate("shardd")
+
+    assert cache.layout == old
+    with open(os.path.join(cache_dir, LAYOUT_FILENAME)) as f:
+        assert f.read() == layout_file
+    checkContents(cache)
+
+def test_old_flat_cache_is_recognised(cache_dir):
+
+    # caches made before layouts existed have no layout file or manifest
+    os.mkdir(cache_dir)
+    for task in TASKS:
+        with open(os.path.join(cache_dir, task.hashcode), 'wb') as f:
+            np.save(f, task.result, allow_pickle=False)
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    assert cache.layout == FLAT
+    assert cache.virtual_cache.keys() == {t.hashcode for t in TASKS}
@@ -0,0 +1,98 @@
+import os, time
+
+import numpy as np
+import pytest
+
+from blk.Cache import Cache
+from blk.Cache.LocalTier import LocalTier
+
+from conftest import FakeTask
+
+def localFiles(directory):
+    return sorted(fname for fname in os.listdir(directory) if not fname.startswith('.'))
+
+@pytest.mark.parametrize("mode", ["write-through", "write-back"])
+def test_results_reach_the_shared_cache(tmp_path, mode):
+
+    shared = str(tmp_path / "cache")
+    local = str(tmp_path / "local")
+    cache = Cache(shared, memory_bytes=0, local_directory=local, local_mode=mode)
+    task = FakeTask("a", np.arange(10.))
+    cache.save(task)
+    cache.flush()
+
+    assert os.path.exists(cache.entryPath(task.hashcode))
+    assert len(localFiles(local)) == 1
+    assert np.array_equal(Cache(shared, memory_bytes=0).load(FakeTask("a")), task.result)
+
+@pytest.mark.parametrize("mode", ["write-through", "write-back"])
+def test_results_bigger_than_the_local_tier(tmp_path, mode):
+
+    shared = str(tmp_path / "cache")
+    local = str(tmp_path / "local")
+    cache = Cache(shared, memory_bytes=0, local_directory=local, local_bytes=1000, local_mode=mode)
+
+    # 8000 bytes, so there's no room for it locally
+    task = FakeTask("big", np.arange(1000.))
+    cache.save(task)
+    cache.flush()
+
+    assert localFiles(local) == []
+    assert np.array_equal(cache.load(FakeTask("big")), task.result)
+    assert np.array_equal(Cache(shared, memory_bytes=0).load(FakeTask("big")), task.result)
+
+def test_least_recently_used_copies_go_first(tmp_path):
+
+    shared = str(tmp_path / "cache")
+    writer = Cache(shared, memory_bytes=0)
+    for i, name in enumerate("abc"):
+        writer.save(FakeTask(name, np.full(100, float(i))))
+    size = writer.virtual_cache[FakeTask("a").hashcode]["size"]
+
+    local = str(tmp_path / "local")
+    cache = Cache(shared, memory_bytes=0, local_directory=local, local_bytes=2 * size)
+    for name in "abca":
+        cache.load(FakeTask(name))
+
+    # b was read longest ago
+    assert len(localFiles(local)) == 2
+    assert cache.local.get(FakeTask("b").hashcode) is None
+    assert cache.local.total_bytes == 2 * size
+
+def test_copies_left_behind_are_picked_up(tmp_path):
+
+    local = str(tmp_path / "local")
+    tier = LocalTier(local, 1000)
+    tmp_fname = tier.temporaryPath("a")
+    with open(tmp_fname, 'wb') as f:
+        f.write(b"x" * 600)
+    tier.add("a", "1.0", tmp_fname, 600)
+
+    # an older version's copy, which can't be trusted
+    with open(os.path.join(local, "b"), 'wb') as f:
+        f.write(b"x" * 10)
+
+    reopened = LocalTier(local, 1000)
+    assert reopened.get("a", "1.0") is not None
+    assert reopened.get("a", "2.0") is None
+    assert localFiles(local) == ["a.1.0"]
+
+def test_local_copies_follow_the_shared_cache(tmp_path):
+
+    shared = str(tmp_path / "cache")
+    writer = Cache(shared, memory_bytes=0, local_directory=str(tmp_path / "a"))
+    reader = Cache(shared, memory_bytes=0, local_directory=str(tmp_path / "b"))
+
+    writer.save(FakeTask("a", np.array([1.])))
+    reader.refresh()
+    assert np.array_equal(reader.load(FakeTask("a")), [1.])
+
+    # the reader's local copy is out of date once the result is saved again
+    time.sleep(0.01)
+    writer.save(FakeTask("a", np.array([2.])))
+    reader.refresh()
+    assert np.array_equal(reader.load(FakeTask("a")), [2.])
+
+    # including for a cache opened on the same local directory later on
+    reopened = Cache(shared, memory_bytes=0, local_directory=str(tmp_path / "b"))
+    assert np.array_equal(reopened.load(FakeTask("a")), [2.])
@@ -0,0 +1,79 @@
+import numpy as np
+
+from blk.Cache import Cache, MANIFEST_COMPACTION_RATIO
+from blk.Cache.Manifest import Manifest
+
+from conftest import FakeTask
+
+def countRecords(cache):
+    with open(cache.manifest.path) as f:
+        return len(f.readlines())
+
+def test_replay_gives_the_same_cache(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    a = FakeTask("a", np.arange(4.))
+    b = FakeTask("b", np.arange(6.))
+    c = FakeTask("c", {"x" : 1})
+    for task in (a, b, c):
+        cache.save(task)
+    cache.removeEntry(b.hashcode)
+    cache.manifest.update(c.hashcode, pinned=True)
+
+    replayed = Cache(cache_dir, memory_bytes=0)
+    assert replayed.virtual_cache.keys() == {a.hashcode, c.hashcode}
+    assert replayed.virtual_cache[c.hashcode]["pinned"]
+    assert replayed.total_bytes == cache.total_bytes
+    assert np.array_equal(replayed.load(FakeTask("a")), a.result)
+    assert replayed.load(FakeTask("c")) == c.result
+
+def test_refresh_only_reads_new_records(cache_dir):
+
+    writer = Cache(cache_dir, memory_bytes=0)
+    reader = Cache(cache_dir, memory_bytes=0)
+
+    writer.save(FakeTask("a", np.arange(4.)))
+    reader.refresh()
+    assert FakeTask("a").hashcode in reader.virtual_cache
+
+    position = reader.manifest.position
+    reader.refresh()
+    assert reader.manifest.position == position
+
+    writer.removeEntry(FakeTask("a").hashcode)
+    reader.refresh()
+    assert reader.virtual_cache == {}
+
+def test_half_written_record_is_left_for_later(tmp_path):
+
+    manifest = Manifest(str(tmp_path))
+    manifest.remove("a")
+    with open(manifest.path, 'ab') as f:
+        f.write(b'{"type" : "remo')
+
+    assert len(manifest.read()) == 1
+    with open(manifest.path, 'ab') as f:
+        f.write(b've", "hashcode" : "b"}\n')
+    assert manifest.read() == [{"type" : "remove", "hashcode" : "b"}]
+
+def test_compaction_keeps_live_entries(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    keep = FakeTask("k", np.arange(3.))
+    cache.save(keep)
+
+    # churn through enough records to have the manifest compacted on startup
+    for i in range(MANIFEST_COMPACTION_RATIO * 3):
+        task = FakeTask(f"t{i}", np.arange(2.))
+        cache.save(task)
+        cache.removeEntry(task.hashcode)
+    before = countRecords(cache)
+
+    reopened = Cache(cache_dir, memory_bytes=0)
+    assert countRecords(reopened) == 1 < before
+    assert reopened.virtual_cache.keys() == {keep.hashcode}
+    assert np.array_equal(reopened.load(FakeTask("k")), keep.result)
+
+    # records appended after compaction still replay on top of it
+    reopened.save(FakeTask("n", np.arange(5.)))
+    assert Cache(cache_dir, memory_bytes=0).virtual_cache.keys() == {keep.hashcode, FakeTask("n").hashcode}
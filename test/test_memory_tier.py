@@ -0,0 +1,61 @@
+import numpy as np
+
+from blk.Cache import Cache
+from blk.Cache.MemoryTier import MemoryTier, resultSize
+
+from conftest import FakeTask
+
+def test_least_recently_used_go_first():
+
+    tier = MemoryTier(3 * 800)
+    for name in "abc":
+        tier.put(name, np.zeros(100))
+    assert tier.total_bytes == 3 * 800
+
+    # using a makes b the oldest
+    tier.get("a")
+    tier.put("d", np.zeros(100))
+    assert "b" not in tier
+    assert all(name in tier for name in "acd")
+    assert tier.total_bytes == 3 * 800
+
+def test_results_too_big_to_keep():
+
+    tier = MemoryTier(1000)
+    tier.put("a", np.zeros(10))
+    tier.put("big", np.zeros(1000))
+    assert "big" not in tier and "a" in tier
+
+    # replacing a result doesn't count it twice
+    tier.put("a", np.zeros(20))
+    assert tier.total_bytes == 160
+    tier.discard("a")
+    assert tier.total_bytes == 0 and tier.get("a") is None
+
+def test_result_sizes():
+    assert resultSize(np.zeros(10)) == 80
+    assert resultSize({"x" : np.zeros(10), "y" : [np.zeros(5)]}) > 120
+
+def test_results_are_read_from_the_disk_once(cache_dir):
+
+    writer = Cache(cache_dir, memory_bytes=0)
+    writer.save(FakeTask("a", np.arange(10.)))
+
+    cache = Cache(cache_dir)
+    first = cache.load(FakeTask("a"))
+    assert cache.load(FakeTask("a")) is first
+
+    # a result saved again by another process replaces the old one
+    writer.save(FakeTask("a", np.arange(5.)))
+    cache.refresh()
+    assert np.array_equal(cache.load(FakeTask("a")), np.arange(5.))
+
+def test_saved_results_are_kept(cache_dir):
+
+    cache = Cache(cache_dir)
+    task = FakeTask("a", np.arange(10.))
+    cache.save(task)
+    assert cache.load(FakeTask("a")) is task.result
+
+    cache.removeEntry(task.hashcode)
+    assert task.hashcode not in cache.memory
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+
+from blk.Cache import Cache
+from blk.Cache.Pack import PACK_DIRECTORY
+
+from conftest import FakeTask
+
+def packFiles(cache_dir):
+    pack_root = os.path.join(cache_dir, PACK_DIRECTORY)
+    return sorted(fname for fname in os.listdir(pack_root) if not fname.startswith('.'))
+
+def packBytes(cache_dir):
+    pack_root = os.path.join(cache_dir, PACK_DIRECTORY)
+    return sum(os.path.getsize(os.path.join(pack_root, fname)) for fname in packFiles(cache_dir))
+
+def packed(name, result, **kwargs):
+    return FakeTask(name, result, pack="segment", **kwargs)
+
+def test_results_share_one_pack(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    tasks = [packed(f"t{i}", np.arange(i + 1.)) for i in range(10)]
+    for task in tasks:
+        cache.save(task)
+
+    assert len(packFiles(cache_dir)) == 1
+    assert not any(os.path.exists(cache.entryPath(task.hashcode)) for task in tasks)
+
+    reopened = Cache(cache_dir, memory_bytes=0)
+    for task in tasks:
+        assert np.array_equal(reopened.load(packed(task.name, None)), task.result)
+        assert np.array_equal(reopened.loadRegion(packed(task.name, None), np.s_[-1:]), task.result[-1:])
+
+def test_eviction_shrinks_packs(cache_dir):
+
+    max_bytes = 100000
+    cache = Cache(cache_dir, memory_bytes=0, max_bytes=max_bytes)
+
+    # each result is about a tenth of the limit
+    for i in range(100):
+        cache.save(packed(f"t{i}", np.full(1200, float(i)), compute_time=float(i)))
+        assert packBytes(cache_dir) <= max_bytes
+    assert len(packFiles(cache_dir)) == 1
+
+    # the most expensive results are the ones left
+    reopened = Cache(cache_dir, memory_bytes=0)
+    assert packed("t99", None).hashcode in reopened.virtual_cache
+    for hashcode in reopened.virtual_cache:
+        name = next(f"t{i}" for i in range(100) if packed(f"t{i}", None).hashcode == hashcode)
+        assert np.array_equal(reopened.load(packed(name, None)), np.full(1200, float(name[1:])))
+
+def test_repacked_entries_are_found_by_other_processes(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    tasks = [packed(f"t{i}", np.full(100, float(i))) for i in range(6)]
+    for task in tasks:
+        cache.save(task)
+
+    # knows where every entry was before the repack
+    other = Cache(cache_dir, memory_bytes=0)
+
+    old_packs = packFiles(cache_dir)
+    for task in tasks[:3]:
+        cache.removeEntry(task.hashcode)
+    assert cache.repack() > 0
+    assert packFiles(cache_dir) != old_packs and len(packFiles(cache_dir)) == 1
+
+    for task in tasks[3:]:
+        assert np.array_equal(other.load(packed(task.name, None)), task.result)
+
+    # and new results go into the new pack
+    other.save(packed("new", np.ones(10)))
+    assert len(packFiles(cache_dir)) == 1
+    assert np.array_equal(cache.load(packed("new", None)), np.ones(10))
+
+def test_empty_packs_are_removed(cache_dir):
+
+    cache = Cache(cache_dir, memory_bytes=0)
+    task = packed("a", np.arange(10.))
+    cache.save(task)
+    cache.removeEntry(task.hashcode)
+
+    cache.collectGarbage(set())
+    assert packFiles(cache_dir) == []
@@ -0,0 +1,159 @@
+import os, re, sys, shutil, subprocess
+
+import pytest
+
+from blk import Pipeline
+from blk.Pipeline import ProcessParallelRun
+from blk.Pipeline.TaskGraph import TaskGraph
+
+# Runs whole pipelines in their own processes, the way they'd be run for
+# real, through the example operations in blk/tests.py
+
+RUN_SCRIPT = """
+import sys
+from blk import Pipeline, SegmentParallelPipeline, TaskParallelPipeline, ProcessParallelPipeline
+
+if __name__ == "__main__":
+    pipeline = {
+        "segment" : SegmentParallelPipeline,
+        "task" : TaskParallelPipeline,
+        "process" : ProcessParallelPipeline
+    }.get(sys.argv[2], Pipeline)
+    pipeline(sys.argv[1]).run()
+"""
+
+# segments 2 and 3 are run by groups of ranks, with one-to-one dependencies
+# that would otherwise have them fused into chains, as are segments 4 and 5
+CONFIG = """
+[blk]
+cache_dir = {cache_dir}
+operations_module = {operations_module}
+num_workers = 2
+
+[segment 1]
+operation = segment1
+num_tasks = 4
+format = task_number
+task_number = {{:d}}
+segment = 1
+
+[segment 2]
+operation = segment2
+ranks_per_task = 2
+dependency_strategy = one-to-one
+format = task_number
+task_number = {{:d}}
+segment = 2
+
+[segment 3]
+operation = segment3
+ranks_per_task = 2
+dependency_strategy = one-to-one
+format = task_number
+task_number = {{:d}}
+segment = 3
+
+[segment 4]
+operation = segment4
+dependency_strategy = all-to-all
+num_tasks = 4
+format = task_number
+task_number = {{:d}}
+segment = 4
+
+[segment 5]
+operation = segment5
+dependency_strategy = one-to-one
+format = task_number
+task_number = {{:d}}
+segment = 5
+"""
+
+NUM_TASKS = 4 * 5
+
+FAILING_OPERATIONS = """
+def segment1(*args, **kwargs):
+    return kwargs
+
+def segment2(*args, **kwargs):
+    raise RuntimeError("boom")
+
+segment3 = segment4 = segment5 = segment1
+"""
+
+MPIRUN = shutil.which("mpirun")
+
+def writeConfig(tmp_path, operations_module="blk.tests"):
+    config_file = tmp_path / "test.pipe"
+    config_file.write_text(CONFIG.format(cache_dir=tmp_path / "cache", operations_module=operations_module))
+    return config_file
+
+def runPipeline(tmp_path, package_parent, parallel, num_ranks=None, operations_module="blk.tests"):
+
+    config_file = writeConfig(tmp_path, operations_module)
+    script = tmp_path / "run.py"
+    script.write_text(RUN_SCRIPT)
+
+    command = [sys.executable, str(script), str(config_file), parallel]
+    if num_ranks is not None:
+        command = [MPIRUN, "--allow-run-as-root", "--oversubscribe", "-n", str(num_ranks)] + command
+
+    env = dict(os.environ, 
+        PYTHONPATH=os.pathsep.join([package_parent, str(tmp_path)]),
+        PYTHONUNBUFFERED="1")
+    return subprocess.run(command, cwd=tmp_path, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=300)
+
+# the output of several processes can end up on the same line
+def countRuns(output):
+    return len(set(re.findall(r"Running: (segment\d+\[\d+\])", output)))
+
+def checkRuns(tmp_path, package_parent, parallel, num_ranks=None):
+
+    first = runPipeline(tmp_path, package_parent, parallel, num_ranks)
+    assert first.returncode == 0, first.stdout
+    assert "[Error]" not in first.stdout
+    assert "getResult returned None" not in first.stdout
+    assert countRuns(first.stdout) == NUM_TASKS
+
+    # everything is in the cache the second time around
+    second = runPipeline(tmp_path, package_parent, parallel, num_ranks)
+    assert second.returncode == 0, second.stdout
+    assert countRuns(second.stdout) == 0
+
+def checkFailure(tmp_path, package_parent, parallel, num_ranks=None):
+
+    (tmp_path / "failing_operations.py").write_text(FAILING_OPERATIONS)
+    result = runPipeline(tmp_path, package_parent, parallel, num_ranks, "failing_operations")
+    assert result.returncode != 0, result.stdout
+    assert "[Error]" in result.stdout
+
+needs_mpirun = pytest.mark.skipif(MPIRUN is None, reason="mpirun not found")
+
+@needs_mpirun
+def test_task_parallel_groups(tmp_path, package_parent):
+    checkRuns(tmp_path, package_parent, "task", num_ranks=3)
+
+@needs_mpirun
+def test_task_parallel_failures_fail_the_run(tmp_path, package_parent):
+    checkFailure(tmp_path, package_parent, "task", num_ranks=3)
+
+def test_process_parallel(tmp_path, package_parent):
+    checkRuns(tmp_path, package_parent, "process")
+
+def test_process_parallel_failures_fail_the_run(tmp_path, package_parent):
+    checkFailure(tmp_path, package_parent, "process")
+
+def test_process_workers_protect_the_workload(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+    config_file = str(writeConfig(tmp_path))
+    graph = TaskGraph(Pipeline(config_file))
+    workload = graph.getWorkload()
+
+    ProcessParallelRun.startWorker(config_file, workload)
+    worker_graph = ProcessParallelRun.worker_graph
+    assert worker_graph.tasks[0].cache.protected == {
+        dep.hashcode for i in workload if graph.tasks[i].dependencies is not None
+        for dep in graph.tasks[i].dependencies}
+    assert len(worker_graph.tasks[0].cache.protected) > 0
@@ -0,0 +1,162 @@
+import io, tempfile, tracemalloc
+
+import numpy as np
+import pytest
+
+from blk import Pipeline
+from blk.Cache.Serializers import writeEntry, readEntry, readRegion, readHeader, ALIGNMENT
+from blk.constants import COMPRESSION_OPTIONS
+
+SERIALIZERS = ["auto", "pickle5", "numpy", "pickle0"]
+REGIONS = [np.s_[1:5], np.s_[..., 1], np.s_[2], np.s_[::3], np.s_[-1, 2:]]
+
+# uncompressed arrays are memory mapped, so they need a real file
+def roundTrip(obj, **kwargs):
+    with tempfile.TemporaryFile() as f:
+        writeEntry(f, obj, **kwargs)
+        f.seek(0)
+        result = readEntry(f)
+        return np.array(result) if isinstance(result, np.memmap) else result
+
+@pytest.mark.parametrize("serializer", SERIALIZERS)
+def test_array_round_trip(serializer):
+
+    arr = np.random.default_rng(0).random((33, 17))
+    result = roundTrip(arr, serializer=serializer)
+    assert np.array_equal(result, arr)
+
+# numpy only takes arrays, auto picks it for them
+@pytest.mark.parametrize("serializer", ["auto", "pickle5", "pickle0"])
+def test_objects_round_trip(serializer):
+
+    obj = {"a" : [1, 2.5, "x"], "b" : np.arange(10), "c" : None}
+    result = roundTrip(obj, serializer=serializer)
+    assert result["a"] == obj["a"] and result["c"] is None
+    assert np.array_equal(result["b"], obj["b"])
+
+def test_dict_of_arrays_round_trip():
+
+    obj = {"x" : np.arange(5.), "y" : np.ones((3, 4), dtype=np.int32, order='F')}
+    result = roundTrip(obj)
+    for key in obj:
+        assert np.array_equal(result[key], obj[key])
+
+def test_payload_is_aligned():
+
+    f = io.BytesIO()
+    writeEntry(f, np.arange(10.))
+    f.seek(0)
+    readHeader(f)
+    assert f.tell() % ALIGNMENT == 0
+
+@pytest.mark.parametrize("serializer", ["auto", "pickle5", "numpy"])
+@pytest.mark.parametrize("compression", COMPRESSION_OPTIONS)
+def test_compressed_array_round_trip(serializer, compression):
+
+    arr = np.random.default_rng(0).random((33, 17))
+    result = roundTrip(arr, serializer=serializer, compression=compression)
+    assert np.array_equal(result, arr)
+
+@pytest.mark.parametrize("compression", COMPRESSION_OPTIONS)
+def test_compressed_objects_round_trip(compression):
+
+    obj = {"a" : [1, 2.5, "x"] * 100, "b" : np.arange(10)}
+    result = roundTrip(obj, compression=compression)
+    assert result["a"] == obj["a"]
+    assert np.array_equal(result["b"], obj["b"])
+
+def test_compression_is_applied():
+
+    arr = np.zeros(100000)
+    with tempfile.TemporaryFile() as f:
+        writeEntry(f, arr, compression="zlib")
+        assert f.tell() < arr.nbytes // 10
+
+LEGACY_CONFIG = """
+[blk]
+cache_dir = {cache_dir}
+cache_serializer = pickle0
+operations_module = blk.tests
+
+[segment 1]
+operation = segment1
+compression = zlib
+"""
+
+def test_legacy_pickles_cannot_be_compressed(tmp_path):
+
+    with pytest.raises(ValueError):
+        roundTrip([1, 2], serializer="pickle0", compression="zlib")
+
+    # which is caught before anything is run
+    config_file = tmp_path / "test.pipe"
+    config_file.write_text(LEGACY_CONFIG.format(cache_dir=tmp_path / "cache"))
+    with pytest.raises(ValueError):
+        Pipeline(str(config_file))
+
+@pytest.mark.parametrize("compression", COMPRESSION_OPTIONS)
+@pytest.mark.parametrize("shape, chunk_shape", [
+    ((37, 41, 5), [8, 16]),
+    ((100,), 7),
+    ((6, 6), [6, 6]),
+])
+def test_chunked_round_trip(compression, shape, chunk_shape):
+
+    arr = np.random.default_rng(1).random(shape)
+
+    # followed by something else, the way entries in a pack are
+    with tempfile.TemporaryFile() as f:
+        f.write(b"before")
+        start = f.tell()
+        writeEntry(f, arr, compression=compression, chunk_shape=chunk_shape)
+        end = f.tell()
+        f.write(b"after" * 100)
+
+        f.seek(start)
+        assert np.array_equal(readEntry(f), arr)
+
+        for region in REGIONS:
+            if len(np.index_exp[region]) > arr.ndim: continue
+            f.seek(start)
+            assert np.array_equal(readRegion(f, region, end=end), arr[region])
+
+@pytest.mark.parametrize("compression", COMPRESSION_OPTIONS)
+def test_chunked_region_to_end_of_file(compression):
+
+    arr = np.arange(200.).reshape(20, 10)
+    with tempfile.TemporaryFile() as f:
+        writeEntry(f, arr, compression=compression, chunk_shape=[3, 3])
+        f.seek(0)
+        assert np.array_equal(readRegion(f, np.s_[4:9, 2]), arr[4:9, 2])
+
+@pytest.mark.parametrize("region", [np.s_[20], np.s_[-21], np.s_[0, 10], np.s_[0, 0, 0]])
+def test_chunked_region_out_of_bounds(region):
+
+    arr = np.arange(200.).reshape(20, 10)
+    with tempfile.TemporaryFile() as f:
+        writeEntry(f, arr, chunk_shape=[3, 3])
+
+        # the same as indexing the array itself
+        with pytest.raises(IndexError):
+            arr[region]
+        f.seek(0)
+        with pytest.raises(IndexError):
+            readRegion(f, region)
+
+def test_compressed_chunks_are_streamed():
+
+    # random data doesn't compress, so holding on to every compressed chunk
+    # would take as much memory as the array itself
+    arr = np.random.default_rng(2).random((2048, 512))
+    with tempfile.TemporaryFile() as f:
+        tracemalloc.start()
+        try:
+            writeEntry(f, arr, compression="zlib", chunk_shape=[16, 512])
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        f.seek(0)
+        assert np.array_equal(readEntry(f), arr)
+
+    assert peak < arr.nbytes // 4
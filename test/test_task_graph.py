@@ -0,0 +1,129 @@
+import sys, types
+
+from blk import Pipeline
+from blk.constants import AUTO
+from blk.Pipeline.TaskGraph import TaskGraph, runUnit, reportFailures
+
+CONFIG = """
+[blk]
+cache_dir = {cache_dir}
+operations_module = blk.tests
+
+[segment 1]
+operation = segment1
+num_tasks = 3
+format = task_number
+task_number = {{:d}}
+ranks_per_task = {ranks_per_task}
+segment = 1
+
+[segment 2]
+operation = segment2
+dependency_strategy = one-to-one
+ranks_per_task = {ranks_per_task}
+format = task_number
+task_number = {{:d}}
+segment = 2
+"""
+
+def planGraph(tmp_path, ranks_per_task=1, fuse=True):
+
+    config_file = tmp_path / "test.pipe"
+    config_file.write_text(CONFIG.format(cache_dir=tmp_path / "cache", ranks_per_task=ranks_per_task))
+
+    graph = TaskGraph(Pipeline(str(config_file)))
+    graph.plan(graph.getWorkload(), fuse=fuse)
+    return graph
+
+def ids(graph, segment):
+    return [i for i, task in enumerate(graph.tasks) if str(task).startswith(f"segment{segment}[")]
+
+def test_one_to_one_chains_are_fused(tmp_path):
+
+    graph = planGraph(tmp_path)
+    firsts, seconds = ids(graph, 1), ids(graph, 2)
+
+    assert graph.fused == dict(zip(firsts, seconds))
+    assert sorted(graph.ready) == [(-3, i) for i in firsts]
+    assert [graph.unit(i) for i in firsts] == [[i, j] for i, j in zip(firsts, seconds)]
+
+    # the root task waits on every chain
+    assert sorted(graph.pop() for _ in firsts) == firsts
+    assert not graph.hasReady()
+    assert graph.complete(firsts[0]) == graph.complete(firsts[1]) == []
+    assert graph.complete(firsts[2]) == [graph.root]
+    assert graph.pop() == graph.root
+    assert graph.unit(graph.root) == [graph.root]
+
+def test_groups_are_not_fused(tmp_path):
+
+    graph = planGraph(tmp_path, ranks_per_task=2)
+    assert graph.fused == {}
+    assert all(graph.unit(i) == [i] for i in ids(graph, 1))
+
+    # so the second segment goes through the ready queue
+    first = ids(graph, 1)[0]
+    graph.take(first)
+    assert graph.complete(first) == [ids(graph, 2)[0]]
+
+def test_nothing_is_fused_unless_asked(tmp_path):
+    assert planGraph(tmp_path, fuse=False).fused == {}
+
+
+class Step:
+
+    save_action = AUTO
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.result = None
+        self.ran = False
+
+    def run(self):
+        if self.fail:
+            raise RuntimeError("boom")
+        self.ran = True
+        self.result = 1
+
+def test_run_unit_drops_intermediate_results():
+
+    steps = [Step(), Step(), Step()]
+    assert runUnit(steps, "test")
+    assert all(step.ran for step in steps)
+    assert [step.result for step in steps] == [None, None, 1]
+    assert all(step.comm is None for step in steps)
+
+def test_run_unit_stops_at_a_failure(capsys):
+
+    steps = [Step(), Step(fail=True), Step()]
+    assert not runUnit(steps, "test")
+    assert not steps[2].ran
+    assert "[Error] [test]" in capsys.readouterr().out
+
+def test_failures_name_the_whole_chain(tmp_path, capsys):
+
+    graph = planGraph(tmp_path)
+    first = ids(graph, 1)[0]
+    capsys.readouterr()
+    reportFailures(graph, [first])
+
+    out = capsys.readouterr().out
+    assert out.startswith("[Error]")
+    assert all(str(graph.tasks[i]) in out for i in graph.unit(first))
+
+class GroupComm:
+    def Get_rank(self):
+        return 0
+
+def test_groups_run_without_a_yt_communicator(monkeypatch):
+
+    # a yt that says it's parallel but hasn't set up a communicator
+    interface = "yt.utilities.parallel_tools.parallel_analysis_interface"
+    for name in ["yt", "yt.utilities", "yt.utilities.parallel_tools", interface]:
+        monkeypatch.setitem(sys.modules, name, types.ModuleType(name))
+    sys.modules["yt"].enable_parallelism = lambda **kwargs: True
+    sys.modules[interface].communication_system = types.SimpleNamespace(communicators=[])
+
+    steps = [Step()]
+    assert runUnit(steps, "test", GroupComm())
+    assert steps[0].ran
@@ -6,6 +6,22 @@ def do_nothing(*args, **kwargs):
 def format_time(seconds):
     return str(datetime.timedelta(seconds=seconds))
 
+BYTE_UNITS = {
+    "K" : 1024,
+    "M" : 1024**2,
+    "G" : 1024**3,
+    "T" : 1024**4,
+}
+
+# converts a size like 500M or 2.5G into a number of bytes
+def parse_bytes(value):
+
+    value = str(value).strip().upper().rstrip("B")
+
+    if value[-1:] in BYTE_UNITS:
+        return int(float(value[:-1]) * BYTE_UNITS[value[-1]])
+    return int(float(value))
+
 def movie(movie_filename, plot_file_format):
     print("Running conversion to mp4 format...")
     cmd = f"sbatch --export=FILE_FORMAT={plot_file_format},MOVIE_NAME={movie_filename} ~/run_ffmpeg.sb"